@@ -0,0 +1,196 @@
+import gzip
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+import brotli
+
+ARTIFACTS_DIR = Path("data_files") / "artifacts"
+ARTIFACT_QUOTA_BYTES = 5 * 1024 * 1024 * 1024
+ARTIFACT_TTL = 7 * 24 * 60 * 60
+ARTIFACT_SWEEP_INTERVAL = 10 * 60
+HASH_CHUNK_SIZE = 1024 * 1024
+COMPRESSIBLE_SUFFIXES = ('.csv', '.xml', '.yml', '.json', '.txt')
+COMPRESS_MIN_SIZE = 1024
+ARTIFACT_ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    name TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_digest ON artifacts (digest);
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed_at);
+"""
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Conversion results published under unique names and stored once per content.
+
+    Converters write into a private directory from ``scratch_dir``;
+    ``publish`` moves the result to ``blobs/`` under its SHA-256 and registers
+    a fresh name for it (``feed_1a2b3c4d5e6f.csv``) in a SQLite index, so
+    same-named uploads converted at the same time never overwrite each other
+    and identical outputs share one blob. Text blobs also get brotli and gzip
+    copies from ``compress`` for downloads. ``sweep`` forgets names not
+    downloaded for ``ttl`` seconds, then the least recently used contents
+    until the blobs fit in ``quota`` bytes, and deletes unreferenced blobs
+    and abandoned scratch directories. The most recently used content is
+    never evicted, so a result larger than ``quota`` can still be downloaded;
+    the store then stays over quota until a newer result replaces it.
+    """
+
+    def __init__(self, root=ARTIFACTS_DIR, quota=ARTIFACT_QUOTA_BYTES, ttl=ARTIFACT_TTL):
+        self.root = Path(root)
+        self.blobs_dir = self.root / 'blobs'
+        self.scratch_root = self.root / 'tmp'
+        self.path = self.root / 'index.sqlite3'
+        self.quota = quota
+        self.ttl = ttl
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def scratch_dir(self):
+        self.scratch_root.mkdir(parents=True, exist_ok=True)
+        return tempfile.mkdtemp(dir=self.scratch_root)
+
+    def remove_scratch(self, scratch):
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    def blob_path(self, digest):
+        return self.blobs_dir / digest[:2] / digest
+
+    def publish(self, path, filename=None):
+        """Move the file at ``path`` into the store; returns its blob path and unique name."""
+        stem, ext = os.path.splitext(filename or os.path.basename(path))
+        name = f"{stem}_{uuid.uuid4().hex[:12]}{ext}"
+        digest = file_digest(path)
+        size = os.path.getsize(path)
+        blob = self.blob_path(digest)
+        now = time.time()
+        with self.lock:
+            if blob.is_file():
+                os.unlink(path)
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(path, blob)
+            self.connect().execute(
+                'INSERT INTO artifacts (name, digest, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (name, digest, size, now, now))
+        return blob, name
+
+    def compress(self, blob, filename):
+        """Write the ``.br`` and ``.gz`` copies of a text blob unless they exist or would not be smaller."""
+        blob = Path(blob)
+        if not filename.lower().endswith(COMPRESSIBLE_SUFFIXES) or blob.stat().st_size < COMPRESS_MIN_SIZE:
+            return
+        for encoding, suffix in ARTIFACT_ENCODINGS.items():
+            target = blob.with_name(blob.name + suffix)
+            if target.exists():
+                continue
+            fd, tmp_path = tempfile.mkstemp(dir=blob.parent, suffix='.tmp')
+            try:
+                with open(blob, 'rb') as source, open(fd, 'wb') as f:
+                    if encoding == 'gzip':
+                        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) as out:
+                            shutil.copyfileobj(source, out, HASH_CHUNK_SIZE)
+                    else:
+                        compressor = brotli.Compressor(quality=5)
+                        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                            f.write(compressor.process(chunk))
+                        f.write(compressor.finish())
+                if os.path.getsize(tmp_path) < blob.stat().st_size:
+                    os.replace(tmp_path, target)
+                else:
+                    os.unlink(tmp_path)
+            except BaseException:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+
+    def encoded_path(self, blob, encoding):
+        """The stored ``encoding`` copy of ``blob``, or ``None`` if there is none."""
+        blob = Path(blob)
+        if blob.parent.parent != self.blobs_dir:
+            return None
+        path = blob.with_name(blob.name + ARTIFACT_ENCODINGS[encoding])
+        return path if path.is_file() else None
+
+    def resolve(self, name):
+        """Blob path of the artifact called ``name``, or ``None``; counts as an access."""
+        with self.lock:
+            row = self.connect().execute('SELECT digest FROM artifacts WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return None
+            self.connect().execute('UPDATE artifacts SET accessed_at = ? WHERE name = ?', (time.time(), name))
+        blob = self.blob_path(row['digest'])
+        return blob if blob.is_file() else None
+
+    def sweep(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            connection = self.connect()
+            expired = connection.execute('DELETE FROM artifacts WHERE accessed_at < ?', (now - self.ttl,)).rowcount
+            contents = connection.execute(
+                'SELECT digest, MAX(size) AS size FROM artifacts GROUP BY digest ORDER BY MAX(accessed_at)').fetchall()
+            total = sum(row['size'] for row in contents)
+            evicted = 0
+            for row in contents[:-1]:
+                if total <= self.quota:
+                    break
+                evicted += connection.execute('DELETE FROM artifacts WHERE digest = ?', (row['digest'],)).rowcount
+                total -= row['size']
+            referenced = {row['digest'] for row in connection.execute('SELECT DISTINCT digest FROM artifacts')}
+            removed_blobs = 0
+            for blob in self.blobs_dir.glob('*/*'):
+                if blob.suffix == '.tmp':
+                    if blob.stat().st_mtime < now - self.ttl:
+                        blob.unlink(missing_ok=True)
+                elif blob.name.split('.')[0] not in referenced:
+                    blob.unlink(missing_ok=True)
+                    removed_blobs += 1
+        for scratch in self.scratch_root.glob('*'):
+            try:
+                if scratch.stat().st_mtime < now - self.ttl:
+                    self.remove_scratch(scratch)
+            except OSError:
+                pass
+        return {'expired': expired, 'evicted': evicted, 'removed_blobs': removed_blobs}
+
+    def stats(self):
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT COUNT(*) AS names, COUNT(DISTINCT digest) AS blobs FROM artifacts').fetchone()
+            size = self.connect().execute(
+                'SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM artifacts GROUP BY digest)').fetchone()[0]
+        return {'artifacts': row['names'], 'blobs': row['blobs'], 'bytes': size, 'quota': self.quota}
@@ -0,0 +1,262 @@
+"""Benchmark the single-pass offer extractor against the previous multi-walk one.
+
+Usage: python benchmarks/bench_offer_extraction.py [offers]
+"""
+from pathlib import Path
+import random
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from offer_utils import (clean_description, process_offer_element, remove_duplicates_from_delimited_string,
+                         sanitize_name)
+
+
+def legacy_process_offer_element(offer_elem, build_category_path, format_type):
+    offer_data = {}
+
+    for key, value in offer_elem.attrib.items():
+        offer_data[f"attr_{key}"] = value
+
+    image_tags = {'picture', 'photo', 'optionalImages', 'image', 'images', 'img'}
+
+    for child in offer_elem:
+        if child.tag in image_tags:
+            continue
+
+        for key, value in child.attrib.items():
+            column_name = f"{child.tag}_{key}"
+            if column_name in offer_data:
+                offer_data[column_name] += f"///{value}"
+            else:
+                offer_data[column_name] = value
+
+        if child.text and child.text.strip():
+            if child.tag in offer_data:
+                existing_value = offer_data[child.tag] + f"///{child.text.strip()}"
+                offer_data[child.tag] = remove_duplicates_from_delimited_string(existing_value)
+            else:
+                offer_data[child.tag] = child.text.strip()
+
+        if child.tag == 'stock':
+            for stock_child in child:
+                stock_key = stock_child.tag
+                if stock_child.text and stock_child.text.strip():
+                    offer_data[stock_key] = stock_child.text.strip()
+                for attr_key, attr_value in stock_child.attrib.items():
+                    offer_data[f"{stock_key}_{attr_key}"] = attr_value
+
+    processed_elements = {offer_elem}
+
+    for child in offer_elem:
+        processed_elements.add(child)
+
+    for elem in offer_elem.iter():
+        if elem in processed_elements:
+            continue
+
+        if elem.tag in image_tags:
+            continue
+
+        for key, value in elem.attrib.items():
+            column_name = f"{elem.tag}_{key}"
+            if column_name not in offer_data:
+                offer_data[column_name] = value
+
+        if elem.text and elem.text.strip():
+            if elem.tag not in offer_data:
+                offer_data[elem.tag] = elem.text.strip()
+
+    if format_type == 'offer':
+        cid_elem = offer_elem.find('./categoryId')
+        if cid_elem is not None and cid_elem.text:
+            cid = cid_elem.text.strip()
+        else:
+            cid_elem = offer_elem.find('.//categoryId')
+            cid = cid_elem.text.strip() if cid_elem is not None and cid_elem.text else 'Undefined'
+
+        category_path = build_category_path(cid)
+        offer_data['category_path'] = category_path
+
+        offer_data['categoryId'] = cid
+    else:
+        offer_data['category_path'] = 'Undefined'
+        offer_data['categoryId'] = 'Undefined'
+    excluded = ['param'] if format_type == 'offer' else ['photos', 'fabric', 'features', 'options']
+    image_tags = {'picture', 'photo', 'optionalImages', 'image', 'images', 'img'}
+
+    for child in offer_elem:
+        if child.tag not in excluded and child.tag not in image_tags:
+            val = child.text or ''
+            if child.tag.replace('.', '', 1).isdigit():
+                val = val.replace('.', ',')
+            if child.tag == 'name':
+                val = sanitize_name(val)
+            if child.tag == 'Size' and '?' in val:
+                val = val.replace('?', '').strip()
+
+            if child.tag not in offer_data or not offer_data[child.tag] or offer_data[child.tag] == 'Undefined':
+                offer_data[child.tag] = val
+    all_images = set()
+    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg']
+
+    for selector in ['.//photo', './/picture', './/image', './/img', './/optionalImages', './/images']:
+        for img_elem in offer_elem.findall(selector):
+            if img_elem.text and img_elem.text.strip():
+                image_url = img_elem.text.strip()
+                if (any(image_url.lower().endswith(ext) for ext in image_extensions)
+                    or 'img/' in image_url.lower()
+                    or image_url.startswith('http')):
+                    all_images.add(image_url)
+
+    if format_type == 'product':
+        for offer_child in offer_elem.findall('.//offer'):
+            for selector in ['.//photo', './/picture', './/image', './/img', './/optionalImages']:
+                for img_elem in offer_child.findall(selector):
+                    if img_elem.text and img_elem.text.strip():
+                        image_url = img_elem.text.strip()
+                        if (any(image_url.lower().endswith(ext) for ext in image_extensions)
+                            or 'img/' in image_url.lower()
+                            or image_url.startswith('http')):
+                            all_images.add(image_url)
+
+    for elem in offer_elem.iter():
+        for attr_name, attr_value in elem.attrib.items():
+            if ('image' in attr_name.lower() or 'photo' in attr_name.lower()) and attr_value:
+                if (any(attr_value.lower().endswith(ext) for ext in image_extensions)
+                    or attr_value.startswith('http')):
+                    all_images.add(attr_value)
+
+    all_images = sorted(list(all_images))
+
+    if all_images:
+        offer_data['pictures'] = "///".join(all_images)
+    else:
+        offer_data['pictures'] = ""
+    params = {}
+    if format_type == 'offer':
+        for param_elem in offer_elem.findall('.//param'):
+            key = param_elem.get('name')
+            if not key:
+                continue
+            val = param_elem.text or ''
+            if ('размер' in key.lower() or 'size' in key.lower()) or (
+                    '?' in val and
+                (val.replace('?', '').strip().isdigit() or any(c.isdigit()
+                                                               for c in val))):
+                val = val.replace('?', '').strip()
+
+            clean_key = key.strip()
+
+            if clean_key.replace('.', '', 1).isdigit():
+                continue
+
+            if clean_key in params:
+                params[clean_key] += f", {val}"
+            else:
+                params[clean_key] = val
+
+        for elem in offer_elem.iter():
+            if elem.tag.startswith('param_name_'):
+                key = elem.tag
+                val = elem.text or ''
+
+                if ('размер' in key.lower() or 'size' in key.lower()) or (
+                        '?' in val and
+                    (val.replace('?', '').strip().isdigit() or any(c.isdigit()
+                                                                   for c in val))):
+                    val = val.replace('?', '').strip()
+
+                if key in offer_data:
+                    offer_data[key] += f", {val}"
+                else:
+                    offer_data[key] = val
+    else:
+        fab = offer_elem.find('.//fabric')
+        if fab is not None:
+            for elem in fab.findall('.//feature'):
+                name = elem.get('name')
+                if not name:
+                    continue
+                key = f"fabric_{name}"
+                val = elem.text or ''
+                if key in params:
+                    params[key] += f", {val}"
+                else:
+                    params[key] = val
+        feats = offer_elem.find('.//features')
+        if feats is not None:
+            for elem in feats.findall('.//feature'):
+                name = elem.get('name')
+                if not name:
+                    continue
+                key = f"feature_{name}"
+                val = elem.text or ''
+                if key in params:
+                    params[key] += f", {val}"
+                else:
+                    params[key] = val
+    offer_data.update(params)
+    desc_elem = offer_elem.find('.//description') if format_type == 'offer' else offer_elem.find('.//name')
+    if desc_elem is not None and desc_elem.text:
+        offer_data['description'] = clean_description(desc_elem.text)
+    else:
+        alt_desc_tags = ['.//desc', './/descr', './/description_full', './/full_description']
+        for tag in alt_desc_tags:
+            desc_elem = offer_elem.find(tag)
+            if desc_elem is not None and desc_elem.text:
+                offer_data['description'] = clean_description(desc_elem.text)
+                break
+        else:
+            offer_data['description'] = ""
+
+    if 'available' not in offer_data:
+        offer_data['available'] = '1'
+
+    return offer_data
+
+
+def build_sample_feed(count, seed=0):
+    rnd = random.Random(seed)
+    parts = ['<yml_catalog><shop><offers>']
+    for i in range(count):
+        parts.append(f'<offer id="{i}" available="true" group_id="{i % 7}">')
+        parts.append(f'<name>Товар {i} (x)</name><price>{rnd.randint(1, 999)}</price>')
+        parts.append(f'<currencyId>RUR</currencyId><categoryId>{rnd.randint(1, 40)}</categoryId>')
+        for k in range(rnd.randint(1, 5)):
+            parts.append(f'<picture>https://example.com/img/{i}_{k}.jpg</picture>')
+        parts.append(f'<vendor>Vendor {rnd.randint(1, 5)}</vendor><vendorCode>VC{i}</vendorCode>')
+        parts.append(rnd.choice(['<description>plain text</description>',
+                                 '<description><![CDATA[<p>Some <b>bold</b> text</p>]]></description>']))
+        for k in range(rnd.randint(2, 12)):
+            name = rnd.choice(['Цвет', 'Размер', 'Материал', 'Вес', 'size'])
+            parts.append(f'<param name="{name}" unit="u">{rnd.choice(["red", "42?", "S", "1"])}</param>')
+        if rnd.random() < 0.3:
+            parts.append('<delivery-options><option cost="100" days="1"/></delivery-options>')
+        parts.append('</offer>')
+    parts.append('</offers></shop></yml_catalog>')
+    return ''.join(parts)
+
+
+def category_path(cid):
+    return 'Undefined' if not cid else f'Category {cid}'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    offers = ET.fromstring(build_sample_feed(count)).findall('.//offer')
+
+    for offer in offers:
+        expected = legacy_process_offer_element(offer, category_path, 'offer')
+        if process_offer_element(offer, category_path, 'offer') != expected:
+            raise SystemExit(f"Output mismatch for offer {offer.get('id')}")
+
+    for name, func in (('legacy', legacy_process_offer_element), ('single-pass', process_offer_element)):
+        seconds = min(timeit.repeat(lambda: [func(o, category_path, 'offer') for o in offers], number=1, repeat=5))
+        print(f"{name:>12}: {seconds * 1e6 / count:8.1f} us/offer")
+
+
+if __name__ == '__main__':
+    main()
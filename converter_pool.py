@@ -0,0 +1,118 @@
+import asyncio
+import contextvars
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import threading
+import time
+
+CPU_COUNT = os.cpu_count() or 1
+CONVERTER_POOLS = {
+    'feed': ('thread', min(32, CPU_COUNT + 4)),
+    'table': ('thread', max(2, min(8, CPU_COUNT))),
+    'pdf': ('process', max(1, min(4, CPU_COUNT))),
+    'image': ('process', max(1, min(2, CPU_COUNT))),
+}
+
+
+def call_converter(converter, args, kwargs):
+    started = time.time()
+    return started, asyncio.run(converter(*args, **kwargs))
+
+
+class ConverterStats:
+    __slots__ = ('in_flight', 'completed', 'failed', 'queue_time', 'queue_time_max', 'run_time', 'run_time_max')
+
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.queue_time = 0.0
+        self.queue_time_max = 0.0
+        self.run_time = 0.0
+        self.run_time_max = 0.0
+
+
+class ConverterPool:
+    """Runs ``async def`` converters to completion outside the event loop.
+
+    Each converter kind has its own executor from ``pools``: threads for
+    converters that read open upload files or spend their time in code that
+    releases the GIL, processes for pure-Python PDF and image work. The number
+    of workers is the concurrency limit for that kind; further calls wait in
+    the executor's queue, and that wait is reported as queue time by ``stats``.
+    Thread workers see the caller's context variables, like ``asyncio.to_thread``.
+    A process pool broken by a crashed worker is replaced on the next call.
+    """
+
+    def __init__(self, pools=CONVERTER_POOLS):
+        self.pools = pools
+        self.executors = {}
+        self.counters = {kind: ConverterStats() for kind in pools}
+        self.lock = threading.Lock()
+
+    def executor(self, kind):
+        with self.lock:
+            executor = self.executors.get(kind)
+            if executor is None:
+                executor_type, workers = self.pools[kind]
+                if executor_type == 'process':
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'convert-{kind}')
+                self.executors[kind] = executor
+            return executor
+
+    async def run(self, kind, converter, *args, **kwargs):
+        executor = self.executor(kind)
+        counters = self.counters[kind]
+        call = (call_converter, converter, args, kwargs)
+        if self.pools[kind][0] == 'thread':
+            call = (contextvars.copy_context().run, *call)
+        submitted = time.time()
+        with self.lock:
+            counters.in_flight += 1
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(executor, *call)
+        except BaseException as e:
+            with self.lock:
+                counters.in_flight -= 1
+                counters.failed += 1
+                if isinstance(e, BrokenExecutor) and self.executors.get(kind) is executor:
+                    del self.executors[kind]
+            raise
+        finished = time.time()
+        queue_time = max(0.0, started - submitted)
+        with self.lock:
+            counters.in_flight -= 1
+            counters.completed += 1
+            counters.queue_time += queue_time
+            counters.queue_time_max = max(counters.queue_time_max, queue_time)
+            counters.run_time += finished - started
+            counters.run_time_max = max(counters.run_time_max, finished - started)
+        return result
+
+    def stats(self):
+        stats = {}
+        with self.lock:
+            for kind, (executor_type, workers) in self.pools.items():
+                counters = self.counters[kind]
+                done = counters.completed or 1
+                stats[kind] = {
+                    'executor': executor_type,
+                    'workers': workers,
+                    'in_flight': counters.in_flight,
+                    'queued': max(0, counters.in_flight - workers),
+                    'completed': counters.completed,
+                    'failed': counters.failed,
+                    'queue_time_avg': round(counters.queue_time / done, 4),
+                    'queue_time_max': round(counters.queue_time_max, 4),
+                    'run_time_avg': round(counters.run_time / done, 4),
+                    'run_time_max': round(counters.run_time_max, 4),
+                }
+        return stats
+
+    def shutdown(self):
+        with self.lock:
+            executors, self.executors = self.executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
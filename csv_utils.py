@@ -0,0 +1,266 @@
+from array import array
+import csv
+import io
+import marshal
+import sys
+import tempfile
+
+STREAM_HEADER_ROWS = 1000
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ColumnStats:
+    """Schema entry for one CSV column with its fill statistics."""
+
+    __slots__ = ('name', 'index', 'filled', 'defined')
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+        self.filled = 0
+        self.defined = False
+
+    def update(self, value):
+        if value and value.strip():
+            self.filled += 1
+            if not self.defined and value != 'Undefined':
+                self.defined = True
+
+
+class Column(ColumnStats):
+    """Sparse, dictionary-encoded storage for one CSV column."""
+
+    __slots__ = ('rows', 'codes')
+
+    def __init__(self, name, index):
+        super().__init__(name, index)
+        self.rows = array('I')
+        self.codes = array('I')
+
+
+class OfferStore:
+    """Column-oriented store for extracted offer rows.
+
+    Column names are interned and every distinct value is kept once in a
+    shared dictionary, so repeated vendors, currencies and category paths
+    cost four bytes per cell instead of a string per row. Each column records
+    only the rows that have it, which keeps wide, sparse ``param`` columns
+    cheap, and tracks fill statistics as rows arrive.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.row_count = 0
+        self.values = []
+        self.value_codes = {}
+        self.value_filled = []
+        self.value_defined = []
+
+    def encode(self, value):
+        code = self.value_codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.value_codes[value] = code
+            self.values.append(value)
+            filled = bool(value and value.strip())
+            self.value_filled.append(filled)
+            self.value_defined.append(filled and value != 'Undefined')
+        return code
+
+    def add(self, row):
+        row_index = self.row_count
+        columns = self.columns
+        for name, value in row.items():
+            if name is None:
+                continue
+            column = columns.get(name)
+            if column is None:
+                column = columns[sys.intern(name)] = Column(name, len(columns))
+            code = self.encode(value)
+            column.rows.append(row_index)
+            column.codes.append(code)
+            if self.value_filled[code]:
+                column.filled += 1
+                if not column.defined and self.value_defined[code]:
+                    column.defined = True
+        self.row_count += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def fill_rate(self, name):
+        column = self.columns.get(name)
+        if column is None or not self.row_count:
+            return 0.0
+        return column.filled / self.row_count
+
+    def undefined_only_columns(self):
+        """Columns whose non-empty values are all ``'Undefined'`` (or that have none)."""
+        return {name for name, column in self.columns.items() if not column.defined}
+
+    def iter_rows(self, fields, missing=''):
+        """Yield each row as a list of values for ``fields``, in insertion order."""
+        values = self.values
+        cursors = []
+        for name in fields:
+            column = self.columns.get(name)
+            if column is None:
+                cursors.append(None)
+            else:
+                cursors.append([column.rows, column.codes, 0, len(column.rows)])
+
+        for row_index in range(self.row_count):
+            out = []
+            for cursor in cursors:
+                if cursor is not None and cursor[2] < cursor[3] and cursor[0][cursor[2]] == row_index:
+                    out.append(values[cursor[1][cursor[2]]])
+                    cursor[2] += 1
+                else:
+                    out.append(missing)
+            yield out
+
+
+class OfferSpool:
+    """Spill extracted rows to a temporary file while discovering the schema.
+
+    Only the column set and per-column fill statistics stay in memory; each
+    row is appended to the spool as a marshalled list of ``(column index,
+    value)`` pairs and read back sequentially by ``iter_rows``, so memory no
+    longer grows with the number of offers. Exposes the same reading
+    interface as ``OfferStore``.
+    """
+
+    def __init__(self, dir=None):
+        self.file = tempfile.TemporaryFile(dir=dir)
+        self.columns = {}
+        self.row_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def add(self, row):
+        columns = self.columns
+        record = []
+        for name, value in row.items():
+            if name is None:
+                continue
+            column = columns.get(name)
+            if column is None:
+                column = columns[sys.intern(name)] = ColumnStats(name, len(columns))
+            column.update(value)
+            record.append(column.index)
+            record.append(value)
+        marshal.dump(record, self.file)
+        self.row_count += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def fill_rate(self, name):
+        column = self.columns.get(name)
+        if column is None or not self.row_count:
+            return 0.0
+        return column.filled / self.row_count
+
+    def undefined_only_columns(self):
+        """Columns whose non-empty values are all ``'Undefined'`` (or that have none)."""
+        return {name for name, column in self.columns.items() if not column.defined}
+
+    def iter_rows(self, fields, missing=''):
+        """Yield each spilled row as a list of values for ``fields``, in insertion order."""
+        positions = [None] * len(self.columns)
+        for position, name in enumerate(fields):
+            column = self.columns.get(name)
+            if column is not None:
+                positions[column.index] = position
+
+        self.file.flush()
+        self.file.seek(0)
+        width = len(fields)
+        for _ in range(self.row_count):
+            record = marshal.load(self.file)
+            out = [missing] * width
+            for i in range(0, len(record), 2):
+                position = positions[record[i]]
+                if position is not None:
+                    out[position] = record[i + 1]
+            yield out
+        self.file.seek(0, 2)
+
+
+class CsvStream:
+    """Encode rows as CSV and pass them to ``write`` while the feed is still being parsed.
+
+    A header cannot change once it is sent, so the first ``header_rows`` rows
+    are held in an ``OfferStore`` and ``select_fields`` chooses the header from
+    them as it would for a whole file; later rows are encoded as they arrive
+    and values in columns first seen after that are left out. A feed with no
+    more than ``header_rows`` rows streams the same bytes a file conversion
+    writes. Output reaches ``write`` in chunks of about ``chunk_size`` bytes.
+    """
+
+    def __init__(self, write, select_fields, make_encoder, header_rows=STREAM_HEADER_ROWS, chunk_size=STREAM_CHUNK_SIZE):
+        self.write = write
+        self.select_fields = select_fields
+        self.make_encoder = make_encoder
+        self.header_rows = header_rows
+        self.chunk_size = chunk_size
+        self.started = False
+        self.fields = None
+        self.encode_row = None
+        self.head = OfferStore()
+        self.row_count = 0
+        self.text = io.StringIO()
+        self.writer = csv.writer(self.text, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+
+    def reset(self):
+        """Forget the rows held so far, e.g. before parsing the feed again."""
+        if self.started:
+            raise ValueError("CSV rows have already been streamed")
+        self.head = OfferStore()
+        self.row_count = 0
+
+    def add(self, row):
+        self.row_count += 1
+        if self.fields is None:
+            self.head.add(row)
+            if self.head.row_count >= self.header_rows:
+                self.write_head()
+            return
+        self.writer.writerow(self.encode_row([row.get(name, '') for name in self.fields]))
+        if self.text.tell() >= self.chunk_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def write_head(self):
+        self.fields = self.select_fields(self.head)
+        self.encode_row = self.make_encoder(self.fields)
+        self.text.write('\ufeff')
+        self.writer.writerow(self.fields)
+        self.writer.writerows(map(self.encode_row, self.head.iter_rows(self.fields)))
+        self.head = None
+        self.flush()
+
+    def flush(self):
+        data = self.text.getvalue()
+        if data:
+            self.text.seek(0)
+            self.text.truncate()
+            self.started = True
+            self.write(data.encode('utf-8'))
+
+    def finish(self):
+        if self.fields is None:
+            self.write_head()
+        self.flush()
@@ -0,0 +1,294 @@
+from collections import OrderedDict
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+
+FEED_CACHE_DIR = Path("cache") / "feeds"
+FEED_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+RESULT_CACHE_DIR = Path("cache") / "results"
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+# Converter parameters that only change how a result is produced. Encodings
+# are always detected from the input bytes the digest already covers.
+RESULT_EXECUTION_PARAMS = frozenset({'streaming', 'parallel', 'encoding'})
+STRATEGY_MEMORY_PATH = Path("cache") / "fetch_strategies.json"
+STRATEGY_MEMORY_MAX_HOSTS = 4096
+
+
+class ArtifactCache:
+    """JSON entries stored next to the artifacts they describe, trimmed by least recent use to ``max_bytes``."""
+
+    artifact_suffix = '.csv'
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def read_entry(self, entry_path):
+        try:
+            with open(entry_path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not (self.cache_dir / entry.get('artifact', '')).is_file():
+            return None
+        return entry
+
+    def write_entry(self, entry_path, entry, path):
+        """Copy ``path`` in as the artifact of ``entry`` and save the entry, then evict."""
+        artifact = entry_path.with_suffix(self.artifact_suffix)
+        self.copy(Path(path), artifact)
+        entry = {**entry, 'artifact': artifact.name, 'size': artifact.stat().st_size}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry_path in self.cache_dir.glob('*.json'):
+            artifact = entry_path.with_suffix(self.artifact_suffix)
+            try:
+                entries.append((entry_path.stat().st_mtime, artifact.stat().st_size, entry_path))
+            except OSError:
+                self.remove(entry_path)
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.remove(entry_path)
+            total -= size
+            self.evictions += 1
+
+    def remove(self, entry_path):
+        entry_path.unlink(missing_ok=True)
+        entry_path.with_suffix(self.artifact_suffix).unlink(missing_ok=True)
+
+    def copy(self, source, target):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+        except OSError:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def stats(self):
+        entries = list(self.cache_dir.glob('*.json'))
+        artifacts = [p.with_suffix(self.artifact_suffix) for p in entries]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(p.stat().st_size for p in artifacts if p.exists()),
+        }
+
+
+class FeedCache(ArtifactCache):
+    """Validators and converted CSVs of remote feeds, keyed by URL and target node.
+
+    Each entry is a JSON file with the feed's ``ETag``/``Last-Modified``
+    validators next to a copy of the CSV it was converted to, so an
+    unchanged feed can be answered from a ``304 Not Modified`` without
+    downloading or converting it again. The entry's ``suffix`` is the
+    extension of the converted file (``.zip`` for archives of several
+    feeds). Entries are touched when served; the least recently used ones
+    are dropped once the cached CSVs exceed ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir=FEED_CACHE_DIR, max_bytes=FEED_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    def entry_path(self, url, target_node):
+        digest = hashlib.sha256(f"{target_node}\n{url}".encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{digest}.json"
+
+    def lookup(self, url, target_node):
+        """Return the cached entry for ``url``, or ``None`` if it has none or lost its CSV."""
+        entry = self.read_entry(self.entry_path(url, target_node))
+        if entry is None or entry.get('url') != url or 'suffix' not in entry:
+            return None
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def restore(self, entry, path):
+        """Copy the entry's CSV to ``path``; returns ``False`` if the copy is gone."""
+        try:
+            self.copy(self.cache_dir / entry['artifact'], Path(path))
+            os.utime(self.entry_path(entry['url'], entry['target_node']))
+        except OSError:
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, url, target_node, headers, path):
+        """Record a freshly converted feed; counts as a miss even if it cannot be cached."""
+        self.misses += 1
+        entry_path = self.entry_path(url, target_node)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        try:
+            if not etag and not last_modified:
+                self.remove(entry_path)
+                return
+            entry = {
+                'url': url,
+                'target_node': target_node,
+                'etag': etag,
+                'last_modified': last_modified,
+                'suffix': Path(path).suffix,
+            }
+            self.write_entry(entry_path, entry, path)
+        except OSError:
+            pass
+
+
+class ResultCache(ArtifactCache):
+    """Converted files keyed by the SHA-256 of their input, the converter and its parameters.
+
+    Uploading the same file to the same converter again is answered by
+    copying the stored artifact into place instead of converting it. The
+    artifact keeps the name it was converted under; for a new upload name the
+    part derived from the old source name is swapped for the new one, unless
+    the new name has dots or spaces that converters may rewrite, in which case
+    the result is converted again.
+    """
+
+    artifact_suffix = '.out'
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    @staticmethod
+    def input_digest(data):
+        """SHA-256 of bytes, text or the rest of a seekable binary file, whose position is restored."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if not hasattr(data, 'read'):
+            return hashlib.sha256(data).hexdigest()
+        digest = hashlib.sha256()
+        position = data.tell()
+        try:
+            for chunk in iter(lambda: data.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        finally:
+            data.seek(position)
+        return digest.hexdigest()
+
+    @staticmethod
+    def output_params(converter, args, kwargs):
+        """Name the arguments after the input and source name, defaults included, that shape the output."""
+        bound = inspect.signature(converter).bind(None, None, *args, **kwargs)
+        bound.apply_defaults()
+        names = list(bound.arguments)[2:]
+        return {name: bound.arguments[name] for name in names if name not in RESULT_EXECUTION_PARAMS}
+
+    def entry_path(self, converter, params, input_digest):
+        key = json.dumps([converter, params, input_digest], default=str, sort_keys=True)
+        return self.cache_dir / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    @staticmethod
+    def output_filename(entry, source_name):
+        if source_name == entry['source_name']:
+            return entry['filename']
+        old_base = os.path.splitext(entry['source_name'])[0]
+        new_base = os.path.splitext(source_name)[0]
+        if old_base and entry['filename'].startswith(old_base) and not any(c in new_base for c in '. '):
+            return new_base + entry['filename'][len(old_base):]
+        return None
+
+    def restore(self, converter, params, input_digest, source_name, output_dir):
+        """Copy a cached result for ``source_name`` into ``output_dir``; ``None`` if there is none."""
+        entry_path = self.entry_path(converter, params, input_digest)
+        entry = self.read_entry(entry_path)
+        filename = self.output_filename(entry, source_name) if entry is not None else None
+        if not filename or os.path.basename(filename) != filename:
+            return None
+        path = os.path.join(output_dir, filename)
+        try:
+            self.copy(self.cache_dir / entry['artifact'], Path(path))
+            os.utime(entry_path)
+        except OSError:
+            return None
+        self.hits += 1
+        return path, filename
+
+    def store(self, converter, params, input_digest, source_name, path):
+        """Record a fresh conversion result; counts as a miss even if it cannot be cached."""
+        self.misses += 1
+        entry = {'converter': converter, 'source_name': source_name, 'filename': os.path.basename(path)}
+        try:
+            self.write_entry(self.entry_path(converter, params, input_digest), entry, path)
+        except OSError:
+            pass
+
+
+class StrategyMemory:
+    """Remember which request strategy last got a feed out of each host.
+
+    The table is loaded from ``path`` on first use and rewritten whenever a
+    host's strategy changes, so it survives restarts. Only the
+    ``max_hosts`` most recently successful hosts are kept.
+    """
+
+    def __init__(self, path=STRATEGY_MEMORY_PATH, max_hosts=STRATEGY_MEMORY_MAX_HOSTS):
+        self.path = Path(path)
+        self.max_hosts = max_hosts
+        self.hosts = None
+
+    def load(self):
+        if self.hosts is None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.hosts = OrderedDict(json.load(f))
+            except (OSError, ValueError, TypeError):
+                self.hosts = OrderedDict()
+        return self.hosts
+
+    def preferred(self, host):
+        return self.load().get(host)
+
+    def order(self, host, strategies):
+        """Return ``strategies`` with the one that last worked for ``host`` first."""
+        preferred = self.preferred(host)
+        return sorted(strategies, key=lambda strategy: strategy['name'] != preferred)
+
+    def remember(self, host, name):
+        hosts = self.load()
+        changed = hosts.get(host) != name
+        hosts[host] = name
+        hosts.move_to_end(host)
+        while len(hosts) > self.max_hosts:
+            hosts.popitem(last=False)
+        if changed:
+            self.save()
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(list(self.hosts.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
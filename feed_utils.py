@@ -0,0 +1,508 @@
+import codecs
+from collections import OrderedDict
+import hashlib
+import html.entities
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+
+from input_utils import SNIFF_SIZE
+
+CHUNK_SIZE = 64 * 1024
+SERIALIZED_CHUNK_SIZE = 1024 * 1024
+
+FORMAT_TAGS = {
+    'offer': 'offer',
+    'product': 'product',
+    'russian': 'ЭлементСправочника',
+    'service': 'service',
+}
+
+SCAN_CHUNK_SIZE = 1024 * 1024
+FORMAT_CACHE_SIZE = 1024
+
+CATEGORY_CACHE_DIR = Path("cache") / "categories"
+CATEGORY_CACHE_MAX_FILES = 256
+
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+STRAY_AMPERSAND_RE = re.compile(r'&(?![a-zA-Z0-9#]+;)')
+CONTROL_BYTES = bytes(range(0x09)) + b'\x0B\x0C' + bytes(range(0x0E, 0x20)) + b'\x7F'
+ENTITY_REPAIR_RE = re.compile(rb'&(?!#[0-9]+;|#x[0-9a-fA-F]+;)(?:([a-zA-Z][a-zA-Z0-9]*);)?')
+INVALID_XML_CHARS_RE = re.compile(r'[^\x09\x0A\x0D\x20-\uD7FF\uE000-\uFFFD]')
+
+format_cache = OrderedDict()
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield ``source`` in pieces suitable for feeding an incremental parser.
+
+    ``source`` may be XML text (``str``), raw bytes, a filesystem path
+    (``os.PathLike``) or a readable file object. Text chunks have XML control
+    characters stripped and file objects have leading whitespace dropped,
+    matching the in-memory parse path.
+    """
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield CONTROL_CHARS_RE.sub('', source[start:start + chunk_size])
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+    elif isinstance(source, os.PathLike):
+        with open(source, 'rb') as f:
+            yield from iter_chunks(f, chunk_size)
+    else:
+        started = False
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            if isinstance(chunk, str):
+                chunk = CONTROL_CHARS_RE.sub('', chunk)
+            yield chunk
+
+
+def rewind(source):
+    """Prepare ``source`` for another pass; file objects must be seekable."""
+    if hasattr(source, 'read'):
+        source.seek(0)
+
+
+def iter_events(source, events=('start', 'end')):
+    """Parse ``source`` incrementally, yielding ``(event, element)`` pairs."""
+    parser = ET.XMLPullParser(events)
+    for chunk in iter_chunks(source):
+        parser.feed(chunk)
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def scan_feed_header(source, format_type="auto", with_categories=True):
+    """Detect the feed format and collect categories without building the tree.
+
+    Elements are dropped as soon as they close, and the scan stops once the
+    format is known and (for ``offer`` feeds) the ``<categories>`` section has
+    closed or the first ``<offer>`` opens, since YML lists categories before
+    offers; for YML feeds only the head of the document is read. With
+    ``with_categories=False`` the scan stops at the first record.
+
+    Returns:
+        A ``(format_type, categories, parents)`` tuple where ``format_type`` is
+        ``None`` if no supported element was found.
+    """
+    tag_formats = {tag: fmt for fmt, tag in FORMAT_TAGS.items()}
+    detected = None if format_type == "auto" else format_type
+    categories = {}
+    parents = {}
+    categories_done = False
+    stack = []
+
+    for event, elem in iter_events(source):
+        if event == 'start':
+            if elem.tag == 'offer' and stack and detected in (None, 'offer'):
+                detected = 'offer'
+                break
+            stack.append(elem)
+            continue
+        stack.pop()
+
+        if elem.tag == 'category':
+            cid = elem.get('id')
+            pid = elem.get('parentId')
+            categories[cid] = elem.text or 'Undefined'
+            if pid:
+                parents[cid] = pid
+        elif elem.tag == 'categories':
+            categories_done = True
+
+        if detected is None and elem.tag in tag_formats and (stack or elem.tag == 'service'):
+            detected = tag_formats[elem.tag]
+
+        if stack:
+            stack[-1].remove(elem)
+
+        if detected is not None and (detected != 'offer' or categories_done or not with_categories):
+            break
+
+    return detected, categories, parents
+
+
+def sniff_format(text, limit=SNIFF_SIZE):
+    """Detect the feed format from the first ``limit`` characters of ``text``.
+
+    Returns ``None`` when no record closes within the prefix, the prefix does
+    not parse, or a record tag that ``detect_format`` prefers over the first
+    one (``<offer>`` before ``<product>``, and so on) also appears in it; the
+    caller should then inspect the full tree.
+    """
+    head = text[:limit]
+    try:
+        detected = scan_feed_header(head, with_categories=False)[0]
+    except ET.ParseError:
+        return None
+    if detected is None:
+        return None
+    formats = list(FORMAT_TAGS)
+    for fmt in formats[:formats.index(detected)]:
+        if re.search(rf'<{re.escape(FORMAT_TAGS[fmt])}[\s/>]', head):
+            return None
+    return detected
+
+
+def detect_format(root):
+    """Detect the format of a parsed feed in a single walk over ``root``.
+
+    Preference matches checking ``findall('.//offer')``, then ``product``,
+    ``ЭлементСправочника`` and ``service`` in turn; a root ``<service>``
+    element also counts.
+    """
+    tag_formats = {tag: fmt for fmt, tag in FORMAT_TAGS.items()}
+    found = set()
+    for elem in root.iter():
+        fmt = tag_formats.get(elem.tag)
+        if fmt is not None and elem is not root:
+            if fmt == 'offer':
+                return fmt
+            found.add(fmt)
+    if root.tag == 'service':
+        found.add('service')
+    for fmt in FORMAT_TAGS:
+        if fmt in found:
+            return fmt
+    return None
+
+
+def has_format(root, format_type):
+    """Return whether ``root`` contains a record of ``format_type``."""
+    if format_type == 'service' and root.tag == 'service':
+        return True
+    return root.find(f'.//{FORMAT_TAGS[format_type]}') is not None
+
+
+def cached_format(key):
+    """Return the format last detected for ``key`` (a feed URL), if any."""
+    if key not in format_cache:
+        return None
+    format_cache.move_to_end(key)
+    return format_cache[key]
+
+
+def remember_format(key, format_type):
+    """Record ``format_type`` for ``key``, keeping the ``FORMAT_CACHE_SIZE`` most recent."""
+    format_cache[key] = format_type
+    format_cache.move_to_end(key)
+    while len(format_cache) > FORMAT_CACHE_SIZE:
+        format_cache.popitem(last=False)
+
+
+class TextSniffer:
+    """Case-insensitive marker checks that look at the head of a document first.
+
+    Only the first ``limit`` characters (or bytes, decoded with ``encoding``)
+    are lowercased up front. When a marker is not in the head, the rest of
+    the document is decoded and lowercased in ``SCAN_CHUNK_SIZE`` pieces,
+    overlapping by the longest marker, so it is never held in memory whole.
+    ``text`` may also be a seekable binary file object, which is left at its
+    current position. ``prefix`` keeps the head in its original case.
+    """
+
+    def __init__(self, text, limit=SNIFF_SIZE, encoding=None):
+        self.text = text
+        self.encoding = encoding
+        if isinstance(text, str):
+            self.prefix = text[:limit]
+            complete = len(text) <= limit
+        else:
+            head = self.read(limit)
+            self.prefix = codecs.getincrementaldecoder(encoding)(errors='replace').decode(head)
+            complete = len(head) < limit
+        self.head = self.prefix.lower()
+        self.complete = complete
+
+    def read(self, limit):
+        if not hasattr(self.text, 'read'):
+            return bytes(self.text[:limit])
+        position = self.text.tell()
+        data = self.text.read(limit)
+        self.text.seek(position)
+        return data
+
+    def iter_lower_chunks(self):
+        if isinstance(self.text, str):
+            for start in range(0, len(self.text), SCAN_CHUNK_SIZE):
+                yield self.text[start:start + SCAN_CHUNK_SIZE].lower()
+            return
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        if hasattr(self.text, 'read'):
+            position = self.text.tell()
+            try:
+                for chunk in iter(lambda: self.text.read(SCAN_CHUNK_SIZE), b''):
+                    yield decoder.decode(chunk).lower()
+            finally:
+                self.text.seek(position)
+        else:
+            data = memoryview(self.text)
+            for start in range(0, len(data), SCAN_CHUNK_SIZE):
+                yield decoder.decode(data[start:start + SCAN_CHUNK_SIZE]).lower()
+        yield decoder.decode(b'', final=True).lower()
+
+    def contains(self, *markers):
+        if any(marker in self.head for marker in markers):
+            return True
+        if self.complete:
+            return False
+        overlap = max(len(marker) for marker in markers) - 1
+        tail = ''
+        chunks = self.iter_lower_chunks()
+        try:
+            for chunk in chunks:
+                window = tail + chunk
+                if any(marker in window for marker in markers):
+                    return True
+                tail = window[-overlap:] if overlap else ''
+        finally:
+            chunks.close()
+        return False
+
+
+def parse_recovering(data, encoding=None):
+    """Parse a malformed feed with a single repair pass over the raw bytes.
+
+    libxml2's recovering parser (via lxml) skips broken markup locally, but
+    it mishandles the most common feed defects: it drops the text after a
+    stray ``&`` (``AT&T`` becomes ``AT``), loses the rest of a CDATA section
+    containing a control character, and once it has reported any error it
+    silently drops every later named entity, ``&amp;`` included. So the raw
+    bytes are repaired first: control characters are deleted and named
+    entities and stray ampersands outside CDATA become numeric character
+    references. The result is parsed once in recover mode. Without lxml,
+    falls back to regex repair and ElementTree.
+
+    Returns:
+        The root element; it supports the ElementTree API used by the
+        extractors.
+
+    Raises:
+        ET.ParseError: If nothing could be recovered.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        return parse_repaired(data, encoding)
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+        encoding = 'utf-8'
+    if is_ascii_compatible(data, encoding):
+        data = repair_bytes(data)
+
+    parser = etree.XMLParser(recover=True, huge_tree=True, remove_comments=True, remove_pis=True,
+                             encoding=encoding)
+    try:
+        root = etree.fromstring(data, parser)
+    except etree.XMLSyntaxError as e:
+        raise ET.ParseError(str(e)) from e
+    if root is None:
+        raise ET.ParseError(str(parser.error_log.last_error or 'no element found'))
+    return root
+
+
+def is_ascii_compatible(data, encoding=None):
+    """Return whether ASCII markup in ``data`` is stored as single bytes."""
+    if encoding:
+        return not encoding.lower().replace('_', '-').startswith(('utf-16', 'utf-32', 'ucs'))
+    return not data.startswith((b'\xff\xfe', b'\xfe\xff', b'\x00', b'<\x00'))
+
+
+def repair_bytes(data):
+    """Strip control bytes and turn entities outside CDATA into character references."""
+    data = data.translate(None, CONTROL_BYTES)
+    if b'&' not in data:
+        return data
+    parts = []
+    pos = 0
+    while True:
+        start = data.find(b'<![CDATA[', pos)
+        if start == -1:
+            parts.append(ENTITY_REPAIR_RE.sub(repair_entity, data[pos:]))
+            break
+        end = data.find(b']]>', start)
+        end = len(data) if end == -1 else end + 3
+        parts.append(ENTITY_REPAIR_RE.sub(repair_entity, data[pos:start]))
+        parts.append(data[start:end])
+        pos = end
+    return b''.join(parts)
+
+
+def repair_entity(match):
+    """Replace a named entity or a stray ``&`` with numeric character references."""
+    name = match.group(1)
+    if name is None:
+        return b'&#38;'
+    text = html.entities.html5.get(name.decode('ascii') + ';')
+    if text is None:
+        return b'&#38;' + name + b';'
+    return ''.join(f'&#{ord(char)};' for char in text).encode('ascii')
+
+
+def parse_repaired(data, encoding=None):
+    """Parse ``data`` with ElementTree after regex-based repair of the whole document."""
+    if not isinstance(data, str):
+        data = data.decode(encoding or 'utf-8', errors='replace')
+    data = CONTROL_CHARS_RE.sub('', data)
+    data = STRAY_AMPERSAND_RE.sub('&amp;', data)
+    data = INVALID_XML_CHARS_RE.sub('', data)
+    return ET.fromstring(data)
+
+
+def iter_feed_elements(source, format_type):
+    """Yield each record element of ``format_type`` once it is complete.
+
+    Once the consumer resumes the generator the element is detached from the
+    tree, so peak memory is bounded by the largest record plus one parser
+    chunk. Records are yielded in document order, like
+    ``findall('.//tag')``: records nested inside another record are queued
+    when they open and yielded, still attached, right after the outermost
+    one closes. The root element itself is never yielded.
+    """
+    tag = FORMAT_TAGS[format_type]
+    stack = []
+    pending = []
+    depth = 0
+
+    for event, elem in iter_events(source):
+        if event == 'start':
+            if elem.tag == tag and stack:
+                depth += 1
+                pending.append(elem)
+            stack.append(elem)
+            continue
+        stack.pop()
+        if not stack:
+            continue
+
+        if elem.tag == tag:
+            depth -= 1
+        if depth == 0:
+            yield from pending
+            pending.clear()
+            stack[-1].remove(elem)
+
+
+def iter_serialized_chunks(elements, chunk_size=SERIALIZED_CHUNK_SIZE):
+    """Group ``elements`` into UTF-8 ``<chunk>`` documents of about ``chunk_size`` bytes.
+
+    Chunks are cut by serialized size rather than record count, so feeds with
+    very different record sizes produce evenly sized units of work.
+    """
+    parts = []
+    size = 0
+    for elem in elements:
+        data = ET.tostring(elem, encoding='utf-8', xml_declaration=False)
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b'<chunk>' + b''.join(parts) + b'</chunk>'
+            parts = []
+            size = 0
+    if parts:
+        yield b'<chunk>' + b''.join(parts) + b'</chunk>'
+
+
+def build_category_paths(categories, parents):
+    """Resolve the ``///``-joined path of every category in O(categories).
+
+    Each category's path is its parent's path plus its own name, so every
+    chain is walked once. Categories on a ``parentId`` cycle get the path a
+    walk starting from them would produce: every member of the cycle once,
+    starting with the category itself. Empty and ``'Undefined'`` names are
+    skipped; a category whose path ends up empty maps to its own name.
+    """
+    paths = {}
+
+    def join(base, cid):
+        name = categories[cid]
+        if not name or name == 'Undefined':
+            return base
+        return f"{base}///{name}" if base else name
+
+    for start in categories:
+        chain = []
+        on_chain = {}
+        current = start
+        while current and current in categories and current not in paths and current not in on_chain:
+            on_chain[current] = len(chain)
+            chain.append(current)
+            current = parents.get(current)
+
+        if current in on_chain:
+            cycle = chain[on_chain[current]:]
+            del chain[on_chain[current]:]
+            for i, cid in enumerate(cycle):
+                base = ''
+                for member in reversed(cycle[i:] + cycle[:i]):
+                    base = join(base, member)
+                paths[cid] = base
+
+        base = paths.get(current, '')
+        for cid in reversed(chain):
+            base = join(base, cid)
+            paths[cid] = base
+
+    return {cid: path or categories[cid] for cid, path in paths.items()}
+
+
+def categories_digest(categories, parents):
+    digest = hashlib.sha256()
+    for cid, name in categories.items():
+        digest.update(json.dumps([cid, parents.get(cid), name], ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_category_paths(categories, parents, cache_dir=CATEGORY_CACHE_DIR):
+    """Return the category path table, reusing a cached one for identical trees.
+
+    Tables are stored as JSON files named after a digest of the
+    ``<categories>`` section, so refetching an unchanged feed skips the
+    resolution step. Only the most recent ``CATEGORY_CACHE_MAX_FILES`` tables
+    are kept.
+    """
+    if not categories:
+        return {}
+
+    cache_path = Path(cache_dir) / f"{categories_digest(categories, parents)}.json"
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            paths = json.load(f)
+        os.utime(cache_path)
+        return paths
+    except (OSError, ValueError):
+        pass
+
+    paths = build_category_paths(categories, parents)
+    paths.pop(None, None)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(paths, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        cached = sorted(cache_path.parent.glob('*.json'), key=lambda p: p.stat().st_mtime)
+        for stale in cached[:-CATEGORY_CACHE_MAX_FILES]:
+            stale.unlink(missing_ok=True)
+    except OSError:
+        pass
+    return paths
@@ -0,0 +1,70 @@
+from urllib.parse import quote
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an ``Accept-Encoding`` header to its q-value."""
+    codings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def select_encoding(header, available):
+    """Pick the first of ``available`` codings (in preference order) the client accepts, else ``None``."""
+    codings = parse_accept_encoding(header)
+    for coding in available:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > 0:
+            return coding
+    return None
+
+
+def etag_matches(header, etag):
+    """Weak comparison of ``etag`` against an ``If-None-Match`` list."""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    return any(tag.strip().removeprefix('W/') == bare for tag in header.split(','))
+
+
+def parse_range(header, size):
+    """Parse a single ``bytes=`` range into inclusive ``(start, end)``.
+
+    Returns ``None`` when the header is absent, malformed or asks for several
+    ranges (the whole file is sent), and raises ``ValueError`` when the range
+    lies entirely beyond ``size``.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, sep, end = header[len('bytes='):].strip().partition('-')
+    if not sep or not (start or end) or not all(part.isdigit() for part in (start, end) if part):
+        return None
+    if start and end and int(start) > int(end):
+        return None
+    if not start:
+        if int(end) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - int(end)), size - 1
+    if int(start) >= size:
+        raise ValueError("Unsatisfiable range")
+    return int(start), min(int(end), size - 1) if end else size - 1
+
+
+def content_disposition(filename):
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    return f"attachment; filename*=utf-8''{quoted}"
@@ -0,0 +1,327 @@
+import bz2
+import codecs
+import gzip
+import io
+import lzma
+import os
+import re
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+
+SNIFF_SIZE = 64 * 1024
+# Each parser.feed() holds the GIL; small chunks keep other threads (and the event loop) responsive.
+PARSE_CHUNK_SIZE = 64 * 1024
+FALLBACK_ENCODINGS = ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+]
+COMPRESSION_SUFFIXES = {'gzip': ('.gz', '.gzip'), 'bz2': ('.bz2',), 'xz': ('.xz',), 'zip': ('.zip',)}
+ARCHIVE_MEMBER_SUFFIXES = ('.xml', '.yml', '.csv', '.json', '.xlsx', '.xls', '.gz', '.bz2', '.xz')
+XML_DECLARATION_RE = re.compile(rb'\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+LEADING_WHITESPACE_RE = re.compile(rb'\s*')
+
+
+def normalize_encoding(name):
+    """Return the canonical codec name for ``name``, or ``None`` if Python has no such codec."""
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def read_head(data, size=SNIFF_SIZE):
+    """Return the first ``size`` bytes of ``data``; file objects are left where they were."""
+    if not hasattr(data, 'read'):
+        return bytes(data[:size])
+    position = data.tell()
+    head = data.read(size)
+    data.seek(position)
+    return head
+
+
+def detect_encoding(data, declared=None, sniff_size=SNIFF_SIZE):
+    """Pick the encoding for ``data`` by looking only at its first ``sniff_size`` bytes.
+
+    A byte order mark wins. A prefix that contains non-ASCII bytes and is
+    valid UTF-8 is UTF-8. Otherwise the XML declaration's ``encoding`` (or
+    ``declared``, e.g. an HTTP charset) is used, falling back to UTF-8 for
+    plain ASCII and to the first of ``FALLBACK_ENCODINGS`` that decodes the
+    prefix, mirroring the decode chain the upload endpoints used to run over
+    the whole body.
+    """
+    head = read_head(data, sniff_size)
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    match = XML_DECLARATION_RE.match(head)
+    if match:
+        declared = match.group(1).decode('ascii')
+    declared = normalize_encoding(declared) if declared else None
+
+    if head.isascii():
+        return declared or 'utf-8'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if declared and declared != 'utf-8':
+        return declared
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            head.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'utf-8'
+
+
+def decode_head(data, encoding=None, size=SNIFF_SIZE):
+    """Decode about the first ``size`` bytes of ``data``; text is sliced as is."""
+    if isinstance(data, str):
+        return data[:size]
+    decoder = codecs.getincrementaldecoder(encoding or detect_encoding(data))(errors='replace')
+    return decoder.decode(read_head(data, size))
+
+
+def decode_text(data, encoding=None):
+    """Decode all of ``data`` for consumers that need a single string."""
+    if isinstance(data, str):
+        return data
+    encoding = encoding or detect_encoding(data)
+    if hasattr(data, 'read'):
+        data = data.read()
+    return codecs.decode(data, encoding, 'replace')
+
+
+def open_text(data, encoding=None):
+    """Return a text stream over ``data`` that decodes incrementally as it is read.
+
+    ``data`` may be text, bytes or a seekable binary file object; a file
+    object is read from its current position and is not closed with the
+    returned stream.
+    """
+    if isinstance(data, str):
+        return io.StringIO(data)
+    encoding = encoding or detect_encoding(data)
+    if not hasattr(data, 'read'):
+        return io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors='replace', newline='')
+    return BorrowedTextIOWrapper(data, encoding=encoding, errors='replace', newline='')
+
+
+class BorrowedTextIOWrapper(io.TextIOWrapper):
+    """Text stream over a binary file that belongs to someone else.
+
+    Closing it (or letting it be garbage collected) detaches the wrapper
+    instead of closing the file, so the owner can rewind and read it again.
+    """
+
+    def close(self):
+        try:
+            self.detach()
+        except ValueError:
+            pass
+
+
+def detect_compression(data):
+    """Return ``'gzip'``, ``'bz2'``, ``'xz'`` or ``'zip'`` from the magic bytes of ``data``, else ``None``."""
+    head = read_head(data, 8)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_decompressed(data, compression):
+    """Return a binary file that decompresses ``data`` (bytes or a file) as it is read."""
+    if not hasattr(data, 'read'):
+        data = io.BytesIO(data)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=data, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(data)
+    if compression == 'xz':
+        return lzma.LZMAFile(data)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def strip_compression_suffix(name, compression):
+    """``feed.xml.gz`` -> ``feed.xml``; names without the suffix are returned unchanged."""
+    for suffix in COMPRESSION_SUFFIXES.get(compression, ()):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def archive_members(archive, suffixes=ARCHIVE_MEMBER_SUFFIXES):
+    """Members of a ``zipfile.ZipFile`` named with one of ``suffixes``, skipping folders and OS metadata."""
+    members = []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if (info.is_dir() or not info.file_size or name.startswith('__MACOSX/') or base.startswith('.')
+                or not base.lower().endswith(suffixes)):
+            continue
+        members.append(info)
+    return members
+
+
+def iter_stripped_lines(lines):
+    """Yield ``lines`` as if the text they make up had been ``strip()``-ed."""
+    started = False
+    last = None
+    blank = []
+    for line in lines:
+        if not line.strip():
+            if started:
+                blank.append(line)
+            continue
+        if not started:
+            line = line.lstrip()
+            started = True
+        if last is not None:
+            yield last
+            yield from blank
+            blank = []
+        last = line
+    if last is not None:
+        yield last.rstrip()
+
+
+def strip_leading_whitespace(data):
+    """Drop whitespace before the first byte of markup (copies only if there is any)."""
+    start = LEADING_WHITESPACE_RE.match(data).end()
+    return data[start:] if start else data
+
+
+def parser_encoding(encoding):
+    """Map a detected encoding to one expat and libxml2 accept as an override."""
+    return 'utf-8' if encoding == 'utf-8-sig' else encoding
+
+
+def parse_xml(data, encoding=None):
+    """Parse XML text, bytes or a binary file object.
+
+    Bytes are parsed in ``encoding`` without decoding them first; bytes and
+    file objects are fed to the parser in chunks of ``PARSE_CHUNK_SIZE``.
+    """
+    if isinstance(data, str):
+        return ET.fromstring(data)
+    encoding = parser_encoding(encoding or detect_encoding(data))
+    if encoding in ('utf-16', 'utf-32'):
+        return ET.fromstring(decode_text(data, encoding))
+    parser = ET.XMLParser(encoding=encoding)
+    if hasattr(data, 'read'):
+        for chunk in iter(lambda: data.read(PARSE_CHUNK_SIZE), b''):
+            parser.feed(chunk)
+    else:
+        view = memoryview(data)
+        for start in range(0, len(view), PARSE_CHUNK_SIZE):
+            parser.feed(view[start:start + PARSE_CHUNK_SIZE])
+    return parser.close()
+
+
+class DownloadBuffer:
+    """Temporary file that the event loop appends to while a worker thread reads it.
+
+    Readers returned by ``open`` block until the bytes they ask for have
+    arrived or the download has finished, so a feed can be parsed while it
+    is still downloading. The body lives on disk, not in memory.
+    """
+
+    def __init__(self, dir=None):
+        fd, path = tempfile.mkstemp(dir=dir)
+        try:
+            self.append_fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        except BaseException:
+            os.close(fd)
+            raise
+        finally:
+            os.unlink(path)
+        self.read_fd = fd
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def write(self, data):
+        # The lock only guards ``size``: readers never look past it, so the
+        # append itself does not block them.
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.append_fd, view):]
+        with self.condition:
+            self.size += len(data)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        """Mark the download complete; ``error`` is raised to readers still waiting for data."""
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def close(self):
+        os.close(self.append_fd)
+        os.close(self.read_fd)
+
+    def read_at(self, position, size):
+        with self.condition:
+            self.condition.wait_for(lambda: self.done or self.size >= position + size)
+            available = self.size
+            if self.error is not None and available <= position:
+                raise IOError(f"Download failed: {self.error}")
+        return os.pread(self.read_fd, max(0, min(size, available - position)), position)
+
+    def wait_size(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.done)
+            return self.size
+
+    def open(self):
+        return io.BufferedReader(DownloadReader(self))
+
+
+class DownloadReader(io.RawIOBase):
+    """Seekable raw reader over a ``DownloadBuffer``."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.buffer.read_at(self.position, len(b))
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.buffer.wait_size() + offset
+        return self.position
+
+    def tell(self):
+        return self.position
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import sqlite3
+import uuid
+
+JOBS_DB_PATH = Path("cache") / "jobs.sqlite3"
+JOB_RETENTION = timedelta(days=7)
+
+JOB_STATES = ('queued', 'running', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    preset_id TEXT NOT NULL DEFAULT '',
+    link_url TEXT NOT NULL,
+    return_url TEXT NOT NULL DEFAULT '',
+    target_node TEXT NOT NULL DEFAULT 'auto',
+    status TEXT NOT NULL,
+    file_url TEXT,
+    error TEXT,
+    bytes_received INTEGER NOT NULL DEFAULT 0,
+    bytes_total INTEGER,
+    records INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_preset ON jobs (preset_id, created_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class JobProgress:
+    """Live counters for a running job, read by status requests."""
+
+    __slots__ = ('bytes_received', 'bytes_total', 'store')
+
+    def __init__(self):
+        self.bytes_received = 0
+        self.bytes_total = None
+        self.store = None
+
+    @property
+    def records(self):
+        return self.store.row_count if self.store is not None else 0
+
+    def as_dict(self):
+        return {
+            'bytes_received': self.bytes_received,
+            'bytes_total': self.bytes_total,
+            'records': self.records,
+        }
+
+
+class JobStore:
+    """Durable record of link conversion jobs in a local SQLite database.
+
+    Jobs move from ``queued`` to ``running`` to ``done`` or ``failed``. The
+    table outlives the process, so jobs that were queued or running when the
+    service stopped are returned by ``unfinished`` and can be resubmitted, and
+    finished jobs stay queryable until they are older than ``retention``.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, retention=JOB_RETENTION):
+        self.path = Path(path)
+        self.retention = retention
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def create(self, link_url, return_url='', preset_id='', target_node='auto'):
+        job_id = uuid.uuid4().hex
+        now = utc_now()
+        self.connect().execute(
+            'INSERT INTO jobs (id, preset_id, link_url, return_url, target_node, status, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, preset_id, link_url, return_url, target_node, 'queued', now, now))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def latest_for_preset(self, preset_id):
+        row = self.connect().execute(
+            'SELECT * FROM jobs WHERE preset_id = ? ORDER BY created_at DESC, rowid DESC LIMIT 1',
+            (preset_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = utc_now()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self.connect().execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def mark_running(self, job_id):
+        self.update(job_id, status='running', error=None)
+
+    def mark_done(self, job_id, file_url, progress=None):
+        self.update(job_id, status='done', file_url=file_url, **(progress.as_dict() if progress else {}))
+
+    def mark_failed(self, job_id, error, progress=None):
+        self.update(job_id, status='failed', error=error, **(progress.as_dict() if progress else {}))
+
+    def unfinished(self):
+        """Ids of jobs left queued or running, oldest first."""
+        rows = self.connect().execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at, rowid")
+        return [row['id'] for row in rows]
+
+    def prune(self):
+        cutoff = (datetime.now(timezone.utc) - self.retention).isoformat(timespec='seconds')
+        self.connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
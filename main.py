@@ -3,17 +3,23 @@ from urllib.parse import urlparse
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from fastapi.responses import FileResponse
+from typing import List
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 import xml.etree.ElementTree as ET
 import csv
+import gc
 import os
+import tempfile
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-import re
+import contextvars
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import json
 import pandas as pd
 from io import BytesIO
@@ -26,6 +32,18 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.units import inch
 import logging
+import feed_utils
+import input_utils
+from converter_pool import ConverterPool
+from artifact_store import ARTIFACT_ENCODINGS, ARTIFACT_SWEEP_INTERVAL, ArtifactStore
+from csv_utils import CsvStream, OfferSpool, OfferStore
+from feed_cache import FeedCache, ResultCache, StrategyMemory
+from job_store import JobProgress, JobStore
+from upload_store import UPLOAD_CHUNK_SIZE, UploadError, UploadStore
+from http_utils import content_disposition, etag_matches, parse_range, select_encoding
+from path_utils import current_output_dir, get_validated_file_path, output_dir
+from offer_utils import (process_offer_element, process_record, process_records_blob,
+                         process_russian_element, process_service_element)
 try:
     import tabula
 except ImportError:
@@ -35,6 +53,51 @@ logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %
 logger = logging.getLogger(__name__)
 
 
+STREAMING_MIN_SIZE = 5 * 1024 * 1024
+PARALLEL_MIN_SIZE = 20 * 1024 * 1024
+EXTRACT_WORKERS = os.cpu_count() or 1
+FETCH_CHUNK_SIZE = 256 * 1024
+FETCH_RETRY_BASE_DELAY = 0.5
+FETCH_RETRY_MAX_DELAY = 4
+HTTP_POOL_LIMIT = 100
+HTTP_POOL_LIMIT_PER_HOST = 8
+HTTP_KEEPALIVE_TIMEOUT = 30
+HTTP_DNS_CACHE_TTL = 300
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+CALLBACK_TIMEOUT = aiohttp.ClientTimeout(total=30)
+JOB_WORKERS = 4
+BATCH_MAX_LINKS = 1000
+UPLOAD_SIZE_LIMITS = {
+    'process_file': 8 * 1024 * 1024 * 1024,
+    'convert_csv_to_xml': 8 * 1024 * 1024 * 1024,
+    'convert_csv_to_json': 1024 * 1024 * 1024,
+    'convert_xml_to_json': 1024 * 1024 * 1024,
+}
+IN_MEMORY_UPLOAD_SIZE_LIMIT = 100 * 1024 * 1024
+FEED_ARCHIVE_MEMBER_SUFFIXES = ('.xml', '.yml')
+BATCH_CONCURRENCY = 32
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+BATCH_HOST_CONCURRENCY = 2
+CSV_STREAM_QUEUE_SIZE = 16
+STREAM_UNSUPPORTED_SUFFIXES = ('.csv', '.xlsx', '.xls', '.json', '.jpg', '.jpeg', '.png')
+extract_pool = None
+http_session = None
+feed_cache = FeedCache()
+converter_pool = ConverterPool()
+result_cache = ResultCache()
+artifact_store = ArtifactStore()
+artifact_sweeper = None
+artifact_compressions = set()
+fetch_strategies = StrategyMemory()
+job_store = JobStore()
+upload_store = UploadStore()
+job_queue = None
+job_workers = []
+job_progress = {}
+current_job_progress = contextvars.ContextVar('current_job_progress', default=None)
+current_csv_stream = contextvars.ContextVar('current_csv_stream', default=None)
+
+
 default_app = FastAPI()
 app = default_app
 templates = Jinja2Templates(directory="templates")
@@ -48,446 +111,118 @@ app.add_middleware(
 )
 
 
-class LinkData(BaseModel):
-    link_url: str
-    return_url: str = ""
-    preset_id: str = ""
-
-
-def clean_description(description):
-    if not description:
-        return ''
-    try:
-        soup = BeautifulSoup(description, 'html5lib')
-    except Exception:
-        try:
-            soup = BeautifulSoup(description, 'lxml')
-        except Exception:
-            soup = BeautifulSoup(description, 'html.parser')
-    allowed_tags = ['p', 'br']
-    for tag in soup.find_all(True):
-        if tag.name not in allowed_tags:
-            tag.unwrap()
-    for content in list(soup.contents):
-        if isinstance(content, str) and content.strip():
-            new_p = soup.new_tag('p')
-            new_p.string = content.strip()
-            content.replace_with(new_p)
-    return str(soup)
-
-
-def sanitize_name(name):
-    if not name:
-        return ""
-    sanitized = re.sub(r'[^\w\s\-\(\)\[\]\/\\,\.;:!?\'"«»„""`~@#$%^&*+=<>|№°]', '', name)
-    sanitized = re.sub(r'\s+', ' ', sanitized)
-    sanitized = re.sub(r'\(\s*([^)]+)\s*\)', r'(\1)', sanitized)
-    return sanitized.strip()
-
-def remove_duplicates_from_delimited_string(value, delimiter='///'):
-    if not value:
-        return ""
-    items = [item.strip() for item in value.split(delimiter) if item.strip()]
-    unique_items = []
-    for item in items:
-        if item not in unique_items:
-            unique_items.append(item)
-    return delimiter.join(unique_items)
-
-
-async def split_offers(xml_data, chunk_size, format_type):
-    root = ET.fromstring(xml_data)
-    if format_type == 'offer':
-        offers = root.findall('.//offer')
-    elif format_type == 'product':
-        offers = root.findall('.//product')
-    elif format_type == 'russian':
-        offers = root.findall('.//ЭлементСправочника')
-    elif format_type == 'service':
-        offers = root.findall('.//service') if root.findall('.//service') else [root]
-    else:
-        offers = []
-
-    for i in range(0, len(offers), chunk_size):
-        yield offers[i:i + chunk_size]
-
+@app.on_event("startup")
+def freeze_import_objects():
+    # Keep the objects created by imports out of full collections, which otherwise
+    # rescan them while converters build large trees and stall the event loop.
+    gc.freeze()
 
-async def process_offer(offer_elem, build_category_path, format_type):
-    offer_data = {}
 
-    for key, value in offer_elem.attrib.items():
-        offer_data[f"attr_{key}"] = value
+@app.on_event("startup")
+async def start_http_session():
+    get_http_session()
 
-    image_tags = {'picture', 'photo', 'optionalImages', 'image', 'images', 'img'}
 
-    for child in offer_elem:
-        if child.tag in image_tags:
-            continue
+@app.on_event("startup")
+async def start_job_workers():
+    global job_queue
+    job_queue = asyncio.Queue()
+    job_store.prune()
+    for job_id in job_store.unfinished():
+        job_queue.put_nowait(job_id)
+    job_workers.extend(asyncio.create_task(run_job_worker()) for _ in range(JOB_WORKERS))
 
-        for key, value in child.attrib.items():
-            column_name = f"{child.tag}_{key}"
-            if column_name in offer_data:
-                offer_data[column_name] += f"///{value}"
-            else:
-                offer_data[column_name] = value
 
-        if child.text and child.text.strip():
-            if child.tag in offer_data:
-                existing_value = offer_data[child.tag] + f"///{child.text.strip()}"
-                offer_data[child.tag] = remove_duplicates_from_delimited_string(existing_value)
-            else:
-                offer_data[child.tag] = child.text.strip()
+@app.on_event("startup")
+async def start_artifact_sweeper():
+    global artifact_sweeper
+    artifact_sweeper = asyncio.create_task(run_artifact_sweeper())
 
-        if child.tag == 'stock':
-            for stock_child in child:
-                stock_key = stock_child.tag
-                if stock_child.text and stock_child.text.strip():
-                    offer_data[stock_key] = stock_child.text.strip()
-                for attr_key, attr_value in stock_child.attrib.items():
-                    offer_data[f"{stock_key}_{attr_key}"] = attr_value
 
-    processed_elements = {offer_elem}
+@app.on_event("shutdown")
+def shutdown_extract_pool():
+    if extract_pool is not None:
+        extract_pool.shutdown(cancel_futures=True)
+    converter_pool.shutdown()
 
-    for child in offer_elem:
-        processed_elements.add(child)
 
-    for elem in offer_elem.iter():
-        if elem in processed_elements:
-            continue
+@app.on_event("shutdown")
+async def stop_job_workers():
+    for worker in job_workers:
+        worker.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    job_workers.clear()
+    job_store.close()
 
-        if elem.tag in image_tags:
-            continue
 
-        for key, value in elem.attrib.items():
-            column_name = f"{elem.tag}_{key}"
-            if column_name not in offer_data:
-                offer_data[column_name] = value
+@app.on_event("shutdown")
+async def stop_artifact_sweeper():
+    if artifact_sweeper is not None:
+        artifact_sweeper.cancel()
+        await asyncio.gather(artifact_sweeper, return_exceptions=True)
+    artifact_store.close()
 
-        if elem.text and elem.text.strip():
-            if elem.tag not in offer_data:
-                offer_data[elem.tag] = elem.text.strip()
 
-    if format_type == 'offer':
-        cid_elem = offer_elem.find('./categoryId')
-        if cid_elem is not None and cid_elem.text:
-            cid = cid_elem.text.strip()
-        else:
-            cid_elem = offer_elem.find('.//categoryId')
-            cid = cid_elem.text.strip() if cid_elem is not None and cid_elem.text else 'Undefined'
+@app.on_event("shutdown")
+async def close_http_session():
+    if http_session is not None:
+        await http_session.close()
 
-        category_path = build_category_path(cid)
-        offer_data['category_path'] = category_path
 
-        offer_data['categoryId'] = cid
-    else:
-        offer_data['category_path'] = 'Undefined'
-        offer_data['categoryId'] = 'Undefined'
-    excluded = ['param'] if format_type == 'offer' else ['photos', 'fabric', 'features', 'options']
-    image_tags = {'picture', 'photo', 'optionalImages', 'image', 'images', 'img'}
-
-    for child in offer_elem:
-        if child.tag not in excluded and child.tag not in image_tags:
-            val = child.text or ''
-            if child.tag.replace('.', '', 1).isdigit():
-                val = val.replace('.', ',')
-            if child.tag == 'name':
-                val = sanitize_name(val)
-            if child.tag == 'Size' and '?' in val:
-                val = val.replace('?', '').strip()
-
-            if child.tag not in offer_data or not offer_data[child.tag] or offer_data[child.tag] == 'Undefined':
-                offer_data[child.tag] = val
-    all_images = set()
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg']
-
-    for selector in ['.//photo', './/picture', './/image', './/img', './/optionalImages', './/images']:
-        for img_elem in offer_elem.findall(selector):
-            if img_elem.text and img_elem.text.strip():
-                image_url = img_elem.text.strip()
-                if (any(image_url.lower().endswith(ext) for ext in image_extensions)
-                    or 'img/' in image_url.lower()
-                    or image_url.startswith('http')):
-                    all_images.add(image_url)
-                    logger.info(f"Image found from tag {img_elem.tag}: {image_url}")
-
-    if format_type == 'product':
-        for offer_child in offer_elem.findall('.//offer'):
-            for selector in ['.//photo', './/picture', './/image', './/img', './/optionalImages']:
-                for img_elem in offer_child.findall(selector):
-                    if img_elem.text and img_elem.text.strip():
-                        image_url = img_elem.text.strip()
-                        if (any(image_url.lower().endswith(ext) for ext in image_extensions)
-                            or 'img/' in image_url.lower()
-                            or image_url.startswith('http')):
-                            all_images.add(image_url)
-
-    for elem in offer_elem.iter():
-        for attr_name, attr_value in elem.attrib.items():
-            if ('image' in attr_name.lower() or 'photo' in attr_name.lower()) and attr_value:
-                if (any(attr_value.lower().endswith(ext) for ext in image_extensions)
-                    or attr_value.startswith('http')):
-                    all_images.add(attr_value)
-
-    all_images = sorted(list(all_images))
-
-    if 'id' in offer_data:
-        product_id = offer_data['id']
-        logger.debug(f"Product ID {product_id}: found {len(all_images)} images")
-        if all_images:
-            for i, img in enumerate(all_images, 1):
-                logger.debug(f"  Image {i}: {img}")
-
-    if all_images:
-        offer_data['pictures'] = "///".join(all_images)
-        logger.debug(f"Final image string: {offer_data['pictures']}")
-    else:
-        offer_data['pictures'] = ""
-    params = {}
-    if format_type == 'offer':
-        for param_elem in offer_elem.findall('.//param'):
-            key = param_elem.get('name')
-            if not key:
-                continue
-            val = param_elem.text or ''
-            if ('размер' in key.lower() or 'size' in key.lower()) or (
-                    '?' in val and
-                (val.replace('?', '').strip().isdigit() or any(c.isdigit()
-                                                               for c in val))):
-                val = val.replace('?', '').strip()
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        http_session = aiohttp.ClientSession(
+            connector=connector, timeout=FETCH_TIMEOUT, cookie_jar=aiohttp.DummyCookieJar())
+    return http_session
 
-            clean_key = key.strip()
 
-            if clean_key.replace('.', '', 1).isdigit():
-                continue
+class LinkData(BaseModel):
+    link_url: str
+    return_url: str = ""
+    preset_id: str = ""
+    stream: bool = False
 
-            if clean_key in params:
-                params[clean_key] += f", {val}"
-            else:
-                params[clean_key] = val
 
-        for elem in offer_elem.iter():
-            if elem.tag.startswith('param_name_'):
-                key = elem.tag
-                val = elem.text or ''
+class UploadData(BaseModel):
+    filename: str
+    size: int
+    chunk_size: int = UPLOAD_CHUNK_SIZE
 
-                if ('размер' in key.lower() or 'size' in key.lower()) or (
-                        '?' in val and
-                    (val.replace('?', '').strip().isdigit() or any(c.isdigit()
-                                                                   for c in val))):
-                    val = val.replace('?', '').strip()
 
-                if key in offer_data:
-                    offer_data[key] += f", {val}"
-                else:
-                    offer_data[key] = val
-    else:
-        fab = offer_elem.find('.//fabric')
-        if fab is not None:
-            for elem in fab.findall('.//feature'):
-                name = elem.get('name')
-                if not name:
-                    continue
-                key = f"fabric_{name}"
-                val = elem.text or ''
-                if key in params:
-                    params[key] += f", {val}"
-                else:
-                    params[key] = val
-        feats = offer_elem.find('.//features')
-        if feats is not None:
-            for elem in feats.findall('.//feature'):
-                name = elem.get('name')
-                if not name:
-                    continue
-                key = f"feature_{name}"
-                val = elem.text or ''
-                if key in params:
-                    params[key] += f", {val}"
-                else:
-                    params[key] = val
-    offer_data.update(params)
-    desc_elem = offer_elem.find('.//description') if format_type == 'offer' else offer_elem.find('.//name')
-    if desc_elem is not None and desc_elem.text:
-        offer_data['description'] = clean_description(desc_elem.text)
+async def split_offers(root, chunk_size, format_type):
+    if format_type == 'offer':
+        offers = root.findall('.//offer')
+    elif format_type == 'product':
+        offers = root.findall('.//product')
+    elif format_type == 'russian':
+        offers = root.findall('.//ЭлементСправочника')
+    elif format_type == 'service':
+        offers = root.findall('.//service') if root.findall('.//service') else [root]
     else:
-        alt_desc_tags = ['.//desc', './/descr', './/description_full', './/full_description']
-        for tag in alt_desc_tags:
-            desc_elem = offer_elem.find(tag)
-            if desc_elem is not None and desc_elem.text:
-                offer_data['description'] = clean_description(desc_elem.text)
-                break
-        else:
-            offer_data['description'] = ""
-
-    if 'available' not in offer_data:
-        offer_data['available'] = '1'
-
-    return offer_data
-
-
-async def process_russian_xml(root):
-    offers = []
-
-    for element in root.findall('.//ЭлементСправочника'):
-        offer_data = {}
-
-        for child in element:
-            if child.tag == 'ТЧ':
-                tc_name = child.get('ИмяТабличнойЧасти', 'UnknownTC')
-                tc_data = []
-
-                for tc_element in child.findall('ЭлементТЧ'):
-                    tc_row = {}
-                    for tc_child in tc_element:
-                        if tc_child.text and tc_child.text.strip():
-                            tc_row[f"{tc_name}_{tc_child.tag}"] = tc_child.text.strip()
-                    if tc_row:
-                        tc_data.append(tc_row)
-
-                if tc_data:
-                    if tc_name == 'Остатки':
-                        stock_info = []
-                        total_stock = 0
-                        for row in tc_data:
-                            warehouse = row.get(f'{tc_name}_СкладНаименование', '')
-                            quantity = row.get(f'{tc_name}_КоличествоОстаток', '0')
-                            try:
-                                qty_num = float(quantity)
-                                total_stock += qty_num
-                                if qty_num > 0:
-                                    stock_info.append(f"{warehouse}: {quantity}")
-                            except:
-                                if quantity != '0':
-                                    stock_info.append(f"{warehouse}: {quantity}")
-
-                        offer_data['available'] = '1' if total_stock > 0 else '0'
-                        offer_data['stock_total'] = str(total_stock)
-                        offer_data['stock_details'] = "///".join(stock_info)
-
-                    elif tc_name == 'Цены':
-                        for row in tc_data:
-                            price_name = row.get(f'{tc_name}_Наименование', '')
-                            price_value = row.get(f'{tc_name}_Значение', '')
-                            if price_name and price_value:
-                                if price_name == 'Цена':
-                                    offer_data['price'] = price_value
-                                elif price_name == 'ЦенаСкидка' and price_value != '0':
-                                    offer_data['oldprice'] = offer_data.get('price', '')
-                                    offer_data['price'] = price_value
-
-                    elif tc_name == 'Материалы':
-                        values = []
-                        id_values = []
-                        for row in tc_data:
-                            name = row.get(f'{tc_name}_Наименование', '')
-                            if name and name not in values:
-                                values.append(name)
-                            material_id = row.get(f'{tc_name}_ID_Материала', '')
-                            if material_id and material_id not in id_values:
-                                id_values.append(material_id)
-
-                        if values:
-                            offer_data[tc_name.lower()] = "///".join(values)
-                        if id_values:
-                            existing_ids = offer_data.get('ID_Материала', '').split('///')
-                            existing_ids = [id.strip() for id in existing_ids if id.strip()]
-                            all_ids = existing_ids + id_values
-                            unique_ids = []
-                            for id_val in all_ids:
-                                if id_val not in unique_ids:
-                                    unique_ids.append(id_val)
-                            offer_data['ID_Материала'] = "///".join(unique_ids)
-                    elif tc_name in ['Стили', 'ГруппыСайта']:
-                        values = []
-                        for row in tc_data:
-                            name = row.get(f'{tc_name}_Наименование', '')
-                            if name and name not in values:
-                                values.append(name)
-
-                        if values:
-                            if tc_name == 'ГруппыСайта':
-                                offer_data['category_path'] = "///".join(values)
-                                offer_data['categoryId'] = values[0] if values else 'Undefined'
-                            else:
-                                offer_data[tc_name.lower()] = "///".join(values)
-
-            else:
-                if child.text and child.text.strip():
-                    value = child.text.strip()
-
-                    if child.tag == 'ОписаниеДляСайта' or child.tag == 'description':
-                        value = clean_description(value)
-                        offer_data['description'] = value
-                    elif child.tag == 'Наименование':
-                        value = sanitize_name(value)
-                        offer_data['name'] = value
-                    elif child.tag == 'ПолноеНазваниеСайт':
-                        offer_data['full_name'] = sanitize_name(value)
-                    elif child.tag == 'Артикул':
-                        offer_data['Артикул'] = value
-                        offer_data['vendor'] = value
-                        offer_data['vendorCode'] = value
-                    elif child.tag == 'ID_Материала':
-                        offer_data['ID_Материала'] = value
-                    elif child.tag in ['Глубина', 'Ширина', 'Высота', 'Вес']:
-                        offer_data[child.tag.lower()] = value
-                    elif child.tag == 'Цвет':
-                        offer_data['param_Цвет'] = value
-                    else:
-                        offer_data[child.tag] = value
-
-        if 'available' not in offer_data:
-            offer_data['available'] = '1'
+        offers = []
 
-        if 'category_path' not in offer_data:
-            offer_data['category_path'] = 'Undefined'
-            offer_data['categoryId'] = 'Undefined'
+    for i in range(0, len(offers), chunk_size):
+        yield offers[i:i + chunk_size]
 
-        if 'ID' in offer_data:
-            offer_data['id'] = offer_data['ID']
 
-        for key, value in offer_data.items():
-            if isinstance(value, str) and '///' in value:
-                offer_data[key] = remove_duplicates_from_delimited_string(value)
+async def process_offer(offer_elem, build_category_path, format_type):
+    return process_offer_element(offer_elem, build_category_path, format_type)
 
-        offers.append(offer_data)
 
+async def process_russian_xml(root):
+    offers = [process_russian_element(element) for element in root.findall('.//ЭлементСправочника')]
     return {"offers": offers}
 
 
 async def process_service_xml(root):
-    offers = []
-
-    for service_elem in root.findall('.//service'):
-        service_data = {}
-
-        for attr_name, attr_value in service_elem.attrib.items():
-            service_data[attr_name] = attr_value
-
-        for child in service_elem:
-            if child.text and child.text.strip():
-                service_data[child.tag] = child.text.strip()
-
-            for attr_name, attr_value in child.attrib.items():
-                column_name = f"{child.tag}_{attr_name}"
-                service_data[column_name] = attr_value
-
-        if 'available' not in service_data:
-            service_data['available'] = '1'
-
-        if 'category_path' not in service_data:
-            service_data['category_path'] = service_data.get('name', 'Service')
-
-        if 'categoryId' not in service_data:
-            service_data['categoryId'] = service_data.get('id', service_data.get('sid', 'service'))
-
-        if 'name' in service_data:
-            service_data['name'] = sanitize_name(service_data['name'])
-
-        service_data['service_type'] = 'verification_service'
-
-        offers.append(service_data)
-
+    offers = [process_service_element(service_elem) for service_elem in root.findall('.//service')]
     return {"offers": offers}
 
 
@@ -501,22 +236,23 @@ async def process_offers_chunk(offers_chunk, build_category_path, format_type):
     return {"offers": offers}
 
 
-async def process_csv_to_xml(csv_data, source_name, xml_format='yandex_market'):
+async def process_csv_to_xml(csv_data, source_name, xml_format='yandex_market', encoding=None):
     if source_name is None or source_name == "":
         source_name = "converted_data"
     logger.info(f"Converting CSV to XML: {source_name}")
 
-    csv_data_clean = csv_data.strip()
-    if not csv_data_clean:
+    head = input_utils.decode_head(csv_data, encoding).strip()
+    if not head:
         raise ValueError("CSV data is empty")
 
     delimiter = ';'
-    sample = csv_data_clean.split('\n')[0] if '\n' in csv_data_clean else csv_data_clean
+    sample = head.split('\n')[0]
     if sample.count(',') > sample.count(';'):
         delimiter = ','
 
-    csv_reader = csv.DictReader(csv_data_clean.split('\n'), delimiter=delimiter)
-    rows = list(csv_reader)
+    with input_utils.open_text(csv_data, encoding) as stream:
+        csv_reader = csv.DictReader(input_utils.iter_stripped_lines(stream), delimiter=delimiter)
+        rows = list(csv_reader)
 
     if not rows:
         raise ValueError("CSV file is empty or invalid")
@@ -601,7 +337,7 @@ async def process_csv_to_xml(csv_data, source_name, xml_format='yandex_market'):
     ET.indent(root, space="  ", level=0)
     xml_string = ET.tostring(root, encoding='unicode', xml_declaration=True)
 
-    os.makedirs("data_files", exist_ok=True)
+    os.makedirs(output_dir(), exist_ok=True)
 
     if source_name and source_name.endswith('.csv'):
         base_name = source_name[:-4]
@@ -611,7 +347,7 @@ async def process_csv_to_xml(csv_data, source_name, xml_format='yandex_market'):
         base_name = "converted_data"
 
     filename = f"{base_name}_{xml_format}.xml"
-    path = os.path.join("data_files", filename)
+    path = os.path.join(output_dir(), filename)
 
     with open(path, 'w', encoding='utf-8') as f:
         f.write(xml_string)
@@ -619,15 +355,14 @@ async def process_csv_to_xml(csv_data, source_name, xml_format='yandex_market'):
     return path, filename
 
 
-async def process_csv_to_excel(csv_data, source_name):
+async def process_csv_to_excel(csv_data, source_name, encoding=None):
     logger.info(f"=== process_csv_to_excel started ===")
     logger.info(f"Source name: {source_name}")
-    logger.info(f"CSV data length: {len(csv_data)} characters")
-    logger.info(f"CSV data preview (first 500 chars): {csv_data[:500]}")
+    logger.info(f"CSV data length: {len(csv_data)} {'characters' if isinstance(csv_data, str) else 'bytes'}")
+    head = input_utils.decode_head(csv_data, encoding)
+    logger.info(f"CSV data preview (first 500 chars): {head[:500]}")
 
     try:
-        from io import StringIO
-
         delimiters = [';', ',', '\t']
         rows = None
         successful_delimiter = None
@@ -635,8 +370,8 @@ async def process_csv_to_excel(csv_data, source_name):
         for delimiter in delimiters:
             try:
                 logger.info(f"Trying delimiter: '{delimiter}'")
-                csv_reader = csv.DictReader(StringIO(csv_data), delimiter=delimiter)
-                rows = list(csv_reader)
+                with input_utils.open_text(csv_data, encoding) as stream:
+                    rows = list(csv.DictReader(stream, delimiter=delimiter))
                 logger.info(f"With delimiter '{delimiter}': found {len(rows)} rows")
                 if rows and len(rows[0]) > 1:
                     successful_delimiter = delimiter
@@ -653,7 +388,7 @@ async def process_csv_to_excel(csv_data, source_name):
             logger.error(error_msg)
             raise ValueError(error_msg)
 
-        if len(rows[0]) == 1 and list(rows[0].keys())[0] == csv_data.strip().split('\n')[0]:
+        if len(rows[0]) == 1 and list(rows[0].keys())[0] == head.strip().split('\n')[0]:
             error_msg = f"CSV file appears to have no column separation. Check delimiter. Used delimiter: '{successful_delimiter}'"
             logger.error(error_msg)
             raise ValueError(error_msg)
@@ -680,7 +415,7 @@ async def process_csv_to_excel(csv_data, source_name):
             logger.error(error_msg)
             raise ValueError(error_msg)
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         if source_name and source_name.endswith('.csv'):
             base_name = source_name[:-4]
@@ -690,7 +425,7 @@ async def process_csv_to_excel(csv_data, source_name):
             base_name = "converted_data"
 
         filename = f"{base_name}.xlsx"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
         logger.info(f"Creating Excel file: {path}")
 
         try:
@@ -738,7 +473,7 @@ async def process_excel_to_csv(excel_data, source_name):
 
     df = df.fillna('')
 
-    os.makedirs("data_files", exist_ok=True)
+    os.makedirs(output_dir(), exist_ok=True)
 
     if source_name.endswith(('.xlsx', '.xls')):
         base_name = os.path.splitext(source_name)[0]
@@ -746,18 +481,18 @@ async def process_excel_to_csv(excel_data, source_name):
         base_name = source_name
 
     filename = f"{base_name}.csv"
-    path = os.path.join("data_files", filename)
+    path = os.path.join(output_dir(), filename)
 
     df.to_csv(path, sep=';', index=False, encoding='utf-8-sig')
 
     return path, filename
 
 
-async def process_json_to_csv(json_data, source_name):
+async def process_json_to_csv(json_data, source_name, encoding=None):
     logger.info(f"Converting JSON to CSV: {source_name}")
 
     try:
-        data = json.loads(json_data)
+        data = json.loads(input_utils.decode_text(json_data, encoding))
     except json.JSONDecodeError as e:
         raise ValueError(f"Invalid JSON format: {str(e)}")
 
@@ -779,7 +514,7 @@ async def process_json_to_csv(json_data, source_name):
     if df.empty:
         raise ValueError("No data found in JSON")
 
-    os.makedirs("data_files", exist_ok=True)
+    os.makedirs(output_dir(), exist_ok=True)
 
     if source_name.endswith('.json'):
         base_name = source_name[:-5]
@@ -787,21 +522,21 @@ async def process_json_to_csv(json_data, source_name):
         base_name = source_name
 
     filename = f"{base_name}.csv"
-    path = os.path.join("data_files", filename)
+    path = os.path.join(output_dir(), filename)
 
     df.to_csv(path, sep=';', index=False, encoding='utf-8-sig')
 
     return path, filename
 
 
-async def process_csv_to_json(csv_data, source_name, json_format='array'):
+async def process_csv_to_json(csv_data, source_name, json_format='array', encoding=None):
     if source_name is None or source_name == "":
         source_name = "converted_data"
     logger.info(f"Converting CSV to JSON: {source_name}")
 
-    from io import StringIO
-    csv_reader = csv.DictReader(StringIO(csv_data), delimiter=';')
-    rows = list(csv_reader)
+    with input_utils.open_text(csv_data, encoding) as stream:
+        csv_reader = csv.DictReader(stream, delimiter=';')
+        rows = list(csv_reader)
 
     if not rows:
         raise ValueError("CSV file is empty or invalid")
@@ -817,7 +552,7 @@ async def process_csv_to_json(csv_data, source_name, json_format='array'):
     else:
         json_data = rows
 
-    os.makedirs("data_files", exist_ok=True)
+    os.makedirs(output_dir(), exist_ok=True)
 
     if source_name and source_name.endswith('.csv'):
         base_name = source_name[:-4]
@@ -827,7 +562,7 @@ async def process_csv_to_json(csv_data, source_name, json_format='array'):
         base_name = "converted_data"
 
     filename = f"{base_name}.json"
-    path = os.path.join("data_files", filename)
+    path = os.path.join(output_dir(), filename)
 
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(json_data, f, ensure_ascii=False, indent=2)
@@ -835,7 +570,7 @@ async def process_csv_to_json(csv_data, source_name, json_format='array'):
     return path, filename
 
 
-async def process_xml_to_json(xml_data, source_name):
+async def process_xml_to_json(xml_data, source_name, encoding=None):
     logger.info(f"Converting XML to JSON: {source_name}")
 
     def xml_to_dict(element):
@@ -862,12 +597,12 @@ async def process_xml_to_json(xml_data, source_name):
         return result
 
     try:
-        root = ET.fromstring(xml_data)
+        root = input_utils.parse_xml(xml_data, encoding)
         json_data = {root.tag: xml_to_dict(root)}
     except ET.ParseError as e:
         raise ValueError(f"Invalid XML format: {str(e)}")
 
-    os.makedirs("data_files", exist_ok=True)
+    os.makedirs(output_dir(), exist_ok=True)
 
     if source_name.endswith('.xml'):
         base_name = source_name[:-4]
@@ -875,7 +610,7 @@ async def process_xml_to_json(xml_data, source_name):
         base_name = source_name
 
     filename = f"{base_name}.json"
-    path = os.path.join("data_files", filename)
+    path = os.path.join(output_dir(), filename)
 
     with open(path, 'w', encoding='utf-8') as f:
         json.dump(json_data, f, ensure_ascii=False, indent=2)
@@ -892,7 +627,7 @@ async def process_jpg_to_png(image_data, source_name):
         if image.mode != 'RGB' and image.mode != 'RGBA':
             image = image.convert('RGB')
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         if source_name.lower().endswith(('.jpg', '.jpeg')):
             base_name = os.path.splitext(source_name)[0]
@@ -900,7 +635,7 @@ async def process_jpg_to_png(image_data, source_name):
             base_name = source_name
 
         filename = f"{base_name}.png"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
 
         image.save(path, 'PNG', optimize=True)
 
@@ -959,7 +694,7 @@ async def process_pdf_to_csv(pdf_data, source_name, extraction_method='pdfplumbe
 
         combined_df = pd.concat(all_tables, ignore_index=True)
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         if source_name.lower().endswith('.pdf'):
             base_name = source_name[:-4]
@@ -967,7 +702,7 @@ async def process_pdf_to_csv(pdf_data, source_name, extraction_method='pdfplumbe
             base_name = source_name
 
         filename = f"{base_name}_tables.csv"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
 
         combined_df.to_csv(path, sep=';', index=False, encoding='utf-8-sig')
 
@@ -1033,7 +768,7 @@ async def process_pdf_to_json(pdf_data, source_name):
                         "text": page_data["text"]
                     })
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         if source_name.lower().endswith('.pdf'):
             base_name = source_name[:-4]
@@ -1041,7 +776,7 @@ async def process_pdf_to_json(pdf_data, source_name):
             base_name = source_name
 
         filename = f"{base_name}_data.json"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
 
         with open(path, 'w', encoding='utf-8') as f:
             json.dump(extracted_data, f, ensure_ascii=False, indent=2)
@@ -1053,18 +788,18 @@ async def process_pdf_to_json(pdf_data, source_name):
         raise ValueError(f"Error extracting data from PDF: {str(e)}")
 
 
-async def process_csv_to_pdf(csv_data, source_name, report_style='table'):
+async def process_csv_to_pdf(csv_data, source_name, report_style='table', encoding=None):
     logger.info(f"Converting CSV to PDF: {source_name}")
 
     try:
-        from io import StringIO
-        csv_reader = csv.DictReader(StringIO(csv_data), delimiter=';')
-        rows = list(csv_reader)
+        with input_utils.open_text(csv_data, encoding) as stream:
+            csv_reader = csv.DictReader(stream, delimiter=';')
+            rows = list(csv_reader)
 
         if not rows:
             raise ValueError("CSV file is empty or invalid")
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         if source_name.lower().endswith('.csv'):
             base_name = source_name[:-4]
@@ -1072,7 +807,7 @@ async def process_csv_to_pdf(csv_data, source_name, report_style='table'):
             base_name = source_name
 
         filename = f"{base_name}_report.pdf"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
 
         doc = SimpleDocTemplate(path, pagesize=A4, rightMargin=30, leftMargin=30,
                               topMargin=30, bottomMargin=18)
@@ -1186,11 +921,11 @@ async def process_image_to_pdf(image_data, source_name):
         elif image.mode != 'RGB':
             image = image.convert('RGB')
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         base_name = os.path.splitext(source_name)[0]
         filename = f"{base_name}.pdf"
-        path = os.path.join("data_files", filename)
+        path = os.path.join(output_dir(), filename)
 
         max_width = 595
         max_height = 842
@@ -1247,7 +982,7 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
     try:
         import fitz
 
-        os.makedirs("data_files", exist_ok=True)
+        os.makedirs(output_dir(), exist_ok=True)
 
         base_name = os.path.splitext(source_name)[0]
 
@@ -1271,11 +1006,11 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
                     image = image.convert('RGB')
 
                 filename = f"{base_name}.jpg"
-                path = os.path.join("data_files", filename)
+                path = os.path.join(output_dir(), filename)
                 image.save(path, 'JPEG', quality=95, optimize=True)
             else:
                 filename = f"{base_name}.png"
-                path = os.path.join("data_files", filename)
+                path = os.path.join(output_dir(), filename)
                 image.save(path, 'PNG', optimize=True)
 
             pdf_document.close()
@@ -1285,7 +1020,7 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
             import zipfile
 
             zip_filename = f"{base_name}_images.zip"
-            zip_path = os.path.join("data_files", zip_filename)
+            zip_path = os.path.join(output_dir(), zip_filename)
 
             with zipfile.ZipFile(zip_path, 'w') as zip_file:
                 for page_num in range(len(pdf_document)):
@@ -1336,11 +1071,11 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
                         image = image.convert('RGB')
 
                     filename = f"{base_name}.jpg"
-                    path = os.path.join("data_files", filename)
+                    path = os.path.join(output_dir(), filename)
                     image.save(path, 'JPEG', quality=95, optimize=True)
                 else:
                     filename = f"{base_name}.png"
-                    path = os.path.join("data_files", filename)
+                    path = os.path.join(output_dir(), filename)
                     image.save(path, 'PNG', optimize=True)
 
                 return path, filename
@@ -1348,7 +1083,7 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
                 import zipfile
 
                 zip_filename = f"{base_name}_images.zip"
-                zip_path = os.path.join("data_files", zip_filename)
+                zip_path = os.path.join(output_dir(), zip_filename)
 
                 with zipfile.ZipFile(zip_path, 'w') as zip_file:
                     for i, image in enumerate(images):
@@ -1381,74 +1116,83 @@ async def process_pdf_to_image(pdf_data, source_name, output_format='png', dpi=3
         raise ValueError(f"Error converting PDF to image: {str(e)}")
 
 
-async def process_xml_data(xml_data, source_name, target_node="auto"):
+async def process_xml_data(xml_data, source_name, target_node="auto", streaming=None, parallel=None, encoding=None):
     logger.info(f"Processing data from: {source_name}")
-    logger.info(f"Data length: {len(xml_data)} characters")
 
-    logger.info(f"First 500 characters of response: {xml_data[:500]}")
+    if isinstance(xml_data, str):
+        logger.info(f"Data length: {len(xml_data)} characters")
+        xml_data_clean = xml_data.strip()
+        if xml_data_clean.startswith('\ufeff'):
+            xml_data_clean = xml_data_clean[1:]
+        sniffer = feed_utils.TextSniffer(xml_data_clean)
+    elif hasattr(xml_data, 'read'):
+        head = xml_data.read(input_utils.SNIFF_SIZE)
+        encoding = encoding or input_utils.detect_encoding(head)
+        logger.info(f"Data is a stream, encoding: {encoding}")
+        xml_data.seek(len(head) - len(input_utils.strip_leading_whitespace(head)))
+        xml_data_clean = xml_data
+        sniffer = feed_utils.TextSniffer(xml_data_clean, encoding=encoding)
+    else:
+        encoding = encoding or input_utils.detect_encoding(xml_data)
+        logger.info(f"Data length: {len(xml_data)} bytes, encoding: {encoding}")
+        xml_data_clean = input_utils.strip_leading_whitespace(xml_data)
+        sniffer = feed_utils.TextSniffer(xml_data_clean, encoding=encoding)
 
-    data_lower = xml_data.strip().lower()
-    if data_lower.startswith('<html') or data_lower.startswith('<!doctype html'):
+    logger.info(f"First 500 characters of response: {sniffer.prefix[:500]}")
+
+    if sniffer.head.startswith('<html') or sniffer.head.startswith('<!doctype html'):
         raise ValueError(f"Data contains HTML page instead of XML/YML file.")
 
-    if (('error' in data_lower or 'not found' in data_lower or '404' in data_lower) and
-        not xml_data.strip().startswith('<?xml') and
-        not any(tag in data_lower for tag in ['<yml_catalog', '<catalog', '<offers', '<products', '<shop', '<корневой'])):
-        logger.error(f"Error detected in response. Content preview: {xml_data[:200]}")
+    if (not sniffer.prefix.startswith('<?xml') and
+        not sniffer.contains('<yml_catalog', '<catalog', '<offers', '<products', '<shop', '<корневой') and
+        sniffer.contains('error', 'not found', '404')):
+        logger.error(f"Error detected in response. Content preview: {sniffer.prefix[:200]}")
         raise ValueError(f"Data contains error page.")
 
     logger.info("Processing as XML file")
 
-    xml_data_clean = xml_data.strip()
-
-    if xml_data_clean.startswith('\ufeff'):
-        xml_data_clean = xml_data_clean[1:]
-
-    if not xml_data_clean.startswith('<'):
+    if not sniffer.prefix.startswith('<'):
         raise ValueError(f"Received data is not an XML file. Make sure the URL leads to a valid XML or YML file.")
 
-    xml_lower = xml_data.lower()
-    has_yml_catalog = '<yml_catalog' in xml_lower
-    has_catalog = '<catalog' in xml_lower
-    has_offers = '<offers' in xml_lower or '<offer' in xml_lower
-    has_products = '<products' in xml_lower or '<product' in xml_lower
-    has_shop = '<shop' in xml_lower
-    has_categories = '<categories' in xml_lower or '<category' in xml_lower
-    has_russian_format = '<корневой' in xml_lower or '<элементсправочника' in xml_lower
-    has_service_format = '<service' in xml_lower
-
-    has_valid_structure = (has_yml_catalog or has_catalog or has_products or
-                          has_shop or has_offers or has_categories or has_russian_format or has_service_format)
+    has_valid_structure = sniffer.contains(
+        '<yml_catalog', '<catalog', '<offers', '<offer', '<products', '<product', '<shop',
+        '<categories', '<category', '<корневой', '<элементсправочника', '<service')
 
     if not has_valid_structure:
         raise ValueError(f"XML file does not contain expected elements (yml_catalog, catalog, offers, products, shop, categories, Russian format, or service format). This may not be a valid XML catalog file.")
 
+    is_stream = hasattr(xml_data_clean, 'read')
+    data_start = xml_data_clean.tell() if is_stream else 0
+    if streaming is None:
+        streaming = is_stream or len(xml_data_clean) >= STREAMING_MIN_SIZE
+    if parallel is None:
+        parallel = not is_stream and EXTRACT_WORKERS > 1 and len(xml_data_clean) >= PARALLEL_MIN_SIZE
+    if streaming or parallel:
+        xml_source = xml_data_clean
+        if not isinstance(xml_source, str):
+            xml_source = input_utils.open_text(xml_source, encoding)
+        try:
+            return await process_xml_stream(xml_source, source_name, target_node, parallel)
+        except ET.ParseError as e:
+            logger.error(f"Streaming XML parsing failed, falling back to full parse: {str(e)}", exc_info=True)
+            if current_csv_stream.get() is not None:
+                current_csv_stream.get().reset()
+
     try:
         logger.info("Starting XML parsing...")
-        xml_data = xml_data_clean
-
-        if xml_data.startswith('\ufeff'):
-            xml_data = xml_data[1:]
-            logger.info("Removed BOM")
-
-        import re
-        original_length = len(xml_data)
-        xml_data = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', xml_data)
-        if len(xml_data) != original_length:
-            logger.info(f"Removed {original_length - len(xml_data)} control characters")
-
-        root = ET.fromstring(xml_data)
+        if is_stream:
+            xml_data_clean.seek(data_start)
+        root = input_utils.parse_xml(xml_data_clean, encoding)
         logger.info("XML parsed successfully")
     except ET.ParseError as e:
         logger.error(f"Initial XML parsing failed: {str(e)}", exc_info=True)
+        if is_stream:
+            xml_data_clean.seek(data_start)
+            xml_data_clean = xml_data_clean.read()
         try:
-            logger.info("Attempting to fix XML issues...")
-            xml_data = re.sub(r'&(?![a-zA-Z0-9#]+;)', '&amp;', xml_data)
-
-            xml_data = re.sub(r'[^\x09\x0A\x0D\x20-\uD7FF\uE000-\uFFFD]', '', xml_data)
-
-            root = ET.fromstring(xml_data)
-            logger.info("XML parsing successful after cleanup")
+            logger.info("Attempting to recover from XML errors...")
+            root = feed_utils.parse_recovering(xml_data_clean, input_utils.parser_encoding(encoding))
+            logger.info("XML parsing successful after recovery")
         except ET.ParseError as e2:
             logger.error(f"XML parsing failed even after cleanup: {str(e2)}", exc_info=True)
             error_location = str(e2)
@@ -1461,15 +1205,8 @@ async def process_xml_data(xml_data, source_name, target_node="auto"):
             raise ValueError(f"Error processing XML file: {str(e3)}")
 
     if target_node == "auto":
-        if root.findall('.//offer'):
-            format_type = 'offer'
-        elif root.findall('.//product'):
-            format_type = 'product'
-        elif root.findall('.//ЭлементСправочника'):
-            format_type = 'russian'
-        elif root.findall('.//service') or root.tag == 'service':
-            format_type = 'service'
-        else:
+        format_type = detect_feed_format(root, sniffer.prefix, source_name)
+        if format_type is None:
             raise ValueError("Unsupported XML format, auto-detection failed.")
     else:
         format_type = target_node
@@ -1483,32 +1220,7 @@ async def process_xml_data(xml_data, source_name, target_node="auto"):
             categories[cid] = cat.text or 'Undefined'
             if pid:
                 parents[cid] = pid
-
-        def build_category_path(cid):
-            if not cid or cid == 'Undefined':
-                return 'Undefined'
-
-            path = []
-            current_cid = cid
-            visited = set()
-
-            while current_cid and current_cid in categories and current_cid not in visited:
-                visited.add(current_cid)
-                category_name = categories.get(current_cid, 'Undefined')
-                if category_name and category_name != 'Undefined':
-                    path.append(category_name)
-                current_cid = parents.get(current_cid)
-
-            if not path:
-                if cid in categories:
-                    return categories[cid]
-                return 'Undefined'
-
-            return '///'.join(reversed(path))
-    else:
-
-        def build_category_path(cid):
-            return 'Undefined'
+    build_category_path = make_category_path_builder(categories, parents)
 
     if format_type == 'russian':
         results = [await process_russian_xml(root)]
@@ -1516,31 +1228,166 @@ async def process_xml_data(xml_data, source_name, target_node="auto"):
         results = [await process_service_xml(root)]
     else:
         tasks = []
-        async for chunk in split_offers(xml_data, 100, format_type):
+        async for chunk in split_offers(root, 100, format_type):
             tasks.append(
                 asyncio.create_task(
                     process_offers_chunk(chunk, build_category_path, format_type)))
         results = await asyncio.gather(*tasks)
-    combined = {
-        "offers": [],
-        "categories": categories,
-        "category_parents": parents
-    }
+    csv_stream = current_csv_stream.get()
+    store = OfferStore() if csv_stream is None else csv_stream
+    track_job_records(store)
     for res in results:
-        combined["offers"].extend(res["offers"])
-    os.makedirs("data_files", exist_ok=True)
+        store.extend(res["offers"])
+
+    if csv_stream is not None:
+        csv_stream.finish()
+        return None, output_csv_filename(source_name)
+    path, filename = build_output_csv_path(source_name)
+    write_offers_csv(store, path)
+    return path, filename
+
+
+async def process_xml_stream(xml_source, source_name, target_node="auto", parallel=False):
+    logger.info(f"Streaming XML data from: {source_name}")
+
+    format_type, categories, parents = feed_utils.scan_feed_header(xml_source, target_node)
+    if format_type is None:
+        raise ValueError("Unsupported XML format, auto-detection failed.")
+    if target_node == "auto" and source_name.startswith('http'):
+        feed_utils.remember_format(source_name, format_type)
+    if format_type != 'offer':
+        categories, parents = {}, {}
+    build_category_path = make_category_path_builder(categories, parents)
+
+    csv_stream = current_csv_stream.get()
+    if csv_stream is not None:
+        await spool_feed_records(csv_stream, xml_source, format_type, build_category_path, parallel)
+        logger.info(f"Streamed {csv_stream.row_count} records in {format_type} format as CSV")
+        csv_stream.finish()
+        return None, output_csv_filename(source_name)
+
+    with OfferSpool() as store:
+        track_job_records(store)
+        await spool_feed_records(store, xml_source, format_type, build_category_path, parallel)
+        logger.info(f"Streamed {store.row_count} records in {format_type} format")
+
+        path, filename = build_output_csv_path(source_name)
+        write_offers_csv(store, path)
+    return path, filename
+
 
+def track_job_records(store):
+    progress = current_job_progress.get()
+    if progress is not None:
+        progress.store = store
+
+
+async def spool_feed_records(store, xml_source, format_type, build_category_path, parallel):
+    if format_type in feed_utils.FORMAT_TAGS:
+        feed_utils.rewind(xml_source)
+        elements = feed_utils.iter_feed_elements(xml_source, format_type)
+        if parallel:
+            async for row in extract_records_parallel(elements, format_type):
+                if format_type == 'offer':
+                    row['category_path'] = build_category_path(row['categoryId'])
+                store.add(row)
+        else:
+            for elem in elements:
+                row = process_record(elem, build_category_path, format_type)
+                if row is not None:
+                    store.add(row)
+
+
+def detect_feed_format(root, head, source_name):
+    cache_key = source_name if source_name.startswith('http') else None
+    if cache_key:
+        format_type = feed_utils.cached_format(cache_key)
+        if format_type and feed_utils.has_format(root, format_type):
+            logger.info(f"Using cached format {format_type} for {source_name}")
+            return format_type
+
+    format_type = feed_utils.sniff_format(head) or feed_utils.detect_format(root)
+    if cache_key and format_type:
+        feed_utils.remember_format(cache_key, format_type)
+    return format_type
+
+
+def get_extract_pool():
+    global extract_pool
+    if extract_pool is None:
+        extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return extract_pool
+
+
+async def extract_records_parallel(elements, format_type):
+    loop = asyncio.get_running_loop()
+    pool = get_extract_pool()
+    pending = deque()
+    for blob in feed_utils.iter_serialized_chunks(elements):
+        pending.append(loop.run_in_executor(pool, process_records_blob, blob, format_type))
+        if len(pending) >= EXTRACT_WORKERS * 2:
+            for row in await pending.popleft():
+                yield row
+    while pending:
+        for row in await pending.popleft():
+            yield row
+
+
+def make_category_path_builder(categories, parents):
+    paths = feed_utils.load_category_paths(categories, parents)
+
+    def build_category_path(cid):
+        if not cid or cid == 'Undefined':
+            return 'Undefined'
+        return paths.get(cid, 'Undefined')
+
+    return build_category_path
+
+
+async def convert_archive(archive_file, source_name, convert_member, suffixes=input_utils.ARCHIVE_MEMBER_SUFFIXES):
+    with zipfile.ZipFile(archive_file) as archive:
+        members = input_utils.archive_members(archive, suffixes)
+        if not members:
+            raise ValueError("Archive does not contain any XML/YML or CSV files.")
+        logger.info(f"Converting {len(members)} archive members from {source_name}")
+
+        def run_member(info):
+            with archive.open(info) as member:
+                return asyncio.run(convert_member(member, info.filename.replace('/', '_'), info.file_size))
+
+        results = await asyncio.gather(*(asyncio.to_thread(run_member, info) for info in members))
+
+    if len(results) == 1:
+        return results[0]
+    path, filename = build_output_csv_path(source_name)
+    path, filename = os.path.splitext(path)[0] + '.zip', os.path.splitext(filename)[0] + '.zip'
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for member_path, member_filename in results:
+                bundle.write(member_path, member_filename)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path, filename
+
+
+def output_csv_filename(source_name):
     if source_name.startswith('http'):
         domain = urlparse(source_name).netloc.replace("www.", "")
-        filename = f"{domain.replace('.','_')}.csv"
-    else:
-        base_name = os.path.splitext(source_name)[0]
-        filename = f"{base_name.replace('.','_').replace(' ','_')}.csv"
+        return f"{domain.replace('.','_')}.csv"
+    base_name = os.path.splitext(source_name)[0]
+    return f"{base_name.replace('.','_').replace(' ','_')}.csv"
+
+
+def build_output_csv_path(source_name):
+    os.makedirs(output_dir(), exist_ok=True)
+    filename = output_csv_filename(source_name)
+    return os.path.join(output_dir(), filename), filename
+
 
-    path = os.path.join("data_files", filename)
-    category_names = set()
-    for row in combined["offers"]:
-        category_names.update(k for k in row.keys() if k is not None)
+def select_csv_fields(store):
     excluded = [
         'param', 'param_name', 'param_unit', 'delivery-options',
         'delivery_options', 'delivery_options_xml', 'option_cost',
@@ -1551,194 +1398,293 @@ async def process_xml_data(xml_data, source_name, target_node="auto"):
         'delivery_options@order-before'
     ]
 
-    undefined_only_cols = set()
-    for col in category_names:
-        if col not in excluded:
-            col_values = [offer.get(col, '') for offer in combined["offers"]]
-            unique_values = set(val for val in col_values if val and val.strip())
-            if not unique_values or unique_values == {'Undefined'}:
-                undefined_only_cols.add(col)
+    undefined_only_cols = store.undefined_only_columns()
 
-    fields = [
-        col for col in sorted(category_names)
+    return [
+        col for col in sorted(store.columns)
         if (col not in excluded and col not in undefined_only_cols and not col.replace('.', '', 1).isdigit()) or col in important
     ]
-    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
-        writer = csv.DictWriter(f, fieldnames=fields, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-        writer.writeheader()
-        for offer in combined["offers"]:
-            filtered = {k: v for k, v in offer.items() if k not in excluded}
-            row_data = {}
-            for field in fields:
-                if field in filtered:
-                    v = filtered[field]
-                    if isinstance(v, str):
-                        if ('размер' in field.lower() or 'size' in field.lower() or field == 'Размер'):
-                            v = v.replace('?', '').strip()
-                        if field == 'ROOM_TYPE' or field == 'PURPOSE':
-                            v = v.replace(', ', '///')
-                        v = v.replace('"', '""').replace('\n', ' ').replace('\r', ' ').strip()
-                    row_data[field] = v
-            writer.writerow(row_data)
-    return path, filename
+
+
+def write_offers_csv(store, path):
+    fields = select_csv_fields(store)
+    encode_row = make_row_encoder(fields)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with open(fd, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=';', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(fields)
+            writer.writerows(map(encode_row, store.iter_rows(fields)))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def make_row_encoder(fields):
+    size_fields = [
+        'размер' in field.lower() or 'size' in field.lower() or field == 'Размер'
+        for field in fields
+    ]
+    list_fields = [field == 'ROOM_TYPE' or field == 'PURPOSE' for field in fields]
+    special = [i for i in range(len(fields)) if size_fields[i] or list_fields[i]]
+
+    def encode_row(values):
+        for i, v in enumerate(values):
+            if not v or v.__class__ is not str:
+                continue
+            if '"' in v:
+                v = v.replace('"', '""')
+            if '\n' in v or '\r' in v:
+                v = v.replace('\n', ' ').replace('\r', ' ')
+            values[i] = v.strip()
+        return values
+
+    def encode_special_row(values):
+        for i in special:
+            v = values[i]
+            if v and v.__class__ is str:
+                if size_fields[i]:
+                    v = v.replace('?', '').strip()
+                if list_fields[i]:
+                    v = v.replace(', ', '///')
+                values[i] = v
+        return encode_row(values)
+
+    return encode_special_row if special else encode_row
+
+
+def starts_like_feed(content, encoding):
+    head = input_utils.decode_head(content, encoding, 1024).strip()
+    return head.startswith('<?xml') or head.startswith('<yml_catalog')
+
+
+async def read_response_head(response, size):
+    head = bytearray()
+    while len(head) < size:
+        chunk = await response.content.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return bytes(head)
+
+
+async def fetch_feed(session, link_url, headers, target_node="auto"):
+    streaming_csv = current_csv_stream.get() is not None
+    cached = None if streaming_csv else feed_cache.lookup(link_url, target_node)
+    if cached is not None:
+        headers = {**headers, **feed_cache.conditional_headers(cached)}
+
+    async with session.get(link_url, headers=headers, allow_redirects=True) as response:
+        if response.status == 304 and cached is not None:
+            path, filename = build_output_csv_path(link_url)
+            if cached['suffix'] != '.csv':
+                path = os.path.splitext(path)[0] + cached['suffix']
+                filename = os.path.splitext(filename)[0] + cached['suffix']
+            if await asyncio.to_thread(feed_cache.restore, cached, path):
+                logger.info(f"{link_url} not modified, serving cached {filename}")
+                return response.status, (path, filename)
+        if response.status != 200:
+            return response.status, None
+
+        head = await read_response_head(response, input_utils.SNIFF_SIZE)
+        compression = input_utils.detect_compression(head)
+        encoding = None if compression else input_utils.detect_encoding(head, response.charset)
+        if not compression and not starts_like_feed(head, encoding):
+            return response.status, None
+
+        content_length = response.content_length
+        parallel = EXTRACT_WORKERS > 1 and (content_length or 0) >= PARALLEL_MIN_SIZE
+        progress = current_job_progress.get()
+        if progress is not None:
+            progress.bytes_total = content_length
+            progress.bytes_received = len(head)
+        if compression:
+            logger.info(f"Decompressing {compression} feed from {link_url} while it downloads")
+            result = await stream_feed(response, head, lambda stream: convert_compressed_feed(
+                stream, compression, link_url, target_node, parallel))
+        elif response.content.at_eof() or (content_length is not None and content_length < STREAMING_MIN_SIZE):
+            content = head + await response.read()
+            if progress is not None:
+                progress.bytes_received = len(content)
+            result = await converter_pool.run('feed', process_xml_data, content, link_url, target_node, encoding=encoding)
+        else:
+            logger.info(f"Streaming {content_length or 'unknown'} bytes from {link_url} into the parser")
+            result = await stream_feed(response, head, lambda stream: process_xml_data(
+                stream, link_url, target_node, streaming=True, parallel=parallel, encoding=encoding))
+
+        if not streaming_csv:
+            await asyncio.to_thread(feed_cache.store, link_url, target_node, response.headers, result[0])
+        return response.status, result
+
+
+async def stream_feed(response, head, convert):
+    download = input_utils.DownloadBuffer()
+
+    async def run_conversion():
+        with download.open() as stream:
+            return await convert(stream)
+
+    progress = current_job_progress.get()
+    conversion = asyncio.create_task(converter_pool.run('feed', run_conversion))
+    try:
+        download.write(head)
+        async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+            if conversion.done():
+                break
+            download.write(chunk)
+            if progress is not None:
+                progress.bytes_received += len(chunk)
+        download.finish()
+        return await conversion
+    except BaseException as e:
+        download.finish(e)
+        await asyncio.gather(conversion, return_exceptions=True)
+        raise
+    finally:
+        download.close()
+
+
+async def convert_compressed_feed(stream, compression, link_url, target_node, parallel):
+    if compression == 'zip' and current_csv_stream.get() is not None:
+        raise ValueError("Zip archives cannot be streamed as CSV; convert them without streaming.")
+    if compression == 'zip':
+        domain = urlparse(link_url).netloc.replace("www.", "")
+        return await convert_archive(stream, link_url, lambda member, name, size: process_xml_data(
+            member, f"{domain}_{name}", target_node, streaming=True,
+            parallel=EXTRACT_WORKERS > 1 and size >= PARALLEL_MIN_SIZE), FEED_ARCHIVE_MEMBER_SUFFIXES)
+    with input_utils.open_decompressed(stream, compression) as feed:
+        return await process_xml_data(feed, link_url, target_node, streaming=True, parallel=parallel)
 
 
 async def process_link(link_url, base_url, target_node="auto"):
+    path, filename = await publish_artifact(fetch_link(link_url, target_node))
+    return path, f"https://magic-xml.replit.app/download/data_files/{filename}"
+
+
+async def fetch_link(link_url, target_node="auto"):
     logger.info(f"Fetching data from: {link_url}")
 
-    connector = aiohttp.TCPConnector()
-    timeout = aiohttp.ClientTimeout(total=60)
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'application/xml,text/xml,*/*',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'cross-site',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache',
-            'Referer': 'https://nonton.ru/',
-            'Origin': 'https://nonton.ru',
-            'DNT': '1',
-            'X-Requested-With': 'XMLHttpRequest'
+    session = get_http_session()
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'application/xml,text/xml,*/*',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Sec-Fetch-Dest': 'document',
+        'Sec-Fetch-Mode': 'navigate',
+        'Sec-Fetch-Site': 'cross-site',
+        'Sec-Fetch-User': '?1',
+        'Cache-Control': 'no-cache',
+        'Pragma': 'no-cache',
+        'Referer': 'https://nonton.ru/',
+        'Origin': 'https://nonton.ru',
+        'DNT': '1',
+        'X-Requested-With': 'XMLHttpRequest'
+    }
+
+    strategies = [
+        {
+            'name': 'Standard request',
+            'headers': headers
+        },
+        {
+            'name': 'Chrome browser simulation',
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+                'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Referer': f'https://{urlparse(link_url).netloc}/',
+                'Origin': f'https://{urlparse(link_url).netloc}',
+                'Sec-Fetch-Dest': 'document',
+                'Sec-Fetch-Mode': 'navigate',
+                'Sec-Fetch-Site': 'same-origin',
+                'Sec-Fetch-User': '?1',
+                'Upgrade-Insecure-Requests': '1',
+                'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
+                'sec-ch-ua-mobile': '?0',
+                'sec-ch-ua-platform': '"Windows"',
+                'Cache-Control': 'max-age=0'
+            }
+        },
+        {
+            'name': 'Firefox browser simulation',
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+                'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Referer': f'https://{urlparse(link_url).netloc}/',
+                'DNT': '1',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1',
+                'Sec-Fetch-Dest': 'document',
+                'Sec-Fetch-Mode': 'navigate',
+                'Sec-Fetch-Site': 'same-origin',
+                'Sec-Fetch-User': '?1'
+            }
+        },
+        {
+            'name': 'Mobile browser simulation',
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Referer': f'https://{urlparse(link_url).netloc}/',
+            }
         }
+    ]
 
+    host = urlparse(link_url).netloc
+    reached_file = False
+    for attempt, strategy in enumerate(fetch_strategies.order(host, strategies)):
+        if attempt:
+            await asyncio.sleep(min(FETCH_RETRY_BASE_DELAY * 2 ** (attempt - 1), FETCH_RETRY_MAX_DELAY))
+        logger.info(f"Trying {strategy['name']}...")
         try:
-            async with session.get(link_url, headers=headers, allow_redirects=True) as initial_response:
-                if initial_response.status == 200:
-                    sample_content = await initial_response.text()
-                    if sample_content.strip().startswith('<?xml') or sample_content.strip().startswith('<yml_catalog'):
-                        logger.info(f"Found valid XML content, proceeding with processing")
-                        path, filename = await process_xml_data(sample_content, link_url, target_node)
-                        return path, f"https://magic-xml.replit.app/download/data_files/{filename}"
+            status, result = await fetch_feed(session, link_url, strategy['headers'], target_node)
         except aiohttp.client_exceptions.ClientConnectorError as ce:
-            logger.error(f"Connection error to {urlparse(link_url).netloc}: {str(ce)}", exc_info=True)
+            logger.error(f"Connection error to {host}: {str(ce)}", exc_info=True)
             if "Connect call failed" in str(ce):
-                raise ValueError(f"Server {urlparse(link_url).netloc} is not accessible. The server may be down or blocking connections. Please check the URL or try again later.")
+                raise ValueError(f"Server {host} is not accessible. The server may be down or blocking connections. Please check the URL or try again later.")
             else:
-                raise ValueError(f"Connection error to {urlparse(link_url).netloc}: {str(ce)}")
+                raise ValueError(f"Connection error to {host}: {str(ce)}")
         except aiohttp.client_exceptions.ConnectionTimeoutError:
-            logger.error(f"Connection timeout to {urlparse(link_url).netloc}", exc_info=True)
-            raise ValueError(f"Connection timeout to {urlparse(link_url).netloc}. The server is taking too long to respond. Please try again later.")
-
-        strategies = [
-            {
-                'name': 'Standard request',
-                'headers': headers
-            },
-            {
-                'name': 'Chrome browser simulation',
-                'headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Referer': f'https://{urlparse(link_url).netloc}/',
-                    'Origin': f'https://{urlparse(link_url).netloc}',
-                    'Sec-Fetch-Dest': 'document',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Sec-Fetch-Site': 'same-origin',
-                    'Sec-Fetch-User': '?1',
-                    'Upgrade-Insecure-Requests': '1',
-                    'sec-ch-ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-                    'sec-ch-ua-mobile': '?0',
-                    'sec-ch-ua-platform': '"Windows"',
-                    'Cache-Control': 'max-age=0'
-                }
-            },
-            {
-                'name': 'Firefox browser simulation',
-                'headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Referer': f'https://{urlparse(link_url).netloc}/',
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                    'Sec-Fetch-Dest': 'document',
-                    'Sec-Fetch-Mode': 'navigate',
-                    'Sec-Fetch-Site': 'same-origin',
-                    'Sec-Fetch-User': '?1'
-                }
-            },
-            {
-                'name': 'Mobile browser simulation',
-                'headers': {
-                    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Referer': f'https://{urlparse(link_url).netloc}/',
-                }
-            }
-        ]
-
-        successful_response = None
-        for strategy in strategies:
-            try:
-                logger.info(f"Trying {strategy['name']}...")
-                await asyncio.sleep(2)
-
-                async with session.get(link_url, headers=strategy['headers'], allow_redirects=True) as response:
-                    logger.info(f"Response status with {strategy['name']}: {response.status}")
-
-                    if response.status == 200:
-                        content_type = response.headers.get('content-type', '').lower()
-                        logger.info(f"Content-Type: {content_type}")
-
-                        if 'xml' in content_type or 'application/xml' in content_type:
-                            logger.info(f"Successfully accessed XML with {strategy['name']}")
-                            sample_content = await response.text()
-                            if sample_content.strip().startswith('<?xml') or sample_content.strip().startswith('<yml_catalog'):
-                                path, filename = await process_xml_data(sample_content, link_url, target_node)
-                                return path, f"https://magic-xml.replit.app/download/data_files/{filename}"
-                        else:
-                            sample_content = await response.text()
-                            if sample_content.strip().startswith('<?xml') or sample_content.strip().startswith('<yml_catalog'):
-                                logger.info(f"Found XML content with {strategy['name']} despite incorrect Content-Type")
-                                path, filename = await process_xml_data(sample_content, link_url, target_node)
-                                return path, f"https://magic-xml.replit.app/download/data_files/{filename}"
-
-                        successful_response = response
-                        break
-                    elif response.status == 404:
-                        logger.warning(f"File not found (404) with {strategy['name']}")
-                        continue
-                    elif response.status == 403:
-                        logger.warning(f"Access denied (403) with {strategy['name']}")
-                        continue
-                    else:
-                        logger.warning(f"Server error ({response.status}) with {strategy['name']}")
-                        continue
+            logger.error(f"Connection timeout to {host}", exc_info=True)
+            raise ValueError(f"Connection timeout to {host}. The server is taking too long to respond. Please try again later.")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"{strategy['name']} failed: {e}", exc_info=True)
+            if current_csv_stream.get() is not None:
+                current_csv_stream.get().reset()
+            continue
 
-            except Exception as e:
-                logger.error(f"{strategy['name']} failed: {e}", exc_info=True)
-                continue
+        logger.info(f"Response status with {strategy['name']}: {status}")
+        if result is not None:
+            logger.info(f"Successfully accessed XML with {strategy['name']}")
+            fetch_strategies.remember(host, strategy['name'])
+            return result
+        elif status == 200:
+            reached_file = True
+            break
+        elif status == 404:
+            logger.warning(f"File not found (404) with {strategy['name']}")
+        elif status == 403:
+            logger.warning(f"Access denied (403) with {strategy['name']}")
+        else:
+            logger.warning(f"Server error ({status}) with {strategy['name']}")
 
-        if successful_response is None:
-            error_message = f"Не удается получить доступ к файлу. Сервер блокирует все попытки доступа (403). Возможные причины:\n1. Файл защищен авторизацией\n2. Сайт блокирует автоматические запросы\n3. Требуется специальный токен доступа\n\nРекомендации:\n- Скачайте файл вручную через браузер\n- Загрузите файл через форму на сайте\n- Обратитесь к владельцу сайта за прямой ссылкой"
-            logger.error(error_message)
-            raise ValueError(error_message)
+    if not reached_file:
+        error_message = f"Не удается получить доступ к файлу. Сервер блокирует все попытки доступа (403). Возможные причины:\n1. Файл защищен авторизацией\n2. Сайт блокирует автоматические запросы\n3. Требуется специальный токен доступа\n\nРекомендации:\n- Скачайте файл вручную через браузер\n- Загрузите файл через форму на сайте\n- Обратитесь к владельцу сайта за прямой ссылкой"
+        logger.error(error_message)
+        raise ValueError(error_message)
 
-        try:
-            final_content = await successful_response.text()
-            if final_content.strip().startswith('<?xml') or final_content.strip().startswith('<yml_catalog'):
-                path, filename = await process_xml_data(final_content, link_url, target_node)
-                return path, f"https://magic-xml.replit.app/download/data_files/{filename}"
-            else:
-                error_message = f"Сервер возвращает HTML страницу вместо XML файла. Проверьте корректность URL и убедитесь, что ссылка ведет непосредственно к XML/YML файлу."
-                logger.error(error_message)
-                raise ValueError(error_message)
-        except Exception as e:
-            logger.error(f"Error processing final content: {str(e)}", exc_info=True)
-            raise ValueError(f"Ошибка обработки содержимого файла: {str(e)}")
+    error_message = f"Сервер возвращает HTML страницу вместо XML файла. Проверьте корректность URL и убедитесь, что ссылка ведет непосредственно к XML/YML файлу."
+    logger.error(error_message)
+    raise ValueError(error_message)
 
 
 @app.get("/")
@@ -1773,53 +1719,267 @@ def get_user_info(request: Request):
     }
 
 
-@app.post("/process_file")
-async def process_file_upload(file: UploadFile = File(...)):
+def open_upload(file, max_size):
+    upload = file.file
+    size = upload.seek(0, os.SEEK_END)
+    upload.seek(0)
+    if size > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+    return upload, size
+
+
+def upload_size_limit(filename):
+    streamable = filename.lower().endswith('.csv') or not filename.lower().endswith(
+        ('.xlsx', '.xls', '.json', '.jpg', '.jpeg', '.png'))
+    return UPLOAD_SIZE_LIMITS['process_file'] if streamable else IN_MEMORY_UPLOAD_SIZE_LIMIT
+
+
+async def convert_uploaded_file(upload, filename, size):
+    if size == 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+
+    logger.info(f"Processing uploaded file: {filename}")
+    logger.info(f"File size: {size} bytes")
+
+    path, output_filename = await publish_artifact(convert_upload_source(upload, filename, size))
+    return {
+        "file_url": f"/download/data_files/{output_filename}",
+        "status": "completed",
+        "filename": output_filename
+    }
+
+
+async def stream_uploaded_feed(upload, filename, size):
+    if size == 0:
+        raise HTTPException(status_code=400, detail="File is empty")
+    compression = None
+    if not filename.lower().endswith(STREAM_UNSUPPORTED_SUFFIXES):
+        compression = input_utils.detect_compression(upload)
+    name = input_utils.strip_compression_suffix(filename, compression) if compression else filename
+    if compression == 'zip' or name.lower().endswith(STREAM_UNSUPPORTED_SUFFIXES):
+        raise HTTPException(status_code=400, detail="Only XML/YML feeds can be streamed as CSV")
+    logger.info(f"Streaming CSV rows of uploaded feed: {filename}")
+
+    async def convert_feed():
+        if compression:
+            with input_utils.open_decompressed(upload, compression) as feed:
+                return await process_xml_data(feed, name, streaming=True)
+        return await process_xml_data(upload, name, streaming=True,
+                                      parallel=EXTRACT_WORKERS > 1 and size >= PARALLEL_MIN_SIZE)
+
+    return await stream_csv_response(converter_pool.run('feed', convert_feed), output_csv_filename(name))
+
+
+async def stream_csv_response(conversion, filename):
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=CSV_STREAM_QUEUE_SIZE)
+    closed = threading.Event()
+
+    def write(chunk):
+        if closed.is_set():
+            raise ConnectionAbortedError("CSV stream was closed by the client")
+        asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+
+    async def run_conversion():
+        try:
+            await conversion
+        finally:
+            await chunks.put(None)
+
+    token = current_csv_stream.set(CsvStream(write, select_csv_fields, make_row_encoder))
     try:
-        MAX_FILE_SIZE = 100 * 1024 * 1024
-        content = await file.read()
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size is 100MB")
+        task = asyncio.create_task(run_conversion())
+    finally:
+        current_csv_stream.reset(token)
 
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="File is empty")
+    async def close():
+        closed.set()
+        while not chunks.empty():
+            chunks.get_nowait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    try:
+        first = await chunks.get()
+        if first is None:
+            await task
+    except BaseException:
+        await close()
+        raise
 
+    async def body():
         try:
-            file_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    file_data = content.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                file_data = content.decode('utf-8', errors='replace')
+            chunk = first
+            while chunk is not None:
+                yield chunk
+                chunk = await chunks.get()
+            try:
+                await task
+            except Exception as e:
+                # The 200 status is already out; raising makes the server drop the
+                # connection without the final chunk, so the client sees a broken
+                # transfer instead of a CSV that merely looks short.
+                logger.error(f"CSV stream {filename} failed after it started, aborting the response: {str(e)}",
+                             exc_info=True)
+                raise
+        finally:
+            await close()
+
+    return StreamingResponse(body(),
+                             media_type='text/csv',
+                             headers={"Content-Disposition": content_disposition(filename)})
+
+
+async def publish_artifact(conversion):
+    scratch = artifact_store.scratch_dir()
+    token = current_output_dir.set(scratch)
+    try:
+        path, filename = await conversion
+        blob, name = await asyncio.to_thread(artifact_store.publish, path, filename)
+    finally:
+        current_output_dir.reset(token)
+        artifact_store.remove_scratch(scratch)
+    compression = asyncio.create_task(compress_artifact(blob, name))
+    artifact_compressions.add(compression)
+    compression.add_done_callback(artifact_compressions.discard)
+    return str(blob), name
+
+
+async def compress_artifact(blob, name):
+    try:
+        await asyncio.to_thread(artifact_store.compress, blob, name)
+    except Exception as e:
+        logger.error(f"Compressing artifact {name} failed: {str(e)}", exc_info=True)
 
-        logger.info(f"Processing uploaded file: {file.filename}")
-        logger.info(f"File size: {len(file_data)} characters")
 
+async def run_artifact_sweeper():
+    while True:
+        try:
+            swept = await asyncio.to_thread(artifact_store.sweep)
+            logger.info(f"Artifact sweep: {swept}")
+        except Exception as e:
+            logger.error(f"Artifact sweep failed: {str(e)}", exc_info=True)
+        await asyncio.sleep(ARTIFACT_SWEEP_INTERVAL)
+
+
+async def convert_into(directory, converter, *args, **kwargs):
+    current_output_dir.set(directory)
+    return await converter(*args, **kwargs)
+
+
+async def run_converter(kind, converter, data, source_name, *args, **kwargs):
+    params = result_cache.output_params(converter, args, kwargs)
+    digest = await asyncio.to_thread(result_cache.input_digest, data)
+    cached = await asyncio.to_thread(
+        result_cache.restore, converter.__name__, params, digest, source_name, output_dir())
+    if cached is not None:
+        logger.info(f"Serving cached {converter.__name__} result for {source_name}: {cached[1]}")
+        return cached
+    path, filename = await converter_pool.run(
+        kind, convert_into, output_dir(), converter, data, source_name, *args, **kwargs)
+    await asyncio.to_thread(result_cache.store, converter.__name__, params, digest, source_name, path)
+    return path, filename
+
+
+async def convert_upload_source(upload, filename, size, streaming=None):
+    compression = None
+    if not filename.lower().endswith(('.xlsx', '.xls', '.jpg', '.jpeg', '.png')):
+        compression = input_utils.detect_compression(upload)
+    if compression == 'zip':
+        return await convert_archive(upload, filename, convert_upload_source)
+    if compression:
+        logger.info(f"Decompressing {compression} upload: {filename}")
+        with input_utils.open_decompressed(upload, compression) as inner:
+            return await convert_upload_source(
+                inner, input_utils.strip_compression_suffix(filename, compression), size, streaming=True)
+
+    if filename.lower().endswith('.csv'):
+        encoding = input_utils.detect_encoding(upload)
+        path, output_filename = await run_converter('table', process_csv_to_xml, upload, filename, encoding=encoding)
+    elif filename.lower().endswith(('.xlsx', '.xls')):
+        path, output_filename = await run_converter('table', process_excel_to_csv, upload.read(), filename)
+    elif filename.lower().endswith('.json'):
+        path, output_filename = await run_converter('table', process_json_to_csv, upload.read(), filename)
+    elif filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+        path, output_filename = await run_converter('image', process_image_to_pdf, upload.read(), filename)
+    else:
+        path, output_filename = await run_converter('feed', process_xml_data, 
+            upload, filename,
+            streaming=size >= STREAMING_MIN_SIZE if streaming is None else streaming,
+            parallel=EXTRACT_WORKERS > 1 and size >= PARALLEL_MIN_SIZE)
+
+    return path, output_filename
+
+
+@app.post("/process_file")
+async def process_file_upload(file: UploadFile = File(...), stream: bool = False):
+    try:
         filename = file.filename or "uploaded_file"
-        if filename.lower().endswith('.csv'):
-            path, output_filename = await process_csv_to_xml(file_data, filename)
-        elif filename.lower().endswith(('.xlsx', '.xls')):
-            path, output_filename = await process_excel_to_csv(content, filename)
-        elif filename.lower().endswith('.json'):
-            path, output_filename = await process_json_to_csv(file_data, filename)
-        elif filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            path, output_filename = await process_image_to_pdf(content, filename)
-        else:
-            path, output_filename = await process_xml_data(file_data, filename)
+        upload, size = open_upload(file, upload_size_limit(filename))
+        if stream:
+            return await stream_uploaded_feed(upload, filename, size)
+        return await convert_uploaded_file(upload, filename, size)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing uploaded file: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
-        return {
-            "file_url": f"/download/data_files/{os.path.basename(path)}",
-            "status": "completed",
-            "filename": os.path.basename(path)
-        }
 
+@app.post("/uploads")
+async def create_upload(upload_data: UploadData):
+    max_size = upload_size_limit(upload_data.filename)
+    if upload_data.size > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+    upload_store.prune()
+    try:
+        return upload_store.create(upload_data.filename, upload_data.size, upload_data.chunk_size)
+    except UploadError as ue:
+        raise HTTPException(status_code=400, detail=str(ue))
+
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    try:
+        return upload_store.status(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@app.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(upload_id: str, index: int, request: Request):
+    checksum = request.headers.get("x-chunk-sha256")
+    if not checksum:
+        raise HTTPException(status_code=400, detail="X-Chunk-SHA256 header is required")
+    try:
+        return await upload_store.write_chunk(upload_id, index, request.stream(), checksum)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadError as ue:
+        raise HTTPException(status_code=400, detail=str(ue))
+
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    try:
+        status = upload_store.status(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if not status['complete']:
+        missing = sorted(set(range(status['chunk_count'])) - set(status['received_chunks']))
+        raise HTTPException(status_code=409, detail=f"Upload is missing chunks: {missing[:20]}")
+
+    try:
+        with open(upload_store.data_path(upload_id), 'rb') as upload:
+            result = await convert_uploaded_file(upload, status['filename'], status['size'])
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing uploaded file: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+    upload_store.remove(upload_id)
+    return result
+
 
 @app.post("/convert_csv_to_xml")
 async def convert_csv_to_xml(file: UploadFile = File(...), xml_format: str = "yandex_market"):
@@ -1827,21 +1987,10 @@ async def convert_csv_to_xml(file: UploadFile = File(...), xml_format: str = "ya
         if not file.filename.lower().endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are supported")
 
-        content = await file.read()
-
-        try:
-            csv_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    csv_data = content.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                csv_data = content.decode('utf-8', errors='replace')
+        upload, size = open_upload(file, UPLOAD_SIZE_LIMITS['convert_csv_to_xml'])
 
-        path, filename = await process_csv_to_xml(csv_data, file.filename, xml_format)
+        encoding = input_utils.detect_encoding(upload)
+        path, filename = await publish_artifact(run_converter('table', process_csv_to_xml, upload, file.filename, xml_format, encoding=encoding))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -1850,6 +1999,8 @@ async def convert_csv_to_xml(file: UploadFile = File(...), xml_format: str = "ya
             "format": xml_format
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error converting CSV to XML: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error converting file: {str(e)}")
@@ -1880,32 +2031,19 @@ async def convert_csv_to_excel(file: UploadFile = File(...)):
             logger.error(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
 
-        try:
-            csv_data = content.decode('utf-8')
-            logger.info("Successfully decoded as UTF-8")
-        except UnicodeDecodeError as decode_error:
-            logger.warning(f"UTF-8 decode failed: {decode_error}")
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    csv_data = content.decode(encoding)
-                    logger.info(f"Successfully decoded as {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    logger.warning(f"Failed to decode as {encoding}")
-                    continue
-            else:
-                logger.warning("All encoding attempts failed, using UTF-8 with error replacement")
-                csv_data = content.decode('utf-8', errors='replace')
+        encoding = input_utils.detect_encoding(content)
+        logger.info(f"Detected encoding: {encoding}")
+        head = input_utils.decode_head(content, encoding)
 
-        if not csv_data.strip():
+        if not head.strip():
             error_msg = "CSV file contains no data after decoding"
             logger.error(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
 
-        logger.info(f"CSV data preview (first 200 chars): {csv_data[:200]}")
+        logger.info(f"CSV data preview (first 200 chars): {head[:200]}")
 
         try:
-            path, filename = await process_csv_to_excel(csv_data, file.filename)
+            path, filename = await publish_artifact(run_converter('table', process_csv_to_excel, content, file.filename, encoding=encoding))
             logger.info(f"Conversion successful: {filename}")
 
             result = {
@@ -1938,7 +2076,7 @@ async def convert_excel_to_csv(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
 
         content = await file.read()
-        path, filename = await process_excel_to_csv(content, file.filename)
+        path, filename = await publish_artifact(run_converter('table', process_excel_to_csv, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -1960,12 +2098,7 @@ async def convert_json_to_csv(file: UploadFile = File(...)):
 
         content = await file.read()
 
-        try:
-            json_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            json_data = content.decode('utf-8', errors='replace')
-
-        path, filename = await process_json_to_csv(json_data, file.filename)
+        path, filename = await publish_artifact(run_converter('table', process_json_to_csv, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -1985,21 +2118,10 @@ async def convert_csv_to_json(file: UploadFile = File(...), json_format: str = "
         if not file.filename.lower().endswith('.csv'):
             raise HTTPException(status_code=400, detail="Only CSV files are supported")
 
-        content = await file.read()
-
-        try:
-            csv_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    csv_data = content.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                csv_data = content.decode('utf-8', errors='replace')
+        upload, size = open_upload(file, UPLOAD_SIZE_LIMITS['convert_csv_to_json'])
 
-        path, filename = await process_csv_to_json(csv_data, file.filename, json_format)
+        encoding = input_utils.detect_encoding(upload)
+        path, filename = await publish_artifact(run_converter('table', process_csv_to_json, upload, file.filename, json_format, encoding=encoding))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2008,6 +2130,8 @@ async def convert_csv_to_json(file: UploadFile = File(...), json_format: str = "
             "format": "json"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error converting CSV to JSON: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error converting file: {str(e)}")
@@ -2019,21 +2143,10 @@ async def convert_xml_to_json(file: UploadFile = File(...)):
         if not file.filename.lower().endswith('.xml'):
             raise HTTPException(status_code=400, detail="Only XML files are supported")
 
-        content = await file.read()
-
-        try:
-            xml_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    xml_data = content.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                xml_data = content.decode('utf-8', errors='replace')
+        upload, size = open_upload(file, UPLOAD_SIZE_LIMITS['convert_xml_to_json'])
 
-        path, filename = await process_xml_to_json(xml_data, file.filename)
+        encoding = input_utils.detect_encoding(upload)
+        path, filename = await publish_artifact(run_converter('table', process_xml_to_json, upload, file.filename, encoding=encoding))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2042,6 +2155,8 @@ async def convert_xml_to_json(file: UploadFile = File(...)):
             "format": "json"
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error converting XML to JSON: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error converting file: {str(e)}")
@@ -2054,7 +2169,7 @@ async def convert_jpg_to_png(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only JPG/JPEG files are supported")
 
         content = await file.read()
-        path, filename = await process_jpg_to_png(content, file.filename)
+        path, filename = await publish_artifact(run_converter('image', process_jpg_to_png, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2075,7 +2190,7 @@ async def convert_png_to_jpg(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only PNG files are supported")
 
         content = await file.read()
-        path, filename = await process_png_to_jpg(content, file.filename)
+        path, filename = await publish_artifact(run_converter('image', process_png_to_jpg, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2096,7 +2211,7 @@ async def convert_pdf_to_csv(file: UploadFile = File(...), extraction_method: st
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
         content = await file.read()
-        path, filename = await process_pdf_to_csv(content, file.filename, extraction_method)
+        path, filename = await publish_artifact(run_converter('pdf', process_pdf_to_csv, content, file.filename, extraction_method))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2119,15 +2234,17 @@ async def convert_pdf_to_excel(file: UploadFile = File(...), extraction_method:
 
         content = await file.read()
 
-        csv_path, csv_filename = await process_pdf_to_csv(content, file.filename, extraction_method)
+        async def convert_pdf():
+            csv_path, csv_filename = await run_converter('pdf', process_pdf_to_csv, content, file.filename, extraction_method)
 
-        with open(csv_path, 'r', encoding='utf-8-sig') as f:
-            csv_data = f.read()
+            def read_csv():
+                with open(csv_path, 'r', encoding='utf-8-sig') as f:
+                    return f.read()
 
-        excel_path, excel_filename = await process_csv_to_excel(csv_data, file.filename)
+            csv_data = await asyncio.to_thread(read_csv)
+            return await run_converter('table', process_csv_to_excel, csv_data, file.filename)
 
-        if os.path.exists(csv_path):
-            os.remove(csv_path)
+        excel_path, excel_filename = await publish_artifact(convert_pdf())
 
         return {
             "file_url": f"/download/data_files/{excel_filename}",
@@ -2149,7 +2266,7 @@ async def convert_pdf_to_json(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
         content = await file.read()
-        path, filename = await process_pdf_to_json(content, file.filename)
+        path, filename = await publish_artifact(run_converter('pdf', process_pdf_to_json, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2171,19 +2288,8 @@ async def convert_csv_to_pdf(file: UploadFile = File(...), report_style: str = "
 
         content = await file.read()
 
-        try:
-            csv_data = content.decode('utf-8')
-        except UnicodeDecodeError:
-            for encoding in ['windows-1251', 'latin1', 'iso-8859-1', 'cp1252']:
-                try:
-                    csv_data = content.decode(encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                csv_data = content.decode('utf-8', errors='replace')
-
-        path, filename = await process_csv_to_pdf(csv_data, file.filename, report_style)
+        encoding = input_utils.detect_encoding(content)
+        path, filename = await publish_artifact(run_converter('pdf', process_csv_to_pdf, content, file.filename, report_style, encoding=encoding))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2205,7 +2311,7 @@ async def convert_excel_to_pdf(file: UploadFile = File(...), report_style: str =
             raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
 
         content = await file.read()
-        path, filename = await process_excel_to_pdf(content, file.filename, report_style)
+        path, filename = await publish_artifact(run_converter('pdf', process_excel_to_pdf, content, file.filename, report_style))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2227,7 +2333,7 @@ async def convert_image_to_pdf(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Only PNG, JPG, and JPEG files are supported")
 
         content = await file.read()
-        path, filename = await process_image_to_pdf(content, file.filename)
+        path, filename = await publish_artifact(run_converter('image', process_image_to_pdf, content, file.filename))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2248,7 +2354,7 @@ async def convert_pdf_to_png(file: UploadFile = File(...), dpi: int = 300):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
         content = await file.read()
-        path, filename = await process_pdf_to_image(content, file.filename, 'png', dpi)
+        path, filename = await publish_artifact(run_converter('pdf', process_pdf_to_image, content, file.filename, 'png', dpi))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2270,7 +2376,7 @@ async def convert_pdf_to_jpg(file: UploadFile = File(...), dpi: int = 300):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
         content = await file.read()
-        path, filename = await process_pdf_to_image(content, file.filename, 'jpg', dpi)
+        path, filename = await publish_artifact(run_converter('pdf', process_pdf_to_image, content, file.filename, 'jpg', dpi))
 
         return {
             "file_url": f"/download/data_files/{filename}",
@@ -2284,62 +2390,224 @@ async def convert_pdf_to_jpg(file: UploadFile = File(...), dpi: int = 300):
         logger.error(f"Error converting PDF to JPG: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error converting file: {str(e)}")
 
-@app.post("/process_link")
-async def process_link_post(link_data: LinkData, request: Request):
+@app.post("/process_link", status_code=202)
+async def process_link_post(link_data: LinkData):
     logger.info(f"Processing link: {link_data.link_url}")
     logger.info(f"Target node: {link_data.preset_id}")
+    target_node = link_data.preset_id if link_data.preset_id and link_data.preset_id != "" else "auto"
+    logger.info(f"Using target node: {target_node}")
+    if link_data.stream:
+        try:
+            return await stream_csv_response(fetch_link(link_data.link_url, target_node),
+                                             output_csv_filename(link_data.link_url))
+        except ValueError as ve:
+            logger.error(f"ValueError occurred: {str(ve)}", exc_info=True)
+            raise HTTPException(status_code=400, detail=f"Data processing error: {str(ve)}")
+        except Exception as e:
+            logger.error(f"Unexpected error occurred: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job workers are not running")
+    job = job_store.create(link_data.link_url, link_data.return_url, link_data.preset_id, target_node)
+    job_queue.put_nowait(job['id'])
+    return job_status(job)
+
+
+async def run_job_worker():
+    while True:
+        job_id = await job_queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            logger.error(f"Job {job_id} crashed: {str(e)}", exc_info=True)
+        finally:
+            job_queue.task_done()
+
+
+async def run_job(job_id):
+    job = job_store.get(job_id)
+    if job is None or job['status'] in ('done', 'failed'):
+        return
+    progress = job_progress[job_id] = JobProgress()
+    token = current_job_progress.set(progress)
+    job_store.mark_running(job_id)
     try:
-        target_node = link_data.preset_id if link_data.preset_id and link_data.preset_id != "" else "auto"
-        logger.info(f"Using target node: {target_node}")
-        path, url = await process_link(link_data.link_url,
-                                       str(request.url).rstrip(request.url.path),
-                                       target_node=target_node)
-        if path:
-            resp = {
-                "file_url": url,
-                "preset_id": link_data.preset_id,
-                "status": "completed"
-            }
-            if link_data.return_url:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.post(link_data.return_url,
-                                                json=resp) as res:
-                            res.raise_for_status()
-                except Exception as callback_error:
-                    logger.error(f"Callback error: {callback_error}", exc_info=True)
-            return resp
-        raise HTTPException(status_code=500, detail="Failed to process the link")
+        path, url = await process_link(job['link_url'], "", target_node=job['target_node'])
+        job_store.mark_done(job_id, url, progress)
     except ValueError as ve:
         logger.error(f"ValueError occurred: {str(ve)}", exc_info=True)
-        raise HTTPException(status_code=400, detail=f"Data processing error: {str(ve)}")
+        job_store.mark_failed(job_id, f"Data processing error: {str(ve)}", progress)
     except Exception as e:
         logger.error(f"Unexpected error occurred: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+        job_store.mark_failed(job_id, f"Server error: {str(e)}", progress)
+    finally:
+        current_job_progress.reset(token)
+        del job_progress[job_id]
 
+    job = job_store.get(job_id)
+    if job['return_url']:
+        await send_callback(job['return_url'], job_status(job))
 
-@app.get("/status/{preset_id}")
-async def check_processing_status(preset_id: str):
+
+async def send_callback(return_url, payload):
+    try:
+        async with get_http_session().post(return_url, json=payload, timeout=CALLBACK_TIMEOUT) as res:
+            res.raise_for_status()
+    except Exception as callback_error:
+        logger.error(f"Callback error: {callback_error}", exc_info=True)
+
+
+def job_status(job):
+    progress = job_progress.get(job['id'])
     return {
-        "status":
-        "completed",
-        "file_url":
-        "https://magic-xml.replit.app/download/data_files/your_file.csv"
+        "job_id": job['id'],
+        "preset_id": job['preset_id'],
+        "link_url": job['link_url'],
+        "status": job['status'],
+        "file_url": job['file_url'],
+        "error": job['error'],
+        "progress": progress.as_dict() if progress is not None else {
+            "bytes_received": job['bytes_received'],
+            "bytes_total": job['bytes_total'],
+            "records": job['records'],
+        },
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
     }
 
 
+@app.post("/process_links")
+async def process_links_post(links: List[LinkData]):
+    if len(links) > BATCH_MAX_LINKS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {BATCH_MAX_LINKS} links")
+    return StreamingResponse(run_batch(links), media_type="application/x-ndjson")
+
+
+async def run_batch(links):
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    host_limits = {}
+
+    async def run_item(index, link_data):
+        target_node = link_data.preset_id or "auto"
+        host_limit = host_limits.setdefault(urlparse(link_data.link_url).netloc, asyncio.Semaphore(BATCH_HOST_CONCURRENCY))
+        result = {"index": index, "link_url": link_data.link_url, "preset_id": link_data.preset_id}
+        async with host_limit, limit:
+            try:
+                path, url = await process_link(link_data.link_url, "", target_node=target_node)
+                result.update(status="done", file_url=url, error=None)
+            except ValueError as ve:
+                logger.error(f"ValueError occurred: {str(ve)}", exc_info=True)
+                result.update(status="failed", file_url=None, error=f"Data processing error: {str(ve)}")
+            except Exception as e:
+                logger.error(f"Unexpected error occurred: {str(e)}", exc_info=True)
+                result.update(status="failed", file_url=None, error=f"Server error: {str(e)}")
+        if link_data.return_url:
+            await send_callback(link_data.return_url, result)
+        return result
+
+    tasks = [asyncio.create_task(run_item(index, link_data)) for index, link_data in enumerate(links)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished, ensure_ascii=False) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@app.get("/feed_cache/stats")
+async def feed_cache_stats():
+    return feed_cache.stats()
+
+
+@app.get("/converters/stats")
+async def converter_stats():
+    return converter_pool.stats()
+
+
+@app.get("/result_cache/stats")
+async def result_cache_stats():
+    return result_cache.stats()
+
+
+@app.get("/status/{job_id}")
+async def check_processing_status(job_id: str):
+    job = job_store.get(job_id) or job_store.latest_for_preset(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+
+@app.get("/artifacts/stats")
+async def artifact_stats():
+    return await asyncio.to_thread(artifact_store.stats)
+
+
 @app.get("/download/data_files/{filename}")
-def download_csv(filename: str):
-    file_path = os.path.join("data_files", filename)
-    if os.path.isfile(file_path):
-        if '..' in filename or '/' in filename or '\\' in filename:
-            raise HTTPException(status_code=400, detail="Invalid filename")
+def download_csv(filename: str, request: Request):
+    if '..' in filename or '/' in filename or '\\' in filename:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    try:
+        file_path = get_validated_file_path(filename, artifact_store)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    variants = {encoding: artifact_store.encoded_path(file_path, encoding) for encoding in ARTIFACT_ENCODINGS}
+    encoding = select_encoding(request.headers.get('accept-encoding'),
+                               [encoding for encoding, path in variants.items() if path is not None])
+    path = variants[encoding] if encoding else file_path
+    stat = os.stat(path)
+    if file_path.parent.parent == artifact_store.blobs_dir:
+        etag = f'"{file_path.name}-{encoding}"' if encoding else f'"{file_path.name}"'
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
 
-        return FileResponse(path=file_path,
+    if_range = request.headers.get('if-range')
+    try:
+        byte_range = parse_range(request.headers.get('range'), stat.st_size)
+    except ValueError:
+        if not if_range or if_range.strip() == etag:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+        byte_range = None
+    if byte_range is None or (if_range and if_range.strip() != etag):
+        return FileResponse(path=path,
                             filename=filename,
                             media_type='application/octet-stream',
-                            headers={"Access-Control-Allow-Origin": "*"})
-    raise HTTPException(status_code=404, detail="File not found")
+                            headers=headers,
+                            stat_result=stat)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Disposition"] = content_disposition(filename)
+    return StreamingResponse(read_file_range(path, start, end),
+                             status_code=206,
+                             media_type='application/octet-stream',
+                             headers=headers)
+
+
+def read_file_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
 
 
 if __name__ == "__main__":
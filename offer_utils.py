@@ -0,0 +1,514 @@
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import logging
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# html5lib reproduces browser parsing; 'lxml' is several times faster but may
+# produce different output for malformed markup.
+DESCRIPTION_PARSER = 'html5lib'
+DESCRIPTION_CACHE_SIZE = 4096
+# Characters that make the parser's output differ from the escaped input text.
+NEEDS_PARSER_RE = re.compile(r'[<&\r\x00-\x08\x0b-\x1f\x7f-\x9f]')
+
+description_cache = OrderedDict()
+description_cache_lock = threading.Lock()
+
+
+def parse_description(description, parser=None):
+    parser = parser or DESCRIPTION_PARSER
+    try:
+        soup = BeautifulSoup(description, parser)
+    except Exception:
+        try:
+            soup = BeautifulSoup(description, 'lxml')
+        except Exception:
+            soup = BeautifulSoup(description, 'html.parser')
+    allowed_tags = ['p', 'br']
+    for tag in soup.find_all(True):
+        if tag.name not in allowed_tags:
+            tag.unwrap()
+    for content in list(soup.contents):
+        if isinstance(content, str) and content.strip():
+            new_p = soup.new_tag('p')
+            new_p.string = content.strip()
+            content.replace_with(new_p)
+    return str(soup)
+
+
+def clean_description(description):
+    """Reduce an HTML description to ``<p>``/``<br>`` markup.
+
+    Plain text (no tags, entities or characters the HTML parser would
+    rewrite) is wrapped directly without building a soup. Everything else
+    goes through ``parse_description`` and is memoized in a bounded LRU cache
+    keyed by a digest of the text, since variants of one product usually
+    share a description.
+    """
+    if not description:
+        return ''
+    stripped = description.strip()
+    if stripped and not NEEDS_PARSER_RE.search(description):
+        return f"<p>{stripped.replace('>', '&gt;')}</p>"
+
+    key = hashlib.blake2b(description.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with description_cache_lock:
+        cleaned = description_cache.get(key)
+        if cleaned is not None:
+            description_cache.move_to_end(key)
+            return cleaned
+
+    cleaned = parse_description(description)
+    with description_cache_lock:
+        description_cache[key] = cleaned
+        if len(description_cache) > DESCRIPTION_CACHE_SIZE:
+            description_cache.popitem(last=False)
+    return cleaned
+
+
+def sanitize_name(name):
+    if not name:
+        return ""
+    sanitized = re.sub(r'[^\w\s\-\(\)\[\]\/\\,\.;:!?\'"«»„""`~@#$%^&*+=<>|№°]', '', name)
+    sanitized = re.sub(r'\s+', ' ', sanitized)
+    sanitized = re.sub(r'\(\s*([^)]+)\s*\)', r'(\1)', sanitized)
+    return sanitized.strip()
+
+def remove_duplicates_from_delimited_string(value, delimiter='///'):
+    if not value:
+        return ""
+    return str(OrderedValues(value, delimiter=delimiter))
+
+
+class OrderedValues:
+    """Insertion-ordered set of delimiter-separated column values.
+
+    Each added value is split on the delimiter, stripped and deduplicated in
+    O(1) per item; the column string is built once by ``str()`` when the row
+    is assembled.
+    """
+
+    __slots__ = ('items', 'delimiter')
+
+    def __init__(self, *values, delimiter='///'):
+        self.items = {}
+        self.delimiter = delimiter
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        for item in value.split(self.delimiter):
+            item = item.strip()
+            if item:
+                self.items[item] = None
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __str__(self):
+        return self.delimiter.join(self.items)
+
+
+IMAGE_TAGS = {'picture', 'photo', 'optionalImages', 'image', 'images', 'img'}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg')
+ALT_DESCRIPTION_TAGS = ('desc', 'descr', 'description_full', 'full_description')
+FIRST_MATCH_TAGS = {'categoryId', 'description', 'name', 'fabric', 'features', *ALT_DESCRIPTION_TAGS}
+
+
+def clean_size_value(key, val):
+    if ('размер' in key.lower() or 'size' in key.lower()) or (
+            '?' in val and
+        (val.replace('?', '').strip().isdigit() or any(c.isdigit()
+                                                       for c in val))):
+        val = val.replace('?', '').strip()
+    return val
+
+
+@lru_cache(maxsize=1024)
+def is_image_attribute(attr_name):
+    return 'image' in attr_name.lower() or 'photo' in attr_name.lower()
+
+
+def collect_attribute_images(elem, images):
+    for attr_name, attr_value in elem.attrib.items():
+        if attr_value and is_image_attribute(attr_name):
+            if attr_value.lower().endswith(IMAGE_EXTENSIONS) or attr_value.startswith('http'):
+                images.add(attr_value)
+
+
+def process_offer_element(offer_elem, build_category_path, format_type):
+    """Extract one ``offer``/``product`` element into a flat row.
+
+    The subtree is walked once, collecting direct-child values, nested values,
+    images, params and description candidates; the row is then assembled from
+    what was collected, applying the same precedence rules as before.
+    """
+    offer_data = {}
+
+    for key, value in offer_elem.attrib.items():
+        offer_data[f"attr_{key}"] = value
+
+    children = []
+    pending = {}
+    nested_values = []
+    first_match = {}
+    direct_cid_elem = None
+    param_elems = []
+    param_name_elems = [offer_elem] if offer_elem.tag.startswith('param_name_') else []
+    all_images = set()
+    collect_attribute_images(offer_elem, all_images)
+
+    for child in offer_elem:
+        children.append(child)
+        tag = child.tag
+
+        # Repeated attribute columns collect into lists (joined with "///")
+        # and repeated text columns into OrderedValues; ``pending`` holds
+        # them until the direct children are done.
+        if tag not in IMAGE_TAGS:
+            for key, value in child.attrib.items():
+                column_name = f"{tag}_{key}"
+                accumulated = pending.get(column_name)
+                if isinstance(accumulated, list):
+                    accumulated.append(value)
+                    continue
+                if accumulated is not None:
+                    offer_data[column_name] = str(pending.pop(column_name))
+                if column_name in offer_data:
+                    pending[column_name] = [offer_data[column_name], value]
+                else:
+                    offer_data[column_name] = value
+
+            if child.text and child.text.strip():
+                text = child.text.strip()
+                accumulated = pending.get(tag)
+                if isinstance(accumulated, OrderedValues):
+                    accumulated.add(text)
+                else:
+                    if accumulated is not None:
+                        offer_data[tag] = "///".join(pending.pop(tag))
+                    if tag in offer_data:
+                        pending[tag] = OrderedValues(offer_data[tag], text)
+                    else:
+                        offer_data[tag] = text
+
+            if tag == 'stock':
+                for stock_child in child:
+                    stock_key = stock_child.tag
+                    if stock_child.text and stock_child.text.strip():
+                        pending.pop(stock_key, None)
+                        offer_data[stock_key] = stock_child.text.strip()
+                    for attr_key, attr_value in stock_child.attrib.items():
+                        pending.pop(f"{stock_key}_{attr_key}", None)
+                        offer_data[f"{stock_key}_{attr_key}"] = attr_value
+
+            if tag == 'categoryId' and direct_cid_elem is None:
+                direct_cid_elem = child
+
+        for elem in (child.iter() if len(child) else (child,)):
+            elem_tag = elem.tag
+            text = elem.text
+
+            if elem_tag in FIRST_MATCH_TAGS and elem_tag not in first_match:
+                first_match[elem_tag] = elem
+
+            if elem_tag in IMAGE_TAGS:
+                if text and text.strip():
+                    image_url = text.strip()
+                    if (image_url.lower().endswith(IMAGE_EXTENSIONS)
+                        or 'img/' in image_url.lower()
+                        or image_url.startswith('http')):
+                        all_images.add(image_url)
+            elif elem is not child:
+                for key, value in elem.attrib.items():
+                    nested_values.append((f"{elem_tag}_{key}", value))
+                if text and text.strip():
+                    nested_values.append((elem_tag, text.strip()))
+
+            if elem.attrib:
+                collect_attribute_images(elem, all_images)
+
+            if elem_tag == 'param':
+                param_elems.append(elem)
+            elif elem_tag.startswith('param_name_'):
+                param_name_elems.append(elem)
+
+    for column_name, accumulated in pending.items():
+        if isinstance(accumulated, list):
+            offer_data[column_name] = "///".join(accumulated)
+        else:
+            offer_data[column_name] = str(accumulated)
+
+    for column_name, value in nested_values:
+        if column_name not in offer_data:
+            offer_data[column_name] = value
+
+    if format_type == 'offer':
+        if direct_cid_elem is not None and direct_cid_elem.text:
+            cid = direct_cid_elem.text.strip()
+        else:
+            cid_elem = first_match.get('categoryId')
+            cid = cid_elem.text.strip() if cid_elem is not None and cid_elem.text else 'Undefined'
+
+        offer_data['category_path'] = build_category_path(cid)
+        offer_data['categoryId'] = cid
+    else:
+        offer_data['category_path'] = 'Undefined'
+        offer_data['categoryId'] = 'Undefined'
+
+    excluded = ['param'] if format_type == 'offer' else ['photos', 'fabric', 'features', 'options']
+    for child in children:
+        tag = child.tag
+        if tag not in excluded and tag not in IMAGE_TAGS:
+            val = child.text or ''
+            if tag.replace('.', '', 1).isdigit():
+                val = val.replace('.', ',')
+            if tag == 'name':
+                val = sanitize_name(val)
+            if tag == 'Size' and '?' in val:
+                val = val.replace('?', '').strip()
+
+            if tag not in offer_data or not offer_data[tag] or offer_data[tag] == 'Undefined':
+                offer_data[tag] = val
+
+    all_images = sorted(all_images)
+    logger.debug(f"Product ID {offer_data.get('id')}: found {len(all_images)} images")
+    offer_data['pictures'] = "///".join(all_images)
+
+    params = {}
+    if format_type == 'offer':
+        for param_elem in param_elems:
+            key = param_elem.get('name')
+            if not key:
+                continue
+            val = clean_size_value(key, param_elem.text or '')
+
+            clean_key = key.strip()
+
+            if clean_key.replace('.', '', 1).isdigit():
+                continue
+
+            params.setdefault(clean_key, []).append(val)
+
+        param_name_values = {}
+        for elem in param_name_elems:
+            key = elem.tag
+            val = clean_size_value(key, elem.text or '')
+
+            if key not in param_name_values:
+                param_name_values[key] = [offer_data[key]] if key in offer_data else []
+            param_name_values[key].append(val)
+        for key, values in param_name_values.items():
+            offer_data[key] = ", ".join(values)
+    else:
+        for group_tag, prefix in (('fabric', 'fabric_'), ('features', 'feature_')):
+            group = first_match.get(group_tag)
+            if group is None:
+                continue
+            for elem in group.iter('feature'):
+                name = elem.get('name')
+                if not name:
+                    continue
+                params.setdefault(f"{prefix}{name}", []).append(elem.text or '')
+    for key, values in params.items():
+        offer_data[key] = ", ".join(values)
+
+    desc_elem = first_match.get('description' if format_type == 'offer' else 'name')
+    if desc_elem is not None and desc_elem.text:
+        offer_data['description'] = clean_description(desc_elem.text)
+    else:
+        for tag in ALT_DESCRIPTION_TAGS:
+            desc_elem = first_match.get(tag)
+            if desc_elem is not None and desc_elem.text:
+                offer_data['description'] = clean_description(desc_elem.text)
+                break
+        else:
+            offer_data['description'] = ""
+
+    if 'available' not in offer_data:
+        offer_data['available'] = '1'
+
+    return offer_data
+
+
+def process_russian_element(element):
+    offer_data = {}
+
+    for child in element:
+        if child.tag == 'ТЧ':
+            tc_name = child.get('ИмяТабличнойЧасти', 'UnknownTC')
+            tc_data = []
+
+            for tc_element in child.findall('ЭлементТЧ'):
+                tc_row = {}
+                for tc_child in tc_element:
+                    if tc_child.text and tc_child.text.strip():
+                        tc_row[f"{tc_name}_{tc_child.tag}"] = tc_child.text.strip()
+                if tc_row:
+                    tc_data.append(tc_row)
+
+            if tc_data:
+                if tc_name == 'Остатки':
+                    stock_info = []
+                    total_stock = 0
+                    for row in tc_data:
+                        warehouse = row.get(f'{tc_name}_СкладНаименование', '')
+                        quantity = row.get(f'{tc_name}_КоличествоОстаток', '0')
+                        try:
+                            qty_num = float(quantity)
+                            total_stock += qty_num
+                            if qty_num > 0:
+                                stock_info.append(f"{warehouse}: {quantity}")
+                        except:
+                            if quantity != '0':
+                                stock_info.append(f"{warehouse}: {quantity}")
+
+                    offer_data['available'] = '1' if total_stock > 0 else '0'
+                    offer_data['stock_total'] = str(total_stock)
+                    offer_data['stock_details'] = "///".join(stock_info)
+
+                elif tc_name == 'Цены':
+                    for row in tc_data:
+                        price_name = row.get(f'{tc_name}_Наименование', '')
+                        price_value = row.get(f'{tc_name}_Значение', '')
+                        if price_name and price_value:
+                            if price_name == 'Цена':
+                                offer_data['price'] = price_value
+                            elif price_name == 'ЦенаСкидка' and price_value != '0':
+                                offer_data['oldprice'] = offer_data.get('price', '')
+                                offer_data['price'] = price_value
+
+                elif tc_name == 'Материалы':
+                    name_key = f'{tc_name}_Наименование'
+                    id_key = f'{tc_name}_ID_Материала'
+                    names = [row[name_key] for row in tc_data if row.get(name_key)]
+                    id_values = [row[id_key] for row in tc_data if row.get(id_key)]
+
+                    if names:
+                        offer_data[tc_name.lower()] = OrderedValues(*names)
+                    if id_values:
+                        existing_ids = offer_data.get('ID_Материала', '')
+                        if isinstance(existing_ids, OrderedValues):
+                            for id_val in id_values:
+                                existing_ids.add(id_val)
+                        else:
+                            offer_data['ID_Материала'] = OrderedValues(existing_ids, *id_values)
+                elif tc_name in ['Стили', 'ГруппыСайта']:
+                    name_key = f'{tc_name}_Наименование'
+                    names = [row[name_key] for row in tc_data if row.get(name_key)]
+
+                    if names:
+                        if tc_name == 'ГруппыСайта':
+                            offer_data['category_path'] = OrderedValues(*names)
+                            offer_data['categoryId'] = names[0]
+                        else:
+                            offer_data[tc_name.lower()] = OrderedValues(*names)
+
+        else:
+            if child.text and child.text.strip():
+                value = child.text.strip()
+
+                if child.tag == 'ОписаниеДляСайта' or child.tag == 'description':
+                    value = clean_description(value)
+                    offer_data['description'] = value
+                elif child.tag == 'Наименование':
+                    value = sanitize_name(value)
+                    offer_data['name'] = value
+                elif child.tag == 'ПолноеНазваниеСайт':
+                    offer_data['full_name'] = sanitize_name(value)
+                elif child.tag == 'Артикул':
+                    offer_data['Артикул'] = value
+                    offer_data['vendor'] = value
+                    offer_data['vendorCode'] = value
+                elif child.tag == 'ID_Материала':
+                    offer_data['ID_Материала'] = value
+                elif child.tag in ['Глубина', 'Ширина', 'Высота', 'Вес']:
+                    offer_data[child.tag.lower()] = value
+                elif child.tag == 'Цвет':
+                    offer_data['param_Цвет'] = value
+                else:
+                    offer_data[child.tag] = value
+
+    if 'available' not in offer_data:
+        offer_data['available'] = '1'
+
+    if 'category_path' not in offer_data:
+        offer_data['category_path'] = 'Undefined'
+        offer_data['categoryId'] = 'Undefined'
+
+    if 'ID' in offer_data:
+        offer_data['id'] = offer_data['ID']
+
+    for key, value in offer_data.items():
+        if isinstance(value, OrderedValues):
+            offer_data[key] = str(value)
+        elif isinstance(value, str) and '///' in value:
+            offer_data[key] = remove_duplicates_from_delimited_string(value)
+
+    return offer_data
+
+
+def process_service_element(service_elem):
+    service_data = {}
+
+    for attr_name, attr_value in service_elem.attrib.items():
+        service_data[attr_name] = attr_value
+
+    for child in service_elem:
+        if child.text and child.text.strip():
+            service_data[child.tag] = child.text.strip()
+
+        for attr_name, attr_value in child.attrib.items():
+            column_name = f"{child.tag}_{attr_name}"
+            service_data[column_name] = attr_value
+
+    if 'available' not in service_data:
+        service_data['available'] = '1'
+
+    if 'category_path' not in service_data:
+        service_data['category_path'] = service_data.get('name', 'Service')
+
+    if 'categoryId' not in service_data:
+        service_data['categoryId'] = service_data.get('id', service_data.get('sid', 'service'))
+
+    if 'name' in service_data:
+        service_data['name'] = sanitize_name(service_data['name'])
+
+    service_data['service_type'] = 'verification_service'
+
+    return service_data
+
+
+def undefined_category_path(cid):
+    return 'Undefined'
+
+
+def process_record(elem, build_category_path, format_type):
+    """Extract one record element; returns ``None`` for skipped elements."""
+    if format_type == 'russian':
+        return process_russian_element(elem)
+    if format_type == 'service':
+        return process_service_element(elem)
+    if format_type == 'product' and elem.findall('.//offer'):
+        return None
+    return process_offer_element(elem, build_category_path, format_type)
+
+
+def process_records_blob(blob, format_type):
+    """Process pool entry point for a chunk from ``iter_serialized_chunks``.
+
+    Category paths are left as ``'Undefined'``; the caller resolves them from
+    ``categoryId`` so the category tree never has to be sent to workers.
+    """
+    rows = []
+    for elem in ET.fromstring(blob):
+        row = process_record(elem, undefined_category_path, format_type)
+        if row is not None:
+            rows.append(row)
+    return rows
@@ -1,11 +1,23 @@
+import contextvars
 from pathlib import Path
 
 DATA_FILES_DIR = Path("data_files").resolve()
 
+current_output_dir = contextvars.ContextVar('current_output_dir', default="data_files")
 
-def get_validated_file_path(filename: str) -> Path:
+
+def output_dir() -> str:
+    """Directory converters write their results into; a request's scratch directory while one is set."""
+    return current_output_dir.get()
+
+
+def get_validated_file_path(filename: str, artifacts=None) -> Path:
     """Resolve and validate that filename is within DATA_FILES_DIR and is a file.
 
+    Names published to ``artifacts`` (an ``ArtifactStore``) resolve through
+    its index to their stored content; other names are looked up as plain
+    files in DATA_FILES_DIR.
+
     Raises:
         ValueError: If the resolved path is outside DATA_FILES_DIR.
         FileNotFoundError: If the resolved path is not an existing file.
@@ -16,6 +28,11 @@ def get_validated_file_path(filename: str) -> Path:
     except ValueError as exc:  # path traversal attempt
         raise ValueError("Invalid filename") from exc
 
+    if artifacts is not None:
+        stored = artifacts.resolve(filename)
+        if stored is not None:
+            return stored
+
     if not file_path.is_file():
         raise FileNotFoundError("File not found")
 
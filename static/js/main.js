@@ -243,13 +243,19 @@ function processUrl(url) {
         }
     })
     .then(data => {
-        hideProcessing();
         console.log('Parsed URL processing data:', data);
-        if (data.file_url) {
-            showResult(data.file_url, 'CSV');
-        } else {
+        if (!data.job_id) {
             throw new Error(data.detail || 'Неизвестная ошибка');
         }
+        return waitForJob(data.job_id);
+    })
+    .then(job => {
+        hideProcessing();
+        if (job.status === 'done' && job.file_url) {
+            showResult(job.file_url, 'CSV');
+        } else {
+            throw new Error(job.error || 'Неизвестная ошибка');
+        }
     })
     .catch(error => {
         hideProcessing();
@@ -258,6 +264,19 @@ function processUrl(url) {
     });
 }
 
+function waitForJob(jobId, interval = 1000) {
+    return fetch(`/status/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            console.log('Job status:', job.status, job.progress);
+            if (job.status === 'done' || job.status === 'failed' || !job.status) {
+                return job;
+            }
+            return new Promise(resolve => setTimeout(resolve, interval))
+                .then(() => waitForJob(jobId, interval));
+        });
+}
+
 function processFile(file) {
     showProcessing();
 
@@ -287,11 +306,14 @@ function processFile(file) {
         endpoint = '/convert_png_to_jpg';
     }
 
-    fetch(endpoint, {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    const request = endpoint === '/process_file' && file.size >= RESUMABLE_UPLOAD_MIN_SIZE && window.crypto && crypto.subtle
+        ? uploadResumable(file)
+        : fetch(endpoint, {
+            method: 'POST',
+            body: formData
+        }).then(response => response.json());
+
+    request
     .then(data => {
         hideProcessing();
         if (data.file_url) {
@@ -308,6 +330,83 @@ function processFile(file) {
     });
 }
 
+const RESUMABLE_UPLOAD_MIN_SIZE = 32 * 1024 * 1024;
+const UPLOAD_CHUNK_RETRIES = 5;
+
+function sha256Hex(buffer) {
+    return crypto.subtle.digest('SHA-256', buffer).then(hash =>
+        Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join(''));
+}
+
+function uploadRequest(url, options) {
+    return fetch(url, options).then(async response => {
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(data.detail || `HTTP ${response.status}`);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    });
+}
+
+function startUpload(file, key) {
+    const savedId = localStorage.getItem(key);
+    const created = () => uploadRequest('/uploads', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    }).then(upload => {
+        localStorage.setItem(key, upload.upload_id);
+        return upload;
+    });
+    if (!savedId) {
+        return created();
+    }
+    return uploadRequest(`/uploads/${savedId}`).catch(error => {
+        if (error.status === 404) {
+            localStorage.removeItem(key);
+            return created();
+        }
+        throw error;
+    });
+}
+
+async function putChunk(upload, file, index) {
+    const start = index * upload.chunk_size;
+    const buffer = await file.slice(start, Math.min(start + upload.chunk_size, file.size)).arrayBuffer();
+    const checksum = await sha256Hex(buffer);
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await uploadRequest(`/uploads/${upload.upload_id}/chunks/${index}`, {
+                method: 'PUT',
+                headers: {'X-Chunk-SHA256': checksum},
+                body: buffer
+            });
+        } catch (error) {
+            if (attempt + 1 >= UPLOAD_CHUNK_RETRIES || (error.status && error.status < 500)) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+        }
+    }
+}
+
+async function uploadResumable(file) {
+    const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    const upload = await startUpload(file, key);
+    const received = new Set(upload.received_chunks);
+    for (let index = 0; index < upload.chunk_count; index++) {
+        if (!received.has(index)) {
+            await putChunk(upload, file, index);
+        }
+        console.log(`Uploaded chunk ${index + 1} of ${upload.chunk_count}`);
+    }
+    const result = await uploadRequest(`/uploads/${upload.upload_id}/complete`, {method: 'POST'});
+    localStorage.removeItem(key);
+    return result;
+}
+
 function getFileTypeFromConversion(conversionType) {
     switch(conversionType) {
         case 'xml-to-csv': return 'CSV';
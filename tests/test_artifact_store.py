@@ -0,0 +1,88 @@
+import gzip
+from pathlib import Path
+import sys
+
+import brotli
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from artifact_store import ArtifactStore
+
+
+def convert(store, filename, text):
+    path = Path(store.scratch_dir()) / filename
+    path.write_text(text, encoding='utf-8')
+    blob, name = store.publish(path, filename)
+    store.remove_scratch(path.parent)
+    return blob, name
+
+
+def test_same_names_get_unique_artifacts_and_same_content_one_blob(tmp_path):
+    store = ArtifactStore(tmp_path / 'artifacts')
+    blob_a, name_a = convert(store, 'feed.csv', 'id\n1\n')
+    blob_b, name_b = convert(store, 'feed.csv', 'id\n2\n')
+    blob_c, name_c = convert(store, 'other.csv', 'id\n1\n')
+
+    assert len({name_a, name_b, name_c}) == 3
+    assert name_a.startswith('feed_') and name_a.endswith('.csv')
+    assert blob_a == blob_c != blob_b
+    assert store.resolve(name_b).read_text(encoding='utf-8') == 'id\n2\n'
+    assert store.resolve('feed.csv') is None
+    assert store.stats()['artifacts'] == 3
+    assert store.stats()['blobs'] == 2
+    assert not list(store.scratch_root.iterdir())
+
+
+def test_sweep_expires_evicts_and_removes_unreferenced_blobs(tmp_path):
+    store = ArtifactStore(tmp_path / 'artifacts', quota=10, ttl=100)
+    _, old = convert(store, 'old.csv', 'x' * 6)
+    _, shared = convert(store, 'a.csv', 'y' * 6)
+    _, shared_copy = convert(store, 'b.csv', 'y' * 6)
+    _, recent = convert(store, 'recent.csv', 'z' * 6)
+    connection = store.connect()
+    for name, accessed_at in ((old, 0), (shared, 150), (shared_copy, 160), (recent, 170)):
+        connection.execute('UPDATE artifacts SET accessed_at = ? WHERE name = ?', (accessed_at, name))
+
+    assert store.sweep(now=200) == {'expired': 1, 'evicted': 2, 'removed_blobs': 2}
+    assert [store.resolve(name) is not None for name in (old, shared, shared_copy, recent)] == [False, False, False, True]
+    assert len(list(store.blobs_dir.glob('*/*'))) == 1
+
+
+def test_compress_writes_smaller_brotli_and_gzip_copies(tmp_path):
+    store = ArtifactStore(tmp_path / 'artifacts', ttl=100)
+    text = 'id,name\n' + ''.join(f'{i},offer {i}\n' for i in range(500))
+    blob, name = convert(store, 'feed.csv', text)
+    small_blob, small = convert(store, 'small.csv', 'id\n1\n')
+    image_blob, image = convert(store, 'photo.png', text.upper())
+
+    for args in ((blob, name), (small_blob, small), (image_blob, image)):
+        store.compress(*args)
+
+    assert brotli.decompress(store.encoded_path(blob, 'br').read_bytes()).decode('utf-8') == text
+    assert gzip.decompress(store.encoded_path(blob, 'gzip').read_bytes()).decode('utf-8') == text
+    assert store.encoded_path(blob, 'gzip').stat().st_size < blob.stat().st_size
+    assert store.encoded_path(small_blob, 'br') is None
+    assert store.encoded_path(image_blob, 'gzip') is None
+    assert store.encoded_path(tmp_path / 'feed.csv', 'br') is None
+
+    store.connect().execute('UPDATE artifacts SET accessed_at = 0 WHERE name = ?', (name,))
+    store.sweep(now=200)
+    assert not list(blob.parent.iterdir())
+
+
+def test_sweep_keeps_the_newest_content_even_over_quota(tmp_path):
+    store = ArtifactStore(tmp_path / 'artifacts', quota=10, ttl=100)
+    _, small = convert(store, 'small.csv', 'x' * 6)
+    _, huge = convert(store, 'huge.csv', 'y' * 20)
+    connection = store.connect()
+    for name, accessed_at in ((small, 150), (huge, 160)):
+        connection.execute('UPDATE artifacts SET accessed_at = ? WHERE name = ?', (accessed_at, name))
+
+    assert store.sweep(now=200)['evicted'] == 1
+    assert store.resolve(huge) is not None
+    assert store.stats()['bytes'] > store.quota
+
+    _, newer = convert(store, 'newer.csv', 'z' * 6)
+    assert store.sweep()['evicted'] == 1
+    assert store.resolve(huge) is None
+    assert store.resolve(newer) is not None
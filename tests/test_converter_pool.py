@@ -0,0 +1,58 @@
+import asyncio
+import contextvars
+import os
+from pathlib import Path
+import sys
+import threading
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from converter_pool import ConverterPool
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+async def convert(data, source_name, suffix='.csv'):
+    return f"{source_name}{suffix}", data.upper(), os.getpid(), threading.current_thread().name
+
+
+async def current_request(data, source_name):
+    return request_id.get()
+
+
+async def fail(data, source_name):
+    raise ValueError(f"cannot convert {source_name}")
+
+
+def test_converters_run_off_the_event_loop():
+    pool = ConverterPool({'table': ('thread', 2), 'pdf': ('process', 1)})
+
+    async def run():
+        loop_thread = threading.current_thread().name
+        results = await asyncio.gather(*(pool.run('table', convert, b'a', f'f{i}') for i in range(4)))
+        assert [result[:2] for result in results] == [(f'f{i}.csv', b'A') for i in range(4)]
+        assert all(result[3].startswith('convert-table') and result[3] != loop_thread for result in results)
+
+        name, data, pid, _ = await pool.run('pdf', convert, b'b', 'doc', suffix='.json')
+        assert (name, data) == ('doc.json', b'B')
+        assert pid != os.getpid()
+
+        request_id.set('r1')
+        assert await pool.run('table', current_request, b'', 'ctx') == 'r1'
+
+        with pytest.raises(ValueError, match='cannot convert bad'):
+            await pool.run('table', fail, b'', 'bad')
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    stats = pool.stats()
+    assert (stats['table']['completed'], stats['table']['failed'], stats['table']['in_flight']) == (5, 1, 0)
+    assert stats['table']['workers'] == 2
+    assert stats['pdf']['executor'] == 'process'
+    assert stats['pdf']['completed'] == 1
+    assert stats['table']['queue_time_max'] >= 0
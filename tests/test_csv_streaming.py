@@ -0,0 +1,41 @@
+import asyncio
+from io import BytesIO
+from pathlib import Path
+import sys
+
+import pytest
+from starlette.datastructures import UploadFile
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from csv_utils import STREAM_HEADER_ROWS
+import main
+
+
+def broken_feed(offer_count):
+    offers = ''.join(f'<offer id="{i}"><name>Item {i}</name><price>{i}</price></offer>' for i in range(offer_count))
+    return (f'<?xml version="1.0" encoding="utf-8"?><yml_catalog><shop><offers>{offers}'
+            '<offer id="bad"><name>Broken</nme></offer></offers></shop></yml_catalog>').encode('utf-8')
+
+
+def test_stream_aborts_without_final_chunk_when_feed_breaks_after_header(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        upload = UploadFile(filename='feed.xml', file=BytesIO(broken_feed(STREAM_HEADER_ROWS + 10)))
+        response = await main.process_file_upload(upload, stream=True)
+        await response({'type': 'http'}, receive, send)
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+    assert messages[0]['type'] == 'http.response.start' and messages[0]['status'] == 200
+    bodies = [message for message in messages if message['type'] == 'http.response.body']
+    assert bodies and all(message.get('more_body') for message in bodies)
+    assert b''.join(message['body'] for message in bodies).startswith(b'\xef\xbb\xbf')
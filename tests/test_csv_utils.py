@@ -0,0 +1,98 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from csv_utils import CsvStream, OfferSpool, OfferStore
+
+
+def test_offer_store_round_trips_sparse_rows():
+    store = OfferStore()
+    store.extend([
+        {'id': '1', 'vendor': 'Acme', 'Цвет': 'red'},
+        {'id': '2', 'vendor': 'Acme'},
+        {'id': '3', 'Размер': '42'},
+    ])
+    rows = list(store.iter_rows(['id', 'vendor', 'Цвет', 'Размер', 'missing']))
+    assert rows == [
+        ['1', 'Acme', 'red', '', ''],
+        ['2', 'Acme', '', '', ''],
+        ['3', '', '', '42', ''],
+    ]
+    assert store.values.count('Acme') == 1
+
+
+def test_offer_store_tracks_fill_rate_and_undefined_columns():
+    store = OfferStore()
+    store.extend([
+        {'id': '1', 'category_path': 'Undefined', 'note': ' ', 'price': ''},
+        {'id': '2', 'category_path': 'Undefined', 'price': '10'},
+    ])
+    assert store.fill_rate('id') == 1.0
+    assert store.fill_rate('price') == 0.5
+    assert store.fill_rate('absent') == 0.0
+    assert store.undefined_only_columns() == {'category_path', 'note'}
+
+
+@pytest.mark.parametrize("store_class", [OfferStore, OfferSpool])
+def test_spool_matches_store(store_class):
+    rows = [
+        {'id': str(i), 'vendor': 'Acme' if i % 2 else 'Undefined', f'p{i % 5}': 'x\n"y"'}
+        for i in range(200)
+    ]
+    rows.append({'id': '200', None: 'skipped'})
+    store = store_class()
+    store.extend(rows)
+    fields = ['id', 'vendor', 'p0', 'p3', 'missing']
+    assert store.row_count == 201
+    assert store.fill_rate('vendor') == 200 / 201
+    assert store.undefined_only_columns() == set()
+    assert list(store.iter_rows(fields)) == [
+        [row.get(name, '') for name in fields] for row in rows
+    ]
+
+
+def test_spool_can_be_read_twice_and_appended_to():
+    with OfferSpool() as spool:
+        spool.add({'id': '1'})
+        assert list(spool.iter_rows(['id'])) == [['1']]
+        spool.add({'id': '2', 'name': 'Б'})
+        assert list(spool.iter_rows(['name', 'id'])) == [['', '1'], ['Б', '2']]
+    assert spool.file.closed
+
+
+def sorted_fields(store):
+    return sorted(store.columns)
+
+
+def identity_encoder(fields):
+    return lambda values: values
+
+
+def test_csv_stream_fixes_header_after_first_rows():
+    chunks = []
+    stream = CsvStream(chunks.append, sorted_fields, identity_encoder, header_rows=2, chunk_size=8)
+    stream.add({'id': '1', 'name': 'a'})
+    assert chunks == []
+    stream.add({'id': '2', 'vendor': 'Acme'})
+    stream.add({'id': '3', 'name': 'c;d', 'late': 'dropped'})
+    stream.finish()
+
+    assert len(chunks) == 2
+    assert b''.join(chunks).decode('utf-8-sig') == 'id;name;vendor\r\n1;a;\r\n2;;Acme\r\n3;"c;d";\r\n'
+    assert stream.row_count == 3
+    with pytest.raises(ValueError):
+        stream.reset()
+
+
+def test_csv_stream_short_feed_is_written_at_finish():
+    chunks = []
+    stream = CsvStream(chunks.append, sorted_fields, identity_encoder)
+    stream.add({'id': '1', 'name': 'a'})
+    stream.reset()
+    stream.extend([{'id': '1'}, {'id': '2', 'name': 'b'}])
+    assert chunks == []
+    stream.finish()
+    assert chunks == ['\ufeffid;name\r\n1;\r\n2;b\r\n'.encode('utf-8')]
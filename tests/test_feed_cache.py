@@ -0,0 +1,132 @@
+import io
+import json
+import os
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from feed_cache import FeedCache, ResultCache, StrategyMemory
+
+URL = 'https://example.com/feed.xml'
+
+
+def write_csv(path, text):
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def test_store_lookup_and_restore(tmp_path):
+    cache = FeedCache(tmp_path / 'cache')
+    output = write_csv(tmp_path / 'feed.csv', 'id;name\n1;a\n')
+    cache.store(URL, 'auto', {'ETag': '"v1"', 'Last-Modified': 'Mon, 05 Oct 2026 10:00:00 GMT'}, output)
+
+    entry = cache.lookup(URL, 'auto')
+    assert cache.conditional_headers(entry) == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Mon, 05 Oct 2026 10:00:00 GMT',
+    }
+    assert cache.lookup(URL, 'offer') is None
+
+    output.write_text('overwritten by another feed', encoding='utf-8')
+    assert cache.restore(entry, output)
+    assert output.read_text(encoding='utf-8') == 'id;name\n1;a\n'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_record_the_converted_file_suffix(tmp_path):
+    cache = FeedCache(tmp_path / 'cache')
+    bundle = tmp_path / 'feed.zip'
+    bundle.write_bytes(b'PK\x03\x04')
+    cache.store(URL, 'auto', {'ETag': '"v1"'}, bundle)
+    assert cache.lookup(URL, 'auto')['suffix'] == '.zip'
+
+    cache.store(URL, 'auto', {'ETag': '"v2"'}, write_csv(tmp_path / 'feed.csv', 'id\n'))
+    entry_path = cache.entry_path(URL, 'auto')
+    assert cache.lookup(URL, 'auto')['suffix'] == '.csv'
+    entry = json.loads(entry_path.read_text(encoding='utf-8'))
+    del entry['suffix']
+    entry_path.write_text(json.dumps(entry), encoding='utf-8')
+    assert cache.lookup(URL, 'auto') is None
+
+
+def test_store_without_validators_drops_entry(tmp_path):
+    cache = FeedCache(tmp_path / 'cache')
+    output = write_csv(tmp_path / 'feed.csv', 'id\n1\n')
+    cache.store(URL, 'auto', {'ETag': '"v1"'}, output)
+    cache.store(URL, 'auto', {}, output)
+    assert cache.lookup(URL, 'auto') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_lookup_ignores_entries_without_csv(tmp_path):
+    cache = FeedCache(tmp_path / 'cache')
+    cache.store(URL, 'auto', {'ETag': '"v1"'}, write_csv(tmp_path / 'feed.csv', 'id\n'))
+    cache.entry_path(URL, 'auto').with_suffix('.csv').unlink()
+    assert cache.lookup(URL, 'auto') is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FeedCache(tmp_path / 'cache', max_bytes=350)
+    output = write_csv(tmp_path / 'feed.csv', 'x' * 100)
+    for i in range(3):
+        cache.store(f'{URL}?{i}', 'auto', {'ETag': str(i)}, output)
+        os.utime(cache.entry_path(f'{URL}?{i}', 'auto'), (i, i))
+    cache.restore(cache.lookup(f'{URL}?0', 'auto'), tmp_path / 'restored.csv')
+    cache.store(f'{URL}?3', 'auto', {'ETag': '3'}, output)
+
+    assert cache.lookup(f'{URL}?0', 'auto') is not None
+    assert cache.lookup(f'{URL}?1', 'auto') is None
+    assert cache.lookup(f'{URL}?2', 'auto') is not None
+    assert cache.lookup(f'{URL}?3', 'auto') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_strategy_memory_orders_and_persists(tmp_path):
+    strategies = [{'name': 'standard'}, {'name': 'chrome'}, {'name': 'mobile'}]
+    memory = StrategyMemory(tmp_path / 'strategies.json', max_hosts=2)
+    assert [s['name'] for s in memory.order('a.example', strategies)] == ['standard', 'chrome', 'mobile']
+
+    memory.remember('a.example', 'mobile')
+    memory.remember('b.example', 'chrome')
+    reloaded = StrategyMemory(tmp_path / 'strategies.json', max_hosts=2)
+    assert [s['name'] for s in reloaded.order('a.example', strategies)] == ['mobile', 'standard', 'chrome']
+
+    reloaded.remember('c.example', 'chrome')
+    assert reloaded.preferred('a.example') is None
+    assert reloaded.preferred('b.example') == 'chrome'
+
+
+def test_result_cache_restores_by_input_and_parameters(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    out = tmp_path / 'out'
+    out.mkdir()
+    upload = io.BytesIO(b'id;name\n1;a\n')
+    upload.seek(3)
+    digest = cache.input_digest(upload)
+    assert upload.tell() == 3
+    assert digest == cache.input_digest(b'name\n1;a\n')
+
+    params = [['yandex_market'], {}]
+    assert cache.restore('process_csv_to_xml', params, digest, 'shop.csv', out) is None
+    cache.store('process_csv_to_xml', params, digest, 'shop.csv',
+                write_csv(out / 'shop_yandex_market.xml', '<offers/>'))
+
+    assert cache.restore('process_csv_to_xml', [['ozon'], {}], digest, 'shop.csv', out) is None
+    assert cache.restore('process_csv_to_xml', params, cache.input_digest(b'other'), 'shop.csv', out) is None
+    assert cache.restore('process_csv_to_xml', params, digest, 'shop.v2.csv', out) is None
+    path, filename = cache.restore('process_csv_to_xml', params, digest, 'supplier.csv', out)
+    assert filename == 'supplier_yandex_market.xml'
+    assert Path(path).read_text(encoding='utf-8') == '<offers/>'
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_result_cache_keys_only_output_parameters():
+    def convert(data, source_name, target_node='auto', streaming=None, parallel=None, encoding=None):
+        pass
+
+    params = ResultCache.output_params(convert, (), {'streaming': True, 'parallel': False, 'encoding': 'cp1251'})
+    assert params == {'target_node': 'auto'}
+    assert ResultCache.output_params(convert, ('auto',), {}) == params
+    assert ResultCache.output_params(convert, ('offer',), {'streaming': False}) == {'target_node': 'offer'}
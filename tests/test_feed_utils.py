@@ -0,0 +1,194 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+from pathlib import Path
+import random
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import feed_utils
+from feed_utils import (TextSniffer, build_category_paths, detect_format, iter_feed_elements, iter_serialized_chunks,
+                        load_category_paths, parse_recovering, parse_repaired, scan_feed_header,
+                        sniff_format)
+
+YML_FEED = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<yml_catalog><shop><categories>'
+    '<category id="1">Root</category>'
+    '<category id="2" parentId="1">Child</category>'
+    '</categories><offers>'
+    '<offer id="a"><name>A</name><categoryId>2</categoryId></offer>'
+    '<offer id="b"><name>B</name><categoryId>1</categoryId></offer>'
+    '</offers></shop></yml_catalog>'
+)
+
+
+def test_scan_feed_header_detects_offer_format_and_categories():
+    format_type, categories, parents = scan_feed_header(YML_FEED)
+    assert format_type == 'offer'
+    assert categories == {'1': 'Root', '2': 'Child'}
+    assert parents == {'2': '1'}
+
+
+def test_scan_feed_header_stops_at_first_offer_without_categories():
+    feed = '<yml_catalog><shop><offers><offer id="a"/>' + '<offer id="x"/>' * 1000 + '<broken></shop>'
+    assert scan_feed_header(feed) == ('offer', {}, {})
+
+
+def test_scan_feed_header_unknown_format():
+    format_type, _, _ = scan_feed_header('<root><item/></root>')
+    assert format_type is None
+
+
+def test_sniff_format_reads_only_the_prefix():
+    feed = '<catalog><product id="1"/>' + '<product id="x"/>' * 50000 + '</catalog>'
+    assert sniff_format(feed, limit=100) == 'product'
+    assert sniff_format('<catalog><categories>' + ' ' * 200, limit=100) is None
+    assert sniff_format('<catalog><a></b>', limit=100) is None
+
+
+def test_sniff_format_defers_to_detect_format_priority():
+    feed = '<catalog><product id="1"><name>a</name></product><offer id="2"/></catalog>'
+    assert sniff_format(feed) is None
+    assert detect_format(ET.fromstring(feed)) == 'offer'
+    assert sniff_format('<r><service/><ЭлементСправочника/></r>') is None
+    assert sniff_format('<r><offer id="1"/><product/></r>') == 'offer'
+    assert sniff_format('<r><productName/><product id="1"/></r>') == 'product'
+
+
+def test_detect_format_follows_findall_priority():
+    assert detect_format(ET.fromstring('<r><product/><offer/></r>')) == 'offer'
+    assert detect_format(ET.fromstring('<r><service/><ЭлементСправочника/></r>')) == 'russian'
+    assert detect_format(ET.fromstring('<service><name/></service>')) == 'service'
+    assert detect_format(ET.fromstring('<offer><item/></offer>')) is None
+
+
+def test_format_cache_keeps_most_recent(monkeypatch):
+    monkeypatch.setattr(feed_utils, 'format_cache', feed_utils.OrderedDict())
+    monkeypatch.setattr(feed_utils, 'FORMAT_CACHE_SIZE', 2)
+    feed_utils.remember_format('a', 'offer')
+    feed_utils.remember_format('b', 'product')
+    assert feed_utils.cached_format('a') == 'offer'
+    feed_utils.remember_format('c', 'service')
+    assert feed_utils.cached_format('b') is None
+    assert list(feed_utils.format_cache) == ['a', 'c']
+
+
+def test_text_sniffer_falls_back_to_full_document():
+    sniffer = TextSniffer('<?xml?><Yml_Catalog>' + 'x' * 100 + '<Shop>', limit=50)
+    assert sniffer.contains('<yml_catalog')
+    assert sniffer.contains('<shop')
+    assert not sniffer.contains('<offer')
+
+
+def test_text_sniffer_scans_the_rest_in_overlapping_chunks(monkeypatch):
+    monkeypatch.setattr(feed_utils, 'SCAN_CHUNK_SIZE', 8)
+    document = ('<?xml?><catalog>' + 'x' * 45 + '<Товары>' + 'y' * 30 + '</catalog>').encode('utf-8')
+    source = BytesIO(document)
+    source.seek(2)
+    sniffer = TextSniffer(source, limit=16, encoding='utf-8')
+    assert source.tell() == 2
+    assert sniffer.contains('<товары')
+    assert not sniffer.contains('<offers')
+    assert source.tell() == 2
+    assert TextSniffer(document, limit=16, encoding='utf-8').contains('</catalog>')
+    assert TextSniffer(document.decode('utf-8'), limit=16).contains('<товары')
+
+
+def test_iter_feed_elements_yields_offers_in_order():
+    source = BytesIO(YML_FEED.encode('utf-8'))
+    ids = [elem.get('id') for elem in iter_feed_elements(source, 'offer')]
+    assert ids == ['a', 'b']
+
+
+def test_iter_feed_elements_keeps_nested_records_attached():
+    feed = '<catalog><product id="outer"><product id="inner"/><offer/></product></catalog>'
+    seen = [(elem.get('id'), len(elem.findall('.//offer')))
+            for elem in iter_feed_elements(feed, 'product')]
+    assert seen == [('outer', 1), ('inner', 0)]
+
+
+def test_iter_feed_elements_matches_findall_order():
+    feed = ('<catalog><product id="1"><product id="2"><product id="3"/></product><product id="4"/></product>'
+            '<group><product id="5"/></group><product id="6"/></catalog>')
+    expected = [elem.get('id') for elem in ET.fromstring(feed).findall('.//product')]
+    assert [elem.get('id') for elem in iter_feed_elements(feed, 'product')] == expected == list('123456')
+
+
+def test_iter_serialized_chunks_groups_by_size_and_keeps_order():
+    feed = '<offers>' + ''.join(f'<offer id="{i}"><name>Товар {i}</name></offer>' for i in range(10)) + '</offers>'
+    elements = list(ET.fromstring(feed))
+    chunks = list(iter_serialized_chunks(elements, chunk_size=100))
+    assert len(chunks) > 1
+    ids = [elem.get('id') for chunk in chunks for elem in ET.fromstring(chunk)]
+    assert ids == [str(i) for i in range(10)]
+    assert ET.fromstring(chunks[0])[0].findtext('name') == 'Товар 0'
+
+
+def walk_category_path(categories, parents, cid):
+    path = []
+    current_cid = cid
+    visited = set()
+    while current_cid and current_cid in categories and current_cid not in visited:
+        visited.add(current_cid)
+        category_name = categories.get(current_cid, 'Undefined')
+        if category_name and category_name != 'Undefined':
+            path.append(category_name)
+        current_cid = parents.get(current_cid)
+    if not path:
+        return categories.get(cid, 'Undefined')
+    return '///'.join(reversed(path))
+
+
+def test_build_category_paths_matches_parent_walk_including_cycles():
+    rnd = random.Random(4)
+    for _ in range(200):
+        ids = [str(i) for i in range(rnd.randint(1, 30))]
+        categories = {cid: rnd.choice([f'C{cid}', f'C{cid}', 'Undefined']) for cid in ids}
+        parents = {cid: rnd.choice(ids + ['missing']) for cid in ids if rnd.random() < 0.8}
+        paths = build_category_paths(categories, parents)
+        for cid in ids:
+            assert paths[cid] == walk_category_path(categories, parents, cid)
+
+
+def test_load_category_paths_uses_cache(tmp_path):
+    categories = {'1': 'Root', '2': 'Child'}
+    parents = {'2': '1'}
+    assert load_category_paths(categories, parents, tmp_path) == {'1': 'Root', '2': 'Root///Child'}
+    cached = list(tmp_path.glob('*.json'))
+    assert len(cached) == 1
+    cached[0].write_text('{"2": "cached"}', encoding='utf-8')
+    assert load_category_paths(categories, parents, tmp_path) == {'2': 'cached'}
+
+
+def test_load_category_paths_concurrent_writers_leave_valid_cache(tmp_path):
+    categories = {str(i): f'Category {i}' for i in range(2000)}
+    parents = {str(i): str(i - 1) for i in range(1, 2000, 2)}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: load_category_paths(categories, parents, tmp_path), range(16)))
+    assert all(result == results[0] for result in results)
+    cached = list(tmp_path.glob('*.json'))
+    assert len(cached) == 1
+    assert json.loads(cached[0].read_text(encoding='utf-8')) == results[0]
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_parse_recovering_repairs_locally():
+    pytest.importorskip("lxml")
+    root = parse_recovering('<r><a>x\x01y</a><c>&nbsp;z&bogus;</c><b>AT&T &amp; M & M</b><!-- note -->'
+                            '<d><![CDATA[<p>R&amp;D\x0b</p>]]></d><e>&lt;</e></r>')
+    assert [(child.tag, child.text) for child in root] == [
+        ('a', 'xy'), ('c', '\xa0z&bogus;'), ('b', 'AT&T & M & M'), ('d', '<p>R&amp;D</p>'), ('e', '<')]
+    root = parse_recovering('<?xml version="1.0" encoding="windows-1251"?><r>Цена</r>'.encode('cp1251'))
+    assert root.text == 'Цена'
+    with pytest.raises(ET.ParseError):
+        parse_recovering('not xml at all')
+
+
+def test_parse_repaired_matches_regex_cleanup():
+    root = parse_repaired('<r><a>x\x01y</a><b>AT&T</b></r>')
+    assert [child.text for child in root] == ['xy', 'AT&T']
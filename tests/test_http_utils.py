@@ -0,0 +1,43 @@
+from pathlib import Path
+import sys
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from http_utils import content_disposition, etag_matches, parse_accept_encoding, parse_range, select_encoding
+
+
+def test_select_encoding_follows_server_preference_and_q_values():
+    assert parse_accept_encoding('gzip, br;q=0.5, identity;q=0') == {'gzip': 1.0, 'br': 0.5, 'identity': 0.0}
+    assert select_encoding('gzip, deflate, br', ['br', 'gzip']) == 'br'
+    assert select_encoding('gzip, br;q=0', ['br', 'gzip']) == 'gzip'
+    assert select_encoding('*', ['br', 'gzip']) == 'br'
+    assert select_encoding('*;q=0, gzip', ['br', 'gzip']) == 'gzip'
+    assert select_encoding('deflate', ['br', 'gzip']) is None
+    assert select_encoding(None, ['br', 'gzip']) is None
+
+
+def test_etag_matches_uses_weak_comparison():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('"x", W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abc-br"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_parse_range():
+    assert parse_range('bytes=0-99', 1000) == (0, 99)
+    assert parse_range('bytes=900-', 1000) == (900, 999)
+    assert parse_range('bytes=950-2000', 1000) == (950, 999)
+    assert parse_range('bytes=-100', 1000) == (900, 999)
+    assert parse_range('bytes=-5000', 1000) == (0, 999)
+    for header in (None, '', 'items=0-1', 'bytes=0-1,5-6', 'bytes=5-1', 'bytes=a-b', 'bytes=-'):
+        assert parse_range(header, 1000) is None
+    for header in ('bytes=1000-', 'bytes=-0'):
+        with pytest.raises(ValueError):
+            parse_range(header, 1000)
+
+
+def test_content_disposition_quotes_non_ascii_names():
+    assert content_disposition('feed_1a2b.csv') == 'attachment; filename="feed_1a2b.csv"'
+    assert content_disposition('фид.csv') == "attachment; filename*=utf-8''%D1%84%D0%B8%D0%B4.csv"
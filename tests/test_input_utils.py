@@ -0,0 +1,133 @@
+import bz2
+import codecs
+import csv
+import gzip
+import io
+import lzma
+from pathlib import Path
+import sys
+import threading
+import zipfile
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from input_utils import (
+    DownloadBuffer, archive_members, decode_head, detect_compression, detect_encoding, iter_stripped_lines,
+    open_decompressed, open_text, parse_xml, strip_compression_suffix,
+)
+
+CP1251_FEED = '<?xml version="1.0" encoding="windows-1251"?><r><a>Цена</a></r>'.encode('cp1251')
+
+
+@pytest.mark.parametrize("data, declared, expected", [
+    (codecs.BOM_UTF8 + '<r>ф</r>'.encode(), None, 'utf-8-sig'),
+    ('<r>ф</r>'.encode('utf-16'), None, 'utf-16'),
+    ('<r>Цена</r>'.encode(), None, 'utf-8'),
+    ('<r>Цена</r>'.encode('cp1251'), None, 'windows-1251'),
+    (CP1251_FEED, None, 'cp1251'),
+    (b'<?xml version="1.0" encoding="windows-1251"?><r/>', None, 'cp1251'),
+    (b'<r/>', 'koi8-r', 'koi8-r'),
+    (b'<r/>', 'no-such-charset', 'utf-8'),
+])
+def test_detect_encoding(data, declared, expected):
+    assert detect_encoding(data, declared) == expected
+
+
+def test_detect_encoding_prefers_valid_utf8_over_declaration():
+    data = '<?xml version="1.0" encoding="windows-1251"?><r>Цена</r>'.encode()
+    assert detect_encoding(data) == 'utf-8'
+
+
+def test_decode_head_does_not_split_characters():
+    assert decode_head('Цена'.encode(), 'utf-8', size=3) == 'Ц'
+    assert decode_head('text', size=2) == 'te'
+
+
+def test_open_text_reads_csv_incrementally():
+    data = 'id;name\r\n1;"Стул\nкухонный"\r\n'.encode('cp1251')
+    with open_text(data, 'cp1251') as stream:
+        rows = list(csv.DictReader(stream, delimiter=';'))
+    assert rows == [{'id': '1', 'name': 'Стул\nкухонный'}]
+
+
+def test_file_objects_are_read_without_being_consumed_or_closed():
+    upload = io.BytesIO(CP1251_FEED)
+    assert detect_encoding(upload) == 'cp1251'
+    assert decode_head(upload, size=5) == '<?xml'
+    assert upload.tell() == 0
+    with open_text(upload) as stream:
+        assert 'Цена' in stream.read()
+    assert not upload.closed
+    upload.seek(0)
+    assert parse_xml(upload).find('a').text == 'Цена'
+
+
+def test_iter_stripped_lines_matches_strip():
+    text = '\n  \n  id;name\n\n1;a\n  \n2;b  \n \n\n'
+    assert ''.join(iter_stripped_lines(text.splitlines(keepends=True))) == text.strip()
+
+
+def test_parse_xml_uses_detected_encoding():
+    assert parse_xml(CP1251_FEED).find('a').text == 'Цена'
+    assert parse_xml('<r>Цена</r>'.encode('cp1251'), 'windows-1251').text == 'Цена'
+    assert parse_xml(codecs.BOM_UTF8 + '<r>ф</r>'.encode()).text == 'ф'
+
+
+def test_download_buffer_is_read_while_it_is_written():
+    data = bytes(range(256)) * 1000
+    download = DownloadBuffer()
+
+    def write():
+        for start in range(0, len(data), 4096):
+            download.write(data[start:start + 4096])
+        download.finish()
+
+    writer = threading.Thread(target=write)
+    with download.open() as stream:
+        writer.start()
+        assert stream.read(10) == data[:10]
+        stream.seek(0)
+        assert stream.read() == data
+        assert stream.seek(0, io.SEEK_END) == len(data)
+    writer.join()
+    download.close()
+
+
+def test_download_buffer_raises_download_errors_to_readers():
+    download = DownloadBuffer()
+    download.write(b'<r>')
+    download.finish(ConnectionResetError('reset'))
+    with download.open() as stream:
+        assert stream.read(3) == b'<r>'
+        with pytest.raises(IOError, match='reset'):
+            stream.read(10)
+    download.close()
+
+
+@pytest.mark.parametrize("compress, compression", [
+    (gzip.compress, 'gzip'), (bz2.compress, 'bz2'), (lzma.compress, 'xz'),
+])
+def test_compressed_feeds_decompress_as_streams(compress, compression):
+    source = io.BytesIO(compress(CP1251_FEED * 1000))
+    assert detect_compression(source) == compression
+    assert source.tell() == 0
+    with open_decompressed(source, compression) as stream:
+        assert detect_encoding(stream) == 'cp1251'
+        assert stream.read() == CP1251_FEED * 1000
+    assert detect_compression(CP1251_FEED) is None
+    assert strip_compression_suffix('feed.XML.gz', 'gzip') == 'feed.XML'
+    assert strip_compression_suffix('feed.xml', 'bz2') == 'feed.xml'
+
+
+def test_archive_members_skip_folders_and_metadata():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        for name in ('a/feed.xml', 'b.csv', 'a/', '__MACOSX/a/._feed.xml', '.hidden.xml', 'notes.txt', 'empty.xml'):
+            archive.writestr(name, '' if name.endswith('/') or name == 'empty.xml' else '<r/>')
+    data.seek(0)
+    assert detect_compression(data) == 'zip'
+    with zipfile.ZipFile(data) as archive:
+        assert [info.filename for info in archive_members(archive)] == ['a/feed.xml', 'b.csv']
+        assert [info.filename for info in archive_members(archive, ('.xml',))] == ['a/feed.xml']
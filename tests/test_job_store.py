@@ -0,0 +1,54 @@
+from datetime import timedelta
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from csv_utils import OfferStore
+from job_store import JobProgress, JobStore
+
+
+def test_job_lifecycle(tmp_path):
+    store = JobStore(tmp_path / 'jobs.sqlite3')
+    job = store.create('https://example.com/feed.xml', preset_id='p1')
+    assert job['status'] == 'queued'
+    assert job['target_node'] == 'auto'
+
+    store.mark_running(job['id'])
+    progress = JobProgress()
+    progress.bytes_received = 10
+    progress.store = OfferStore()
+    progress.store.add({'id': '1'})
+    store.mark_done(job['id'], 'https://example.com/out.csv', progress)
+
+    done = store.get(job['id'])
+    assert done['status'] == 'done'
+    assert done['file_url'] == 'https://example.com/out.csv'
+    assert (done['bytes_received'], done['bytes_total'], done['records']) == (10, None, 1)
+    assert store.latest_for_preset('p1')['id'] == job['id']
+    assert store.get('missing') is None
+
+
+def test_unfinished_jobs_survive_reopening(tmp_path):
+    store = JobStore(tmp_path / 'jobs.sqlite3')
+    queued = store.create('https://example.com/a.xml')
+    running = store.create('https://example.com/b.xml')
+    failed = store.create('https://example.com/c.xml')
+    store.mark_running(running['id'])
+    store.mark_failed(failed['id'], 'boom')
+    store.close()
+
+    reopened = JobStore(tmp_path / 'jobs.sqlite3')
+    assert reopened.unfinished() == [queued['id'], running['id']]
+    assert reopened.get(failed['id'])['error'] == 'boom'
+
+
+def test_prune_drops_old_finished_jobs(tmp_path):
+    store = JobStore(tmp_path / 'jobs.sqlite3', retention=timedelta(0))
+    finished = store.create('https://example.com/a.xml')
+    store.mark_done(finished['id'], 'url')
+    store.connect().execute("UPDATE jobs SET updated_at = '2000-01-01T00:00:00+00:00'")
+    queued = store.create('https://example.com/b.xml')
+    store.prune()
+    assert store.get(finished['id']) is None
+    assert store.get(queued['id']) is not None
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from pathlib import Path
+import random
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+pytest.importorskip("bs4")
+
+from benchmarks.bench_offer_extraction import build_sample_feed, category_path, legacy_process_offer_element
+import offer_utils
+from offer_utils import (OrderedValues, clean_description, parse_description, process_offer_element,
+                         remove_duplicates_from_delimited_string)
+
+TAGS = ['name', 'price', 'categoryId', 'description', 'desc', 'picture', 'images', 'image', 'param',
+        'param_name_color', 'stock', 'fabric', 'features', 'feature', 'Size', 'tag', 'offer', 'extra',
+        'param_name', 'tag_id', 'tag', 'param']
+TEXTS = ['', '  ', 'red', '42?', 'S?M', 'http://x/a.jpg', 'img/b', '<b>bold</b> text', '5', 'Undefined',
+         'red///blue', ' a /// ///b', 'red']
+ATTRS = ['name', 'id', 'unit', 'image_url', 'photo', 'cost']
+
+
+def random_element(rnd, tag, depth):
+    elem = ET.Element(tag)
+    for attr in rnd.sample(ATTRS, rnd.randint(0, 2)):
+        elem.set(attr, rnd.choice(TEXTS + ['https://x/c.png']))
+    elem.text = rnd.choice(TEXTS)
+    if depth < 3:
+        for _ in range(rnd.randint(0, 5)):
+            elem.append(random_element(rnd, rnd.choice(TAGS), depth + 1))
+    return elem
+
+
+@pytest.mark.parametrize("format_type", ['offer', 'product'])
+def test_single_pass_matches_legacy_on_random_trees(format_type):
+    rnd = random.Random(format_type)
+    for _ in range(1000):
+        elem = random_element(rnd, format_type, 0)
+        assert (process_offer_element(elem, category_path, format_type)
+                == legacy_process_offer_element(elem, category_path, format_type))
+
+
+def test_single_pass_matches_legacy_on_sample_feed():
+    for elem in ET.fromstring(build_sample_feed(50)).iter('offer'):
+        assert (process_offer_element(elem, category_path, 'offer')
+                == legacy_process_offer_element(elem, category_path, 'offer'))
+
+
+@pytest.mark.parametrize("description", [
+    'plain text', '  padded\n text \t', 'a > b "quoted"', 'Размер: 42', '\xa0nbsp',
+    '<p>Hello <b>w</b></p>line<br/>x', 'a &lt;b&gt; c', 'tom & jerry', 'cr\r\nlf',
+])
+def test_clean_description_matches_full_parse(description):
+    assert clean_description(description) == parse_description(description)
+
+
+def test_clean_description_reuses_cached_result(monkeypatch):
+    calls = []
+
+    def fake_parse(description, parser=None):
+        calls.append(description)
+        return '<p>parsed</p>'
+
+    monkeypatch.setattr(offer_utils, 'parse_description', fake_parse)
+    monkeypatch.setattr(offer_utils, 'description_cache', OrderedDict())
+    assert clean_description('<b>cached</b>') == '<p>parsed</p>'
+    assert clean_description('<b>cached</b>') == '<p>parsed</p>'
+    assert clean_description('plain') == '<p>plain</p>'
+    assert calls == ['<b>cached</b>']
+
+
+def test_ordered_values_dedupes_split_items_in_order():
+    values = OrderedValues(' a ///b', 'b///c')
+    values.add('a')
+    assert str(values) == 'a///b///c'
+    assert remove_duplicates_from_delimited_string('x/// y///x///') == 'x///y'
+
+
+def test_repeated_params_are_accumulated():
+    elem = ET.fromstring('<offer>' + '<param name="Цвет">red</param>' * 500 + '<param name="Цвет">blue</param></offer>')
+    row = process_offer_element(elem, category_path, 'offer')
+    assert row['Цвет'] == ', '.join(['red'] * 500 + ['blue'])
+    assert row['param'] == 'red///blue'
+    assert row['param_name'] == '///'.join(['Цвет'] * 501)
@@ -5,6 +5,7 @@ import pytest
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+from artifact_store import ArtifactStore
 from path_utils import get_validated_file_path, DATA_FILES_DIR
 
 
@@ -23,3 +24,13 @@ def test_get_validated_file_path_malicious():
 def test_get_validated_file_path_not_found():
     with pytest.raises(FileNotFoundError):
         get_validated_file_path("missing.txt")
+
+
+def test_get_validated_file_path_resolves_artifacts(tmp_path):
+    store = ArtifactStore(tmp_path / 'artifacts')
+    output = tmp_path / 'feed.csv'
+    output.write_text("id\n1\n")
+    blob, name = store.publish(output, 'feed.csv')
+    assert get_validated_file_path(name, store) == blob
+    with pytest.raises(FileNotFoundError):
+        get_validated_file_path('feed.csv', store)
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from upload_store import UploadError, UploadStore
+
+DATA = bytes(range(256)) * 4096
+
+
+async def pieces(data, size=1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def put(store, upload_id, index, data, checksum=None):
+    checksum = checksum or hashlib.sha256(data).hexdigest()
+    return asyncio.run(store.write_chunk(upload_id, index, pieces(data), checksum))
+
+
+def test_chunks_assemble_in_place_out_of_order(tmp_path):
+    store = UploadStore(tmp_path)
+    upload = store.create('feed.xml', len(DATA), chunk_size=300 * 1024)
+    assert upload['chunk_count'] == 4
+    size = upload['chunk_size']
+
+    put(store, upload['upload_id'], 2, DATA[2 * size:3 * size])
+    status = put(store, upload['upload_id'], 0, DATA[:size])
+    assert status['received_chunks'] == [0, 2]
+    assert status['offset'] == size
+    assert not status['complete']
+
+    put(store, upload['upload_id'], 3, DATA[3 * size:])
+    status = put(store, upload['upload_id'], 1, DATA[size:2 * size])
+    assert status['complete']
+    assert status['offset'] == len(DATA)
+    assert store.data_path(upload['upload_id']).read_bytes() == DATA
+
+
+def test_bad_chunks_are_not_recorded(tmp_path):
+    store = UploadStore(tmp_path)
+    upload = store.create('feed.xml', len(DATA), chunk_size=512 * 1024)
+    chunk = DATA[:512 * 1024]
+
+    with pytest.raises(UploadError, match='checksum'):
+        put(store, upload['upload_id'], 0, chunk, checksum='0' * 64)
+    with pytest.raises(UploadError, match='bytes'):
+        put(store, upload['upload_id'], 0, chunk[:-1])
+    with pytest.raises(UploadError, match='out of range'):
+        put(store, upload['upload_id'], 5, chunk)
+    assert store.status(upload['upload_id'])['received_chunks'] == []
+
+    put(store, upload['upload_id'], 0, chunk)
+    put(store, upload['upload_id'], 0, b'x' * len(chunk))
+    assert store.data_path(upload['upload_id']).read_bytes()[:len(chunk)] == chunk
+
+
+def test_unknown_uploads_and_pruning(tmp_path):
+    store = UploadStore(tmp_path, ttl=-1)
+    with pytest.raises(KeyError):
+        store.status('0' * 32)
+    with pytest.raises(KeyError):
+        store.status('../escape')
+    upload = store.create('feed.xml', 10)
+    store.prune()
+    with pytest.raises(KeyError):
+        store.status(upload['upload_id'])
+
+
+def test_overlapping_writes_of_one_chunk_are_serialised(tmp_path):
+    store = UploadStore(tmp_path)
+    upload = store.create('feed.xml', len(DATA), chunk_size=len(DATA))
+    checksum = hashlib.sha256(DATA).hexdigest()
+
+    async def slow_pieces(started):
+        half = len(DATA) // 2
+        yield DATA[:half]
+        started.set()
+        await asyncio.sleep(0.05)
+        yield DATA[half:]
+
+    async def main():
+        started = asyncio.Event()
+        first = asyncio.create_task(store.write_chunk(upload['upload_id'], 0, slow_pieces(started), checksum))
+        await started.wait()
+        return await asyncio.gather(first, store.write_chunk(upload['upload_id'], 0, pieces(DATA[::-1]), checksum))
+
+    first, second = asyncio.run(main())
+    assert first['complete'] and second['complete']
+    assert store.data_path(upload['upload_id']).read_bytes() == DATA
+    received = (tmp_path / upload['upload_id'] / 'received').read_text().splitlines()
+    assert received == [f"0 {checksum}"]
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import time
+import uuid
+import weakref
+
+UPLOADS_DIR = Path("cache") / "uploads"
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_UPLOAD_CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+UPLOAD_TTL = 24 * 60 * 60
+# Request bodies arrive in small pieces; batch them so each disk write is one thread hop.
+UPLOAD_WRITE_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """A chunk or upload request that does not fit the upload it targets."""
+
+
+class UploadStore:
+    """Resumable uploads assembled in place on local disk.
+
+    Every upload is a directory holding ``meta.json`` (file name, size and
+    chunk size), the ``data`` file that chunks are written into at their
+    final offsets, and an append-only ``received`` log with one
+    ``index sha256`` line per verified chunk. A finished upload is therefore
+    already the complete file and is converted without another copy.
+    Uploads untouched for ``ttl`` seconds are removed by ``prune``.
+    """
+
+    def __init__(self, root=UPLOADS_DIR, ttl=UPLOAD_TTL):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.chunk_locks = weakref.WeakValueDictionary()
+
+    def upload_dir(self, upload_id):
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise KeyError(upload_id)
+        return self.root / upload_id
+
+    def create(self, filename, size, chunk_size=UPLOAD_CHUNK_SIZE):
+        if size < 0:
+            raise UploadError("Upload size must not be negative")
+        chunk_size = min(max(chunk_size, MIN_UPLOAD_CHUNK_SIZE), MAX_UPLOAD_CHUNK_SIZE)
+        upload_id = uuid.uuid4().hex
+        upload_dir = self.upload_dir(upload_id)
+        upload_dir.mkdir(parents=True)
+        with open(upload_dir / 'data', 'wb') as f:
+            f.truncate(size)
+        meta = {'upload_id': upload_id, 'filename': filename, 'size': size, 'chunk_size': chunk_size}
+        with open(upload_dir / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        (upload_dir / 'received').touch()
+        return self.status(upload_id)
+
+    def meta(self, upload_id):
+        try:
+            with open(self.upload_dir(upload_id) / 'meta.json', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(upload_id)
+
+    def chunk_count(self, meta):
+        return max(1, -(-meta['size'] // meta['chunk_size']))
+
+    def received_chunks(self, upload_id):
+        try:
+            with open(self.upload_dir(upload_id) / 'received', encoding='ascii') as f:
+                return sorted({int(line.split()[0]) for line in f if line.strip()})
+        except OSError:
+            raise KeyError(upload_id)
+
+    def status(self, upload_id):
+        """Describe the upload; ``offset`` is where a sequential client should resume."""
+        meta = self.meta(upload_id)
+        received = self.received_chunks(upload_id)
+        contiguous = 0
+        for index in received:
+            if index != contiguous:
+                break
+            contiguous += 1
+        return {
+            **meta,
+            'chunk_count': self.chunk_count(meta),
+            'received_chunks': received,
+            'offset': min(contiguous * meta['chunk_size'], meta['size']),
+            'complete': len(received) == self.chunk_count(meta),
+        }
+
+    def chunk_range(self, meta, index):
+        if not 0 <= index < self.chunk_count(meta):
+            raise UploadError(f"Chunk index {index} is out of range")
+        start = index * meta['chunk_size']
+        return start, min(start + meta['chunk_size'], meta['size']) - start
+
+    async def write_chunk(self, upload_id, index, chunks, checksum):
+        """Write the async iterable ``chunks`` as chunk ``index`` and verify its SHA-256.
+
+        The chunk is recorded as received only if its length and checksum
+        match; resending a chunk that was already received changes nothing.
+        Concurrent writes of the same chunk run one after the other.
+        """
+        meta = self.meta(upload_id)
+        start, expected_size = self.chunk_range(meta, index)
+        lock = self.chunk_locks.get((upload_id, index))
+        if lock is None:
+            lock = self.chunk_locks[upload_id, index] = asyncio.Lock()
+        async with lock:
+            if index in await asyncio.to_thread(self.received_chunks, upload_id):
+                async for _ in chunks:
+                    pass
+                return self.status(upload_id)
+            digest = await self.write_range(self.data_path(upload_id), start, expected_size, chunks, index)
+            if digest != checksum.lower():
+                raise UploadError(f"Chunk {index} checksum mismatch")
+            await asyncio.to_thread(self.record_chunk, upload_id, index, digest)
+        return self.status(upload_id)
+
+    async def write_range(self, path, start, expected_size, chunks, index):
+        """Write ``chunks`` at ``start`` from a worker thread and return their SHA-256."""
+        digest = hashlib.sha256()
+
+        def write(block, offset):
+            digest.update(block)
+            view = memoryview(block)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+
+        fd = await asyncio.to_thread(os.open, path, os.O_WRONLY)
+        try:
+            offset = start
+            written = 0
+            pending = bytearray()
+            async for data in chunks:
+                written += len(data)
+                if written > expected_size:
+                    raise UploadError(f"Chunk {index} is larger than {expected_size} bytes")
+                pending += data
+                if len(pending) >= UPLOAD_WRITE_SIZE:
+                    await asyncio.to_thread(write, pending, offset)
+                    offset += len(pending)
+                    pending = bytearray()
+            if pending:
+                await asyncio.to_thread(write, pending, offset)
+        finally:
+            os.close(fd)
+        if written != expected_size:
+            raise UploadError(f"Chunk {index} has {written} bytes, expected {expected_size}")
+        return digest.hexdigest()
+
+    def record_chunk(self, upload_id, index, digest):
+        with open(self.upload_dir(upload_id) / 'received', 'a', encoding='ascii') as f:
+            f.write(f"{index} {digest}\n")
+
+    def data_path(self, upload_id):
+        return self.upload_dir(upload_id) / 'data'
+
+    def remove(self, upload_id):
+        shutil.rmtree(self.upload_dir(upload_id), ignore_errors=True)
+
+    def prune(self):
+        cutoff = time.time() - self.ttl
+        try:
+            upload_dirs = list(self.root.iterdir())
+        except OSError:
+            return
+        for upload_dir in upload_dirs:
+            try:
+                touched = (upload_dir / 'received').stat().st_mtime
+            except OSError:
+                touched = upload_dir.stat().st_mtime
+            if touched < cutoff:
+                shutil.rmtree(upload_dir, ignore_errors=True)